@@ -0,0 +1,283 @@
+"""
+A bounding volume hierarchy over the drawable Components of a scene graph.
+
+The tree is built top-down over the Components' world bounds, splitting at the median of the longest axis.
+When only transformations change, for example the orbiting light cubes of SceneOne, update refits the
+boxes of the moved leaves and their ancestors instead of building the tree again.
+Frustum, ray and sphere queries then only visit the branches they touch.
+"""
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from Component import Component
+from Displayable import Displayable
+from RenderContext import RenderContext, OUTSIDE, INSIDE
+
+
+class BVHNode:
+    """
+    A node spans the Components BVH.components[start:start + count].
+    Leaves have no children, inner nodes always have both.
+    """
+    aabbMin = None
+    aabbMax = None
+    left = None
+    right = None
+    parent = None
+    start = 0
+    count = 0
+
+    def __init__(self, start: int, count: int, parent=None):
+        self.start = start
+        self.count = count
+        self.parent = parent
+
+    def isLeaf(self) -> bool:
+        return self.left is None
+
+    def area(self) -> float:
+        d = self.aabbMax - self.aabbMin
+        return 2.0 * (d[0] * d[1] + d[1] * d[2] + d[2] * d[0])
+
+
+class BVH:
+    root: Optional[BVHNode] = None
+    components: List[Component] = None  # the drawable Components, ordered so that each node spans a range
+    leafOf: List[BVHNode] = None  # the leaf holding components[i]
+    sources = None  # the worldBounds each leaf was last fitted to, indexed like components
+    drawOrder = None  # the position of components[i] in the scene graph traversal
+    sceneRoot: Optional[Component] = None  # the scene graph the tree was last collected from
+    structureVersion = -1  # Component.structureVersion when the tree was last collected
+
+    # a leaf holds at most this many Components
+    leafSize = 4
+    # rebuild when refitting has made the tree this much worse than when it was built, in total node area
+    rebuildRatio = 2.0
+
+    buildArea = 0.0
+    totalArea = 0.0
+    builds = 0
+    refits = 0
+
+    def __init__(self):
+        self.components = []
+        self.leafOf = []
+        self.sources = []
+        self.drawOrder = []
+
+    @staticmethod
+    def collect(root: Component) -> List[Component]:
+        """
+        All the Components under root, root included, which have a Displayable to draw. In drawing order.
+        """
+        result = []
+        stack = [root]
+        while stack:
+            c = stack.pop()
+            if isinstance(c.displayObj, Displayable) and c.worldBounds is not None:
+                result.append(c)
+            stack.extend(reversed(c.children))
+        return result
+
+    def update(self, root: Component):
+        """
+        Bring the tree up to date with the scene graph, root.update must have been called first.
+        The scene graph is only walked again when Component.structureVersion moved, and the tree is rebuilt
+        when the set of drawable Components changed, or when refitting degraded it too much.
+        Otherwise only the moved Components are refitted.
+        """
+        if root is not self.sceneRoot or Component.structureVersion != self.structureVersion:
+            self.sceneRoot = root
+            self.structureVersion = Component.structureVersion
+            drawables = self.collect(root)
+            if len(drawables) != len(self.components) or set(map(id, drawables)) != set(map(id, self.components)):
+                self.build(drawables)
+                return
+        self.refit()
+        if self.totalArea > self.rebuildRatio * self.buildArea:
+            # build takes the Components in drawing order
+            drawables = [None] * len(self.components)
+            for c, position in zip(self.components, self.drawOrder):
+                drawables[position] = c
+            self.build(drawables)
+
+    def build(self, components: List[Component]):
+        self.components = list(components)
+        self.leafOf = [None] * len(self.components)
+        self.sources = [c.worldBounds for c in self.components]
+        self.builds += 1
+        self.totalArea = 0.0
+        if not self.components:
+            self.root = None
+            self.drawOrder = []
+            self.buildArea = 0.0
+            return
+
+        aabbMin = np.array([c.worldBounds.aabbMin for c in self.components])
+        aabbMax = np.array([c.worldBounds.aabbMax for c in self.components])
+        centroid = (aabbMin + aabbMax) * 0.5
+        order = np.arange(len(self.components))
+
+        self.root = BVHNode(0, len(self.components))
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            span = order[node.start:node.start + node.count]
+            node.aabbMin = aabbMin[span].min(axis=0)
+            node.aabbMax = aabbMax[span].max(axis=0)
+            self.totalArea += node.area()
+            if node.count <= self.leafSize:
+                continue
+
+            # median split along the longest axis of the centroids
+            axis = int(np.argmax(np.ptp(centroid[span], axis=0)))
+            half = node.count // 2
+            order[node.start:node.start + node.count] = span[np.argsort(centroid[span, axis], kind="stable")]
+            node.left = BVHNode(node.start, half, node)
+            node.right = BVHNode(node.start + half, node.count - half, node)
+            stack.append(node.right)
+            stack.append(node.left)
+
+        self.components = [self.components[i] for i in order]
+        self.sources = [self.sources[i] for i in order]
+        self.drawOrder = order.tolist()
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.isLeaf():
+                for i in range(node.start, node.start + node.count):
+                    self.leafOf[i] = node
+            else:
+                stack.extend((node.left, node.right))
+        self.buildArea = self.totalArea
+
+    def refit(self):
+        """
+        Refit the leaves whose Component got new world bounds, then their ancestors
+        until a box doesn't change anymore
+        """
+        moved = {self.leafOf[i] for i, c in enumerate(self.components) if c.worldBounds is not self.sources[i]}
+        if not moved:
+            return
+        self.refits += 1
+
+        for leaf in moved:
+            for i in range(leaf.start, leaf.start + leaf.count):
+                self.sources[i] = self.components[i].worldBounds
+            span = self.sources[leaf.start:leaf.start + leaf.count]
+            self._setBox(leaf, np.min([b.aabbMin for b in span], axis=0), np.max([b.aabbMax for b in span], axis=0))
+
+            node = leaf.parent
+            while node is not None:
+                if not self._setBox(node, np.minimum(node.left.aabbMin, node.right.aabbMin),
+                                    np.maximum(node.left.aabbMax, node.right.aabbMax)):
+                    break
+                node = node.parent
+
+    def _setBox(self, node: BVHNode, aabbMin: np.ndarray, aabbMax: np.ndarray) -> bool:
+        """
+        Store a new box in node, return False if it didn't change
+        """
+        if np.array_equal(aabbMin, node.aabbMin) and np.array_equal(aabbMax, node.aabbMax):
+            return False
+        self.totalArea -= node.area()
+        node.aabbMin = aabbMin
+        node.aabbMax = aabbMax
+        self.totalArea += node.area()
+        return True
+
+    def queryFrustum(self, context: RenderContext) -> List[Component]:
+        """
+        The Components whose world bounds intersect the view frustum of context, in drawing order
+        """
+        result = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            test = context.classifyBox(node.aabbMin, node.aabbMax)
+            if test == OUTSIDE:
+                continue
+            if test == INSIDE:
+                result.extend(range(node.start, node.start + node.count))
+            elif node.isLeaf():
+                result.extend(i for i in range(node.start, node.start + node.count)
+                              if context.classify(self.components[i].worldBounds) != OUTSIDE)
+            else:
+                stack.extend((node.right, node.left))
+        return self._inDrawOrder(result)
+
+    def queryRay(self, origin, direction, maxDistance: float = math.inf) -> List[Tuple[float, Component]]:
+        """
+        The Components whose world box is hit by the ray, with the distance along direction where the ray
+        enters the box, nearest first. A ray starting inside a box enters it at 0.
+        """
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / direction
+
+        def slab(aabbMin, aabbMax):
+            with np.errstate(invalid="ignore"):
+                t0 = (aabbMin - origin) * inverse
+                t1 = (aabbMax - origin) * inverse
+            # 0 * inf gives nan when the origin lies on a slab plane of a parallel ray, it doesn't restrict t
+            near = np.nan_to_num(np.minimum(t0, t1), nan=-math.inf).max()
+            far = np.nan_to_num(np.maximum(t0, t1), nan=math.inf).min()
+            near = max(near, 0.0)
+            return near if near <= far and near <= maxDistance else None
+
+        result = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if slab(node.aabbMin, node.aabbMax) is None:
+                continue
+            if node.isLeaf():
+                for i in range(node.start, node.start + node.count):
+                    bounds = self.components[i].worldBounds
+                    t = slab(bounds.aabbMin, bounds.aabbMax)
+                    if t is not None:
+                        result.append((t, self.components[i]))
+            else:
+                stack.extend((node.right, node.left))
+        result.sort(key=lambda item: item[0])
+        return result
+
+    def querySphere(self, center, radius: float) -> List[Component]:
+        """
+        The Components whose world bounds overlap the sphere, in drawing order
+        """
+        center = np.asarray(center, dtype=np.float64)
+
+        def overlaps(aabbMin, aabbMax):
+            d = np.maximum(0.0, np.maximum(aabbMin - center, center - aabbMax))
+            return d @ d <= radius * radius
+
+        result = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if not overlaps(node.aabbMin, node.aabbMax):
+                continue
+            if node.isLeaf():
+                for i in range(node.start, node.start + node.count):
+                    bounds = self.components[i].worldBounds
+                    offset = bounds.center - center
+                    if offset @ offset <= (bounds.radius + radius) ** 2 and overlaps(bounds.aabbMin, bounds.aabbMax):
+                        result.append(i)
+            else:
+                stack.extend((node.right, node.left))
+        return self._inDrawOrder(result)
+
+    def _inDrawOrder(self, indices: List[int]) -> List[Component]:
+        return [self.components[i] for i in sorted(indices, key=self.drawOrder.__getitem__)]
+
+    def stats(self) -> dict:
+        return {
+            "components": len(self.components),
+            "builds": self.builds,
+            "refits": self.refits,
+            "areaRatio": float(self.totalArea / self.buildArea) if self.buildArea > 0 else 1.0,
+        }
@@ -0,0 +1,175 @@
+"""
+Some benchmarks for the CPU side of the rendering pipeline. No OpenGL context is needed to run them.
+
+Usage: python Benchmark.py [mesh] [acmr] [vertex] [normal] [bvh]
+"""
+import sys
+import time
+
+import ColorType as Ct
+from DisplayableSphere import DisplayableSphere
+from DisplayableEllipsoid import DisplayableEllipsoid
+from DisplayableTorus import DisplayableTorus
+from DisplayableCylinder import DisplayableCylinder
+from MeshOptimizer import averageCacheMissRatio, removeDegenerateTriangles, optimizeIndices
+import VertexFormat
+
+
+def timeit(func, repeat=3):
+    """
+    Run func several times and return the best wall time in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchMeshGeneration(resolutions=(32, 128, 512, 1024, 2048)):
+    """
+    Time the mesh generation of the tessellated primitives at growing resolutions.
+    The generate method doesn't touch OpenGL, so we skip __init__ which would allocate the GL buffers.
+    """
+    shapes = [
+        ("sphere", DisplayableSphere, lambda n: (1.0, n, n, Ct.BLUE)),
+        ("ellipsoid", DisplayableEllipsoid, lambda n: (0.5, 0.5, 0.9, n, n, Ct.ORANGE)),
+        ("torus", DisplayableTorus, lambda n: (0.25, 0.5, n, n, Ct.SOFTBLUE)),
+    ]
+    print(f"{'shape':<10}{'resolution':>12}{'vertices':>12}{'triangles':>12}{'time(ms)':>12}")
+    for name, cls, args in shapes:
+        for n in resolutions:
+            obj = cls.__new__(cls)
+            cost = timeit(lambda: obj.generate(*args(n)))
+            print(f"{name:<10}{f'{n}x{n}':>12}{len(obj.vertices):>12}{obj.indices.size // 3:>12}{cost * 1000:>12.1f}")
+
+
+def benchIndexOptimization():
+    """
+    Compare the generated index buffers with the optimized ones: triangle count, ACMR of a FIFO vertex cache
+    for the generated, the degenerate-free and the reordered indices, and the time spent in the optimizer
+    """
+    shapes = [
+        ("sphere", DisplayableSphere, (1.0, 30, 30, Ct.BLUE)),
+        ("sphere", DisplayableSphere, (1.0, 128, 128, Ct.BLUE)),
+        ("ellipsoid", DisplayableEllipsoid, (0.5, 0.5, 0.9, 30, 30, Ct.ORANGE)),
+        ("torus", DisplayableTorus, (0.25, 0.5, 36, 36, Ct.SOFTBLUE)),
+        ("torus", DisplayableTorus, (0.25, 0.5, 128, 128, Ct.SOFTBLUE)),
+        ("cylinder", DisplayableCylinder, (1.0, 1.0, 1.0, 30, Ct.WHITE)),
+    ]
+    print(f"{'shape':<10}{'triangles':>12}{'kept':>8}{'ACMR before':>14}{'no degenerate':>16}{'ACMR after':>12}{'time(ms)':>10}")
+    for name, cls, args in shapes:
+        obj = cls.__new__(cls)
+        obj.generate(*args)
+        kept = removeDegenerateTriangles(obj.vertices, obj.indices)
+        cost = timeit(lambda: optimizeIndices(obj.vertices, obj.indices), repeat=1)
+        optimized = optimizeIndices(obj.vertices, obj.indices)
+        print(f"{name:<10}{obj.indices.size // 3:>12}{kept.size // 3:>8}{averageCacheMissRatio(obj.indices):>14.3f}"
+              f"{averageCacheMissRatio(kept):>16.3f}{averageCacheMissRatio(optimized):>12.3f}{cost * 1000:>10.1f}")
+
+
+def benchVertexFormats(resolution=512):
+    """
+    VBO size and packing time of every vertex format, with the largest position and normal error of the packed ones
+    """
+    obj = DisplayableTorus.__new__(DisplayableTorus)
+    obj.generate(0.25, 0.5, resolution, resolution, Ct.SOFTBLUE)
+    print(f"torus {resolution}x{resolution}, {len(obj.vertices)} vertices")
+    print(f"{'format':<10}{'stride':>8}{'VBO(KB)':>10}{'pack(ms)':>10}{'pos err':>10}{'normal err':>12}")
+    for f in VertexFormat.formats.values():
+        cost = timeit(lambda: f.pack(obj.vertices))
+        packed = f.pack(obj.vertices)
+        positionError = abs(packed["position"][:, 0:3].astype(float) - obj.vertices[:, 0:3]).max()
+        normals = packed["normal"]
+        if normals.dtype == "uint32":
+            normals = VertexFormat.unpackNormals(normals)
+        normalError = abs(normals - obj.vertices[:, 3:6]).max()
+        print(f"{f.name:<10}{f.stride:>8}{packed.nbytes / 1024:>10.0f}{cost * 1000:>10.1f}"
+              f"{positionError:>10.1e}{normalError:>12.1e}")
+
+
+def benchNormalMatrix(resolutions=(128, 512, 1024)):
+    """
+    A CPU proxy of the vertex stage cost of the normal transform on spheres. The old shader inverted the
+    4x4 model matrix for every vertex, now the 3x3 normal matrix is computed once per Component and every vertex
+    only does a 3x3 product. Both are run with numpy over all the vertices of one draw.
+    """
+    import numpy as np
+    from GLUtility import GLUtility
+    u = GLUtility()
+    model = u.rotate(30, [1, 1, 0]) @ u.translate(1, 2, 3) @ u.scale(2, 2, 2)
+
+    print(f"{'sphere':<12}{'vertices':>10}{'per vertex(ms)':>16}{'per node(ms)':>14}{'speedup':>9}")
+    for n in resolutions:
+        obj = DisplayableSphere.__new__(DisplayableSphere)
+        obj.generate(1.0, n, n, Ct.BLUE)
+        normals = np.hstack([obj.vertices[:, 3:6], np.zeros((len(obj.vertices), 1), dtype=np.float32)])
+
+        def perVertex():
+            inverse = np.linalg.inv(np.broadcast_to(model, (len(normals), 4, 4)))
+            return np.einsum("ni,nji->nj", normals, inverse)[:, 0:3]
+
+        def perNode():
+            return obj.vertices[:, 3:6] @ np.linalg.inv(model[:3, :3]).T
+
+        old, new = timeit(perVertex), timeit(perNode)
+        print(f"{f'{n}x{n}':<12}{len(obj.vertices):>10}{old * 1000:>16.1f}{new * 1000:>14.2f}{old / new:>9.0f}")
+
+
+def benchBVH(counts=(1000, 8000)):
+    """
+    Frustum culling of a grid of cubes with a zoomed-in camera, testing every Component against the frustum
+    versus a BVH query. Then the cost of a full build against a refit after 1% of the cubes moved.
+    The cubes only carry bounds, no mesh is generated.
+    """
+    import numpy as np
+    from BoundingVolume import BoundingVolume
+    from BVH import BVH
+    from Component import Component
+    from DisplayableCube import DisplayableCube
+    from GLUtility import GLUtility
+    from Point import Point
+    from RenderContext import RenderContext, OUTSIDE
+
+    u = GLUtility()
+    context = RenderContext()
+    context.beginFrame(u.view([0, 2, 0], [1, 2, 1], [0, 1, 0]), u.perspective(45, 800, 600, 0.01, 100), (800, 600))
+    print(f"{'cubes':>8}{'visible':>9}{'per node(ms)':>14}{'BVH(ms)':>10}{'build(ms)':>11}{'refit(ms)':>11}")
+    for n in counts:
+        side = round(n ** (1 / 3))
+        root = Component(Point((0, 0, 0)))
+        for i in range(side ** 3):
+            cube = DisplayableCube.__new__(DisplayableCube)
+            cube.localBounds = BoundingVolume.fromPoints(np.array([[-0.2, -0.2, -0.2], [0.2, 0.2, 0.2]]))
+            x, y, z = i % side, i // side % side, i // side // side
+            root.addChild(Component(Point((x - side / 2, y - side / 2, z - side / 2)), cube))
+        root.update()
+
+        bvh = BVH()
+        build = timeit(lambda: bvh.build(BVH.collect(root)), repeat=1)
+        components = BVH.collect(root)
+        perNode = timeit(lambda: [c for c in components if context.classify(c.worldBounds) != OUTSIDE])
+        query = timeit(lambda: bvh.queryFrustum(context))
+
+        for c in root.children[::100]:
+            c.setCurrentPosition(Point(np.array(c.currentPos.getCoords()) + 0.1))
+        root.update()
+        refit = timeit(lambda: bvh.update(root), repeat=1)
+        print(f"{side ** 3:>8}{len(bvh.queryFrustum(context)):>9}{perNode * 1000:>14.1f}{query * 1000:>10.1f}"
+              f"{build * 1000:>11.1f}{refit * 1000:>11.1f}")
+
+
+benchmarks = {
+    "mesh": benchMeshGeneration,
+    "acmr": benchIndexOptimization,
+    "vertex": benchVertexFormats,
+    "normal": benchNormalMatrix,
+    "bvh": benchBVH,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(benchmarks.keys())
+    for n in names:
+        print(f"==== {n} ====")
+        benchmarks[n]()
@@ -0,0 +1,84 @@
+"""
+Define an axis aligned bounding box together with a bounding sphere.
+All matrices are stored in column-major order, so points are row vectors multiplied on the left: p @ M.
+"""
+from typing import Optional
+
+import numpy as np
+
+
+class BoundingVolume:
+    """
+    An axis aligned box [aabbMin, aabbMax] and a sphere (center, radius), both enclosing the same points.
+    The sphere is usually tighter for round shapes, the box for flat ones.
+    """
+    aabbMin = None  # numpy.ndarray(3)
+    aabbMax = None  # numpy.ndarray(3)
+    center = None  # numpy.ndarray(3)
+    radius = 0.0
+
+    def __init__(self, aabbMin, aabbMax, center, radius):
+        self.aabbMin = np.asarray(aabbMin, dtype=np.float64)
+        self.aabbMax = np.asarray(aabbMax, dtype=np.float64)
+        self.center = np.asarray(center, dtype=np.float64)
+        self.radius = float(radius)
+
+    @classmethod
+    def fromPoints(cls, points: np.ndarray) -> Optional["BoundingVolume"]:
+        """
+        Bound a (N, 3) array of points, the sphere is centered on the box. Return None if there are no points.
+        """
+        if len(points) == 0:
+            return None
+        points = np.asarray(points, dtype=np.float64)
+        aabbMin = points.min(axis=0)
+        aabbMax = points.max(axis=0)
+        center = (aabbMin + aabbMax) * 0.5
+        radius = np.sqrt(((points - center) ** 2).sum(axis=1).max())
+        return cls(aabbMin, aabbMax, center, radius)
+
+    def transformed(self, mat: np.ndarray) -> "BoundingVolume":
+        """
+        Bound this volume after the transformation mat.
+        The box uses Arvo's method, "Transforming Axis-Aligned Bounding Boxes", Graphics Gems 1990: the new half
+        extent is the old one multiplied by the absolute value of the linear part.
+        The sphere radius is scaled by the largest axis scaling.
+        """
+        linear = mat[:3, :3]
+        translation = mat[3, :3]
+
+        boxCenter = (self.aabbMin + self.aabbMax) * 0.5 @ linear + translation
+        halfExtent = (self.aabbMax - self.aabbMin) * 0.5 @ np.abs(linear)
+        center = self.center @ linear + translation
+        radius = self.radius * np.sqrt((linear ** 2).sum(axis=1).max())
+        return BoundingVolume(boxCenter - halfExtent, boxCenter + halfExtent, center, radius)
+
+    def merged(self, other: Optional["BoundingVolume"]) -> "BoundingVolume":
+        """
+        Bound both volumes. other can be None
+        """
+        if other is None:
+            return self
+
+        offset = other.center - self.center
+        distance = np.sqrt(offset @ offset)
+        if distance + other.radius <= self.radius:
+            center, radius = self.center, self.radius
+        elif distance + self.radius <= other.radius:
+            center, radius = other.center, other.radius
+        else:
+            radius = (distance + self.radius + other.radius) * 0.5
+            center = self.center + offset * ((radius - self.radius) / distance)
+        return BoundingVolume(np.minimum(self.aabbMin, other.aabbMin), np.maximum(self.aabbMax, other.aabbMax),
+                              center, radius)
+
+    @staticmethod
+    def mergeAll(volumes) -> Optional["BoundingVolume"]:
+        """
+        Bound every volume of the iterable, None items are skipped. Return None if nothing is left
+        """
+        result = None
+        for v in volumes:
+            if v is not None:
+                result = v if result is None else result.merged(v)
+        return result
@@ -8,6 +8,7 @@ First version in 11/01/2021
 import copy
 import math
 import os
+from typing import List, Optional
 
 import numpy as np
 from PIL import Image
@@ -18,6 +19,8 @@ from Material import Material
 from Point import Point
 from ColorType import ColorType
 from Displayable import Displayable
+from BoundingVolume import BoundingVolume
+from RenderContext import RenderContext, OUTSIDE, INSIDE
 from Quaternion import Quaternion
 from GLUtility import GLUtility
 from GLBuffer import Texture
@@ -50,9 +53,21 @@ except ImportError:
 
 class Component:
     children = None  # list
+    # bumped, on the class, whenever a Component is added or removed anywhere or starts or stops having
+    # something to draw, so BVH.update knows when the set of drawable Components may have changed
+    structureVersion = 0
 
     # the homogeneous transformation matrix for the current joint
     transformationMat = None
+    # the normal matrix uploaded with transformationMat, only recomputed when transformationMat changes
+    normalMat = None
+
+    # world space BoundingVolume of the Displayable object, and of this Component with all its descendants.
+    # Both are None when there is nothing to draw, they are refreshed by update
+    worldBounds = None
+    subtreeBounds = None
+    worldBoundsSource = None  # the local bounds worldBounds was computed from
+    subtreeDrawables = 0  # number of Displayable objects in this subtree, reported as culled with it
 
     # a instance of class which inherit from Displayable
     # if this class is used as skeleton, then keep this empty
@@ -87,6 +102,13 @@ class Component:
     normalMapOn = False
     material = None
     renderingRouting = None
+    color = None  # ColorType, overrides the Displayable's color when set
+
+    # level of detail drawn in the last frame, see selectLodLevel
+    lodLevel = 0
+    # how far past a level boundary, in levels, the screen size must go before switching
+    lodHysteresis = 0.25
+
 
     glUtility = None
 
@@ -145,14 +167,18 @@ class Component:
         # prevent the duplicate child to be added to the self.children
         if child not in self.children:
             self.children.append(child)
+            Component.structureVersion += 1
 
     def clear(self):
         """
-        remove all children and destroy them
+        remove all children and destroy them, their meshes are given back to the geometry cache
         """
-        for c in self.children:
+        for c in list(self.children):
             c.clear()
+            if isinstance(c.displayObj, Displayable):
+                c.displayObj.release()
             self.children.remove(c)
+            Component.structureVersion += 1
             del c
 
     def initialize(self):
@@ -171,32 +197,151 @@ class Component:
         # use init value to generate transformation matrix for all children
         self.update()
 
-    def draw(self, shaderProg: GLProgram):
+    def draw(self, shaderProg: GLProgram, context: Optional[RenderContext] = None):
+        """
+        Draw this component and all its children
+
+        :param context: the per-frame camera information, used to cull what is out of the view frustum and to pick
+                        the level of detail. Without it, everything is drawn at full resolution
+        """
+        if context is None:
+            if isinstance(self.displayObj, Displayable):
+                self.drawSelf(shaderProg)
+            for c in self.children:
+                c.draw(shaderProg)
+            return
+        for c in self.collectVisible(context):
+            c.drawSelf(shaderProg, context)
+
+    def collectVisible(self, context: RenderContext, visible: Optional[List["Component"]] = None,
+                       insideFrustum: bool = False) -> List["Component"]:
+        """
+        The drawable Components of this subtree which intersect the view frustum, in scene graph order
+
+        :param visible: the list to append to
+        :param insideFrustum: set by the parent when its whole subtree is known to be inside the view frustum
+        """
+        if visible is None:
+            visible = []
+        if not insideFrustum:
+            # test the whole subtree first, a table is culled together with everything on it
+            result = context.classify(self.subtreeBounds)
+            if result == OUTSIDE:
+                context.count("culled", self.subtreeDrawables)
+                return visible
+            insideFrustum = result == INSIDE
+
         if isinstance(self.displayObj, Displayable):
-            shaderProg.setMat4("modelMat", self.transformationMat)
-            shaderProg.setVec4("diffuse", self.material.diffuse)
-            shaderProg.setVec4("specular", self.material.specular)
-            shaderProg.setVec4("ambient", self.material.ambient)
-            shaderProg.setFloat("highlight", self.material.highLight)
-            shaderProg.setFragmentShaderRouting(self.renderingRouting)
-            if self.textureOn:
-                shaderProg.use()
-                self.texture.bind(shaderProg.getUniformLocation("textureImage"))
-            else:
-                shaderProg.use()
-                self.texture.unbind(shaderProg.getUniformLocation("textureImage"))
-            if self.normalMapOn:
-                shaderProg.use()
-                shaderProg.setBool("useNormalMap", True)
-                self.normalMap.bind(shaderProg.getUniformLocation("normalMap"))
+            if insideFrustum or context.classify(self.worldBounds) != OUTSIDE:
+                visible.append(self)
             else:
-                shaderProg.use()
-                shaderProg.setBool("useNormalMap", False)
-                self.normalMap.unbind(shaderProg.getUniformLocation("normalMap"))
-            self.displayObj.draw()
+                context.count("culled")
 
         for c in self.children:
-            c.draw(shaderProg)
+            c.collectVisible(context, visible, insideFrustum)
+        return visible
+
+    def drawSelf(self, shaderProg: GLProgram, context: Optional[RenderContext] = None, sharedUniforms: bool = True):
+        """
+        Set up the uniforms of this component and draw its Displayable object, children are not drawn
+
+        :param sharedUniforms: set the material, routing and textures too. The render queue sets them itself,
+                               only when they change from the previous draw
+        """
+        shaderProg.setMat4("modelMat", self.transformationMat)
+        shaderProg.setMat3("normalMat", self.normalMat)
+        instanceColorOn, color = self.instanceColor()
+        shaderProg.setBool("useInstanceColor", instanceColorOn)
+        if instanceColorOn:
+            shaderProg.setVec3("instanceColor", np.array(tuple(color)))
+        if sharedUniforms:
+            self.setSharedUniforms(shaderProg)
+        level = self.selectLodLevel(context) if context is not None else 0
+        self.displayObj.draw(level)
+        if context is not None:
+            context.count("drawn")
+            context.count("triangles", self.displayObj.lodMesh(level).indices.size // 3)
+
+    def instanceColor(self):
+        """
+        :return: whether the base color replaces the vertex color, and that color
+        """
+        color = self.color if self.color is not None else self.displayObj.color
+        instanceColorOn = color is not None and (self.color is not None or self.displayObj.useInstanceColor)
+        return instanceColorOn, color
+
+    def setSharedUniforms(self, shaderProg: GLProgram):
+        """
+        Set the material, routing and textures. Components with the same batchKey set the same values,
+        so an instanced draw only sets them once
+        """
+        self.setMaterialUniforms(shaderProg)
+        shaderProg.setFragmentShaderRouting(self.renderingRouting)
+        self.bindTextures(shaderProg)
+
+    def setMaterialUniforms(self, shaderProg: GLProgram):
+        shaderProg.setVec4("diffuse", self.material.diffuse)
+        shaderProg.setVec4("specular", self.material.specular)
+        shaderProg.setVec4("ambient", self.material.ambient)
+        shaderProg.setFloat("highlight", self.material.highLight)
+
+    def bindTextures(self, shaderProg: GLProgram):
+        # the sampler uniforms go through the uniform cache of shaderProg like the others
+        if self.textureOn:
+            self.texture.bind(shaderProg, "textureImage")
+        else:
+            self.texture.unbind(shaderProg, "textureImage")
+        if self.normalMapOn:
+            shaderProg.setBool("useNormalMap", True)
+            self.normalMap.bind(shaderProg, "normalMap")
+        else:
+            shaderProg.setBool("useNormalMap", False)
+            self.normalMap.unbind(shaderProg, "normalMap")
+
+    def batchKey(self, level: int = 0):
+        """
+        Components with equal keys draw the same mesh with the same shared uniforms, and can be drawn instanced
+        """
+        return (id(self.displayObj.lodMesh(level)), self.materialKey(), self.renderingRouting, self.textureKey())
+
+    def materialKey(self):
+        m = self.material
+        return tuple(m.ambient), tuple(m.diffuse), tuple(m.specular), m.highLight
+
+    def textureKey(self):
+        """
+        The texture names bound by bindTextures, 0 when a texture is off
+        """
+        return (self.texture.textureName if self.textureOn else 0,
+                self.normalMap.textureName if self.normalMapOn else 0)
+
+    def selectLodLevel(self, context: RenderContext) -> int:
+        """
+        Pick the level of detail from the projected size of the Displayable's bounding sphere.
+        Level k > 0 is used below lodScreenSize / 2 ** (k - 1) pixels. The current level is kept until the size
+        goes lodHysteresis levels past its boundaries, so the mesh doesn't flicker between two levels.
+        """
+        lodCount = self.displayObj.lodCount()
+        if lodCount == 1 or self.worldBounds is None:
+            self.lodLevel = 0
+            return 0
+
+        pixels = context.screenSize(self.worldBounds.center, self.worldBounds.radius)
+        # the continuous level, level k spans [k, k + 1)
+        if pixels <= 0:
+            x = math.inf
+        elif math.isinf(pixels):
+            x = -math.inf
+        else:
+            x = math.log2(self.displayObj.lodScreenSize / pixels) + 1
+
+        level = min(self.lodLevel, lodCount - 1)
+        low = -math.inf if level == 0 else level - self.lodHysteresis
+        high = math.inf if level == lodCount - 1 else level + 1 + self.lodHysteresis
+        if not low <= x < high:
+            level = int(min(max(x, 0), lodCount - 1))
+        self.lodLevel = level
+        return level
 
     def update(self, parentTransformationMat=None):
         """
@@ -217,12 +362,36 @@ class Component:
 
         # remember that all above matrix are store in column-major, which is the transpose of row-major
         # be careful about the applying order
-        self.transformationMat = scalingMat @ self.preRotationMat @ rotationMatW @ rotationMatV @ rotationMatU @ \
-                                 self.postRotationMat @ translationMat @ parentTransformationMat
+        transformationMat = scalingMat @ self.preRotationMat @ rotationMatW @ rotationMatV @ rotationMatU @ \
+                            self.postRotationMat @ translationMat @ parentTransformationMat
+        changed = self.normalMat is None or not np.array_equal(transformationMat, self.transformationMat)
+        if changed:
+            # transpose(inverse(M)) of the upper 3x3 in the shader is inverse(M)^T, and M is stored transposed,
+            # so the array to upload is inverse of the stored upper 3x3, transposed
+            try:
+                self.normalMat = np.linalg.inv(transformationMat[:3, :3]).T
+            except np.linalg.LinAlgError:
+                # a zero scaling collapses the component, it draws nothing and any normal matrix will do,
+                # keep the previous one if there is one
+                if self.normalMat is None:
+                    self.normalMat = np.linalg.pinv(transformationMat[:3, :3]).T
+        self.transformationMat = transformationMat
+
+        localBounds = self.displayObj.localBounds if isinstance(self.displayObj, Displayable) else None
+        if changed or localBounds is not self.worldBoundsSource:
+            worldBounds = localBounds.transformed(transformationMat) if localBounds is not None else None
+            if (worldBounds is None) != (self.worldBounds is None):
+                Component.structureVersion += 1
+            self.worldBounds = worldBounds
+            self.worldBoundsSource = localBounds
 
         for c in self.children:
             c.update(self.transformationMat)
 
+        self.subtreeBounds = BoundingVolume.mergeAll([self.worldBounds] + [c.subtreeBounds for c in self.children])
+        self.subtreeDrawables = int(isinstance(self.displayObj, Displayable)) + \
+                                sum(c.subtreeDrawables for c in self.children)
+
     def rotate(self, angle, axis):
         """
         rotate along axis. axis should be one of this object's uAxis, vAxis, wAxis
@@ -338,6 +507,15 @@ class Component:
     def setRenderingRouting(self, v):
         self.renderingRouting = v
 
+    def setColor(self, color: Optional[ColorType]):
+        """
+        Set the base color of this Component, it is uploaded as a uniform so the geometry never changes.
+        Set it to None to go back to the Displayable's color.
+        """
+        if not (isinstance(color, ColorType) or color is None):
+            raise TypeError("color must be ColorType or None")
+        self.color = color
+
     def setCurrentAngle(self, angle, axis):
         if axis not in self.axisBucket:
             raise TypeError("unknown axis for rotation")
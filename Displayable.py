@@ -5,17 +5,154 @@ First version in 09/26/2018
 :author: micou(Zezhou Sun)
 :version: 2021.1.1
 """
+from ColorType import ColorType, WHITE
+from GeometryCache import geometryCache
+import VertexFormat
 
 
 class Displayable:
     """
     Interface for displayable object
     """
+    # The GPU mesh, possibly shared with other Displayable objects through GeometryCache
+    mesh = None
+
+    # Names of the read-only attributes set by generate. They are restored from the cache when
+    # the generation is skipped
+    parameterNames = ()
+
+    # When this is on, the color is not part of the shared mesh. The vertex buffer stores WHITE and
+    # the Component uploads the color as a uniform, so meshes which only differ in color share one buffer.
+    # Turn it off to bake the color into the vertex buffer instead.
+    useInstanceColor = True
+    color = None
+
+    # How the vertices are stored on the GPU, see VertexFormat. Set it to VertexFormat.PACKED on a Displayable
+    # class, or on an instance before generateShared, to upload 20 bytes per vertex instead of 44
+    vertexFormat = VertexFormat.STANDARD
+
+    # Progressively coarser meshes, lodMeshes[k - 1] is level k. Level 0 is self.mesh
+    lodMeshes = None
+    # Diameter in pixels under which the coarser levels start to be used, every level halves it
+    lodScreenSize = 256
+    # Number of coarser levels built by the tessellated Displayable objects when the constructor isn't told
+    defaultLodLevels = 2
+
+    # BoundingVolume of the vertices in local coordinates, computed once per generated mesh.
+    # None if the mesh is empty
+    localBounds = None
+
     def __init__(self):
-        pass
+        self.lodMeshes = []
 
-    def draw(self):
-        raise NotImplementedError
+    def draw(self, level: int = 0):
+        self.lodMesh(level).draw()
+
+    def lodMesh(self, level: int = 0):
+        """
+        The mesh of the LOD level, levels past the end of the chain get the coarsest one
+        """
+        if self.mesh is None:
+            raise NotImplementedError
+        if level <= 0 or not self.lodMeshes:
+            return self.mesh
+        return self.lodMeshes[min(level, len(self.lodMeshes)) - 1]
+
+    def lodCount(self) -> int:
+        return 1 + len(self.lodMeshes)
 
     def initialize(self):
+        """
+        Remember to bind VAO before this initialization. If VAO is not bind, program might throw an error
+        in systems that don't enable a default VAO after GLProgram compilation
+        """
+        if self.mesh is None:
+            raise NotImplementedError
+        if self.mesh.vertices is not self.vertices or self.mesh.indices is not self.indices:
+            # generate has been called by hand since the mesh was acquired, stop sharing the old one.
+            # The LOD chain doesn't match the new mesh anymore, so it is dropped as well
+            vertices, indices = self.vertices, self.indices
+            self.release()
+            self.mesh = geometryCache.acquire(self.shaderProg, None, lambda: (vertices, indices, {}),
+                                              self.vertexFormat)
+            self.localBounds = self.mesh.bounds
+        self.mesh.initialize()
+        for m in self.lodMeshes:
+            m.initialize()
+
+    def lodParameters(self, level: int) -> tuple:
+        """
+        The generate parameters of the LOD level, level 0 being the current mesh.
+        Tessellated Displayable objects override this to divide their resolution by 2 ** level
+        """
         raise NotImplementedError
+
+    def _shareKey(self, params):
+        """
+        Strip the color from params if useInstanceColor is on, and build the cache key.
+        Return the parameters to generate with, the key and the stripped color
+        """
+        color = None
+        if self.useInstanceColor:
+            # the color parameter is kept by this instance only, the shared mesh is generated in WHITE
+            color = next((p for p in params if isinstance(p, ColorType)), None)
+            params = tuple(WHITE if isinstance(p, ColorType) else p for p in params)
+        key = (type(self).__name__, *(tuple(p) if isinstance(p, ColorType) else p for p in params))
+        return params, key, color
+
+    def generateShared(self, *params):
+        """
+        Same as self.generate(*params), but the result is shared with every Displayable of the same type
+        which was generated with the same parameters for the same shader program.
+        The generation is skipped when the mesh is already in the cache.
+        """
+        params, key, color = self._shareKey(params)
+
+        def build():
+            self.generate(*params)
+            return self.vertices, self.indices, {n: getattr(self, n) for n in self.parameterNames}
+
+        self.mesh = geometryCache.acquire(self.shaderProg, key, build, self.vertexFormat)
+        for name, value in self.mesh.parameters.items():
+            setattr(self, name, value)
+        self.vertices = self.mesh.vertices
+        self.indices = self.mesh.indices
+        if self.useInstanceColor:
+            self.color = color
+        self.localBounds = self.mesh.bounds
+
+    def buildLodChain(self, levels: int):
+        """
+        Acquire up to levels coarser meshes through the geometry cache. The chain stops early when
+        lowering the resolution doesn't change the parameters anymore.
+        """
+        for m in self.lodMeshes:
+            geometryCache.release(m)
+        self.lodMeshes = []
+
+        last = self.lodParameters(0)
+        for level in range(1, levels + 1):
+            params = self.lodParameters(level)
+            if params == last:
+                break
+            last = params
+            params, key, _ = self._shareKey(params)
+
+            def build(params=params):
+                # generate on a scratch instance, this one keeps the full resolution mesh
+                scratch = type(self).__new__(type(self))
+                scratch.generate(*params)
+                return scratch.vertices, scratch.indices, {n: getattr(scratch, n) for n in self.parameterNames}
+
+            self.lodMeshes.append(geometryCache.acquire(self.shaderProg, key, build, self.vertexFormat))
+
+    def release(self):
+        """
+        Give the meshes back to the cache, their GPU buffers are deleted once they are not used anymore
+        """
+        if self.mesh is not None:
+            geometryCache.release(self.mesh)
+            self.mesh = None
+        for m in self.lodMeshes:
+            geometryCache.release(m)
+        self.lodMeshes = []
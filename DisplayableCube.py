@@ -7,8 +7,7 @@ First version in 10/20/2021
 """
 
 from Displayable import Displayable
-from GLBuffer import VAO, VBO, EBO
-import numpy as np
+from ParametricMesh import ParametricGrid, generateSurface, mergeMeshes
 import ColorType as Ct
 
 try:
@@ -38,14 +37,14 @@ except ImportError:
 
 
 class DisplayableCube(Displayable):
-    vao = None
-    vbo = None
-    ebo = None
     shaderProg = None
 
     vertices = None  # array to store vertices information
     indices = None  # stores triangle indices to vertices
 
+    # generation parameters, see Displayable.generateShared
+    parameterNames = ("length", "width", "height", "color")
+
     # stores current cube's information, read-only
     length = None
     width = None
@@ -64,12 +63,8 @@ class DisplayableCube(Displayable):
         self.shaderProg = shaderProg
         self.shaderProg.use()
 
-        self.vao = VAO()
-        self.vbo = VBO()  # vbo can only be initiated with glProgram activated
-        self.ebo = EBO()
-
-        self.generate(length, width, height, color,
-                      texture_stretch, texture_x_unit, texture_y_unit)
+        self.generateShared(length, width, height, color,
+                            texture_stretch, texture_x_unit, texture_y_unit)
 
     def generate(self,
                  length: float = 1,
@@ -91,112 +86,37 @@ class DisplayableCube(Displayable):
         hl, hw, hh = length / 2, width / 2, height / 2
         l, w, h = length, width, height
 
-        # Define the order of the vertices of the 6 edges
-        # as well as the order of the triangles.
-
-        # It must be ensured that the order satisfies the same law
+        # Every face is a flat patch: position = origin + s * uEdge + t * vEdge.
+        # It must be ensured that all faces satisfy the same law
         # so that the texture direction is the same for each face after the texture is added.
-        self.vertices = np.array([
-            # back face
-            hl, -hw, -hh, 0, 0, -1, *color, 0, 0,
-            -hl, -hw, -hh, 0, 0, -1, *color, 1, 0,
-            -hl, hw, -hh, 0, 0, -1, *color, 1, 1,
-            hl, hw, -hh, 0, 0, -1, *color, 0, 1,
-            # front face
-            -hl, -hw, hh, 0, 0, 1, *color, 0, 0,
-            hl, -hw, hh, 0, 0, 1, *color, 1, 0,
-            hl, hw, hh, 0, 0, 1, *color, 1, 1,
-            -hl, hw, hh, 0, 0, 1, *color, 0, 1,
-            # left face
-            -hl, -hw, -hh, -1, 0, 0, *color, 0, 0,
-            -hl, -hw, hh, -1, 0, 0, *color, 1, 0,
-            -hl, hw, hh, -1, 0, 0, *color, 1, 1,
-            -hl, hw, -hh, -1, 0, 0, *color, 0, 1,
-            # right face
-            hl, -hw, hh, 1, 0, 0, *color, 0, 0,
-            hl, -hw, -hh, 1, 0, 0, *color, 1, 0,
-            hl, hw, -hh, 1, 0, 0, *color, 1, 1,
-            hl, hw, hh, 1, 0, 0, *color, 0, 1,
-            # top face
-            -hl, hw, hh, 0, 1, 0, *color, 0, 0,
-            hl, hw, hh, 0, 1, 0, *color, 1, 0,
-            hl, hw, -hh, 0, 1, 0, *color, 1, 1,
-            -hl, hw, -hh, 0, 1, 0, *color, 0, 1,
-            # bot face
-            -hl, -hw, -hh, 0, -1, 0, *color, 0, 0,
-            hl, -hw, -hh, 0, -1, 0, *color, 1, 0,
-            hl, -hw, hh, 0, -1, 0, *color, 1, 1,
-            -hl, -hw, hh, 0, -1, 0, *color, 0, 1,
-        ]).reshape((-1, 11))
-
-        if not texture_stretch:
-            self.vertices[0, 9:11] = [0, 0]
-            self.vertices[1, 9:11] = [l / texture_y_unit, 0]
-            self.vertices[2, 9:11] = [l / texture_y_unit, w / texture_x_unit]
-            self.vertices[3, 9:11] = [0, w / texture_x_unit]
-
-            self.vertices[4, 9:11] = [0, 0]
-            self.vertices[5, 9:11] = [l / texture_y_unit, 0]
-            self.vertices[6, 9:11] = [l / texture_y_unit, w / texture_x_unit]
-            self.vertices[7, 9:11] = [0, w / texture_x_unit]
-
-            self.vertices[8, 9:11] = [0, 0]
-            self.vertices[9, 9:11] = [h / texture_y_unit, 0]
-            self.vertices[10, 9:11] = [h / texture_y_unit, w / texture_x_unit]
-            self.vertices[11, 9:11] = [0, w / texture_x_unit]
-
-            self.vertices[12, 9:11] = [0, 0]
-            self.vertices[13, 9:11] = [h / texture_y_unit, 0]
-            self.vertices[14, 9:11] = [h / texture_y_unit, w / texture_x_unit]
-            self.vertices[15, 9:11] = [0, w / texture_x_unit]
-
-            self.vertices[16, 9:11] = [0, 0]
-            self.vertices[17, 9:11] = [l / texture_y_unit, 0]
-            self.vertices[18, 9:11] = [l / texture_y_unit, h / texture_x_unit]
-            self.vertices[19, 9:11] = [0, h / texture_x_unit]
-
-            self.vertices[20, 9:11] = [0, 0]
-            self.vertices[21, 9:11] = [l / texture_y_unit, 0]
-            self.vertices[22, 9:11] = [l / texture_y_unit, h / texture_x_unit]
-            self.vertices[23, 9:11] = [0, h / texture_x_unit]
-
-        indices_def = np.array([
+        # Each entry stores origin, uEdge, vEdge, normal and the texture repeat along u and v
+        # when the texture is not stretched.
+        faces = [
             # back face
-            0, 1, 2, 0, 2, 3,
+            ((hl, -hw, -hh), (-l, 0, 0), (0, w, 0), (0, 0, -1), (l, w)),
             # front face
-            4, 5, 6, 4, 6, 7,
+            ((-hl, -hw, hh), (l, 0, 0), (0, w, 0), (0, 0, 1), (l, w)),
             # left face
-            8, 9, 10, 8, 10, 11,
+            ((-hl, -hw, -hh), (0, 0, h), (0, w, 0), (-1, 0, 0), (h, w)),
             # right face
-            12, 13, 14, 12, 14, 15,
+            ((hl, -hw, hh), (0, 0, -h), (0, w, 0), (1, 0, 0), (h, w)),
             # top face
-            16, 17, 18, 16, 18, 19,
+            ((-hl, hw, hh), (l, 0, 0), (0, 0, -h), (0, 1, 0), (l, h)),
             # bot face
-            20, 21, 22, 20, 22, 23,
-        ])
-
-        self.indices = np.array(indices_def)
-
-    def draw(self):
-        self.vao.bind()
-        self.ebo.draw()
-        self.vao.unbind()
-
-    def initialize(self):
-        """
-        Remember to bind VAO before this initialization. If VAO is not bind, program might throw an error
-        in systems that don't enable a default VAO after GLProgram compilation
-        """
-        self.vao.bind()
-        self.vbo.setBuffer(self.vertices, 11)
-        self.ebo.setBuffer(self.indices)
-
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexPos"),
-                                  stride=11, offset=0, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexNormal"),
-                                  stride=11, offset=3, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexColor"),
-                                  stride=11, offset=6, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexTexture"),
-                                  stride=11, offset=9, attribSize=2)
-        self.vao.unbind()
+            ((-hl, -hw, -hh), (l, 0, 0), (0, 0, h), (0, -1, 0), (l, h)),
+        ]
+
+        def face(origin, uEdge, vEdge, normal, repeat):
+            if texture_stretch:
+                su, sv = 1, 1
+            else:
+                su, sv = repeat[0] / texture_y_unit, repeat[1] / texture_x_unit
+
+            def surface(grid: ParametricGrid):
+                return (tuple(origin[k] + grid.s * uEdge[k] + grid.t * vEdge[k] for k in range(3)),
+                        normal,
+                        (grid.s * su, grid.t * sv))
+            return surface
+
+        self.vertices, self.indices = mergeMeshes([
+            generateSurface(face(*f), 1, 1, color, wrapU=False, wrapV=False) for f in faces])
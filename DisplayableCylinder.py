@@ -4,7 +4,7 @@ Define displayable Cylinder here.
 from typing import Optional
 
 from Displayable import Displayable
-from GLBuffer import VAO, VBO, EBO
+from ParametricMesh import ParametricGrid, generateSurface, mergeMeshes
 import numpy as np
 import ColorType as Ct
 import math
@@ -36,14 +36,14 @@ except ImportError:
 
 
 class DisplayableCylinder(Displayable):
-    vao = None
-    vbo = None
-    ebo = None
     shaderProg = None
 
     vertices = None  # array to store vertices information
     indices = None  # stores triangle indices to vertices
 
+    # generation parameters, see Displayable.generateShared
+    parameterNames = ("radius_lower", "radius_upper", "height", "nsides", "color")
+
     color = None
     nsides = None
     radius_upper = None
@@ -55,21 +55,23 @@ class DisplayableCylinder(Displayable):
                  radius_upper=1.0,
                  height=1.0,
                  nsides=3,
-                 color=Ct.WHITE):
+                 color=Ct.WHITE,
+                 lodLevels: Optional[int] = None):
         super(DisplayableCylinder, self).__init__()
 
         self.shaderProg = shaderProg
         self.shaderProg.use()
 
-        self.vao = VAO()
-        self.vbo = VBO()  # vbo can only be initiated with glProgram activated
-        self.ebo = EBO()
+        self.generateShared(radius_lower,
+                            radius_upper,
+                            height,
+                            nsides,
+                            color)
+        self.buildLodChain(self.defaultLodLevels if lodLevels is None else lodLevels)
 
-        self.generate(radius_lower,
-                      radius_upper,
-                      height,
-                      nsides,
-                      color)
+    def lodParameters(self, level: int) -> tuple:
+        # the caps and the height are kept, only the number of sides goes down
+        return (self.radius_lower, self.radius_upper, self.height, max(3, self.nsides >> level), self.color)
 
     def generate(self,
                  radius_lower: float,  # The lower radius of the cylinder
@@ -102,101 +104,33 @@ class DisplayableCylinder(Displayable):
 
         # Half the height of the cylinder
         hh = height / 2.0
-
-        # The number of vertices along each edge of the cylinder,
-        # there should be one more vertex than the original numbers.
-        nsides_1 = nsides + 1
-
-        # Each group of vertices (for a single side of the cylinder)
-        # will contain four vertices: one for each end of the side and
-        # two for the curved surface of the side
-        grp_size = 4
-
-        # The first two vertices are used to store the
-        # centers of the upper and lower circles.
-        self.vertices = np.zeros((nsides_1 * grp_size + 2, 11), dtype=np.float32)
-
-        # lower circle center and upper circle center
-        self.vertices[0] = [0, 0, -hh, 0, 0, -1, *color, 0.5, 0.5]
-        self.vertices[1] = [0, 0, hh, 0, 0, 1, *color, 0.5, 0.5]
-
-        # The universal offset for the later vertices other than above two
-        # centers
-        vOffset = 2
-
-        self.indices = np.zeros((nsides_1, 12), dtype=np.uint32)
-
         pi = np.pi
 
         # The sine and cosine of the angle between the lower and upper radii of the cylinder
         # (used to calculate the normal vectors for the side surfaces)
         cone_sin = (radius_lower - radius_upper) / height
         cone_cos = np.sqrt(1 - cone_sin * cone_sin)
-        for i, theta in enumerate(np.linspace(-pi, pi, nsides_1)):
-            cos_val = np.cos(theta)
-            sin_val = np.sin(theta)
-
-            # Calculate the coordinates of the points on the lower circle of the cylinder
-            x_lower = radius_lower * cos_val
-            y_lower = radius_lower * sin_val
-            z_lower = -hh
-
-            # Assign the coordinates of the point on the lower circle,
-            # the normal vector for the lower surface, and the texture coordinates
-            # to the appropriate vertex in the vertex group
-            self.vertices[vOffset + grp_size * i] = [
-                x_lower, y_lower, z_lower, 0, 0, -1, *color,
-                cos_val * 0.5 + 0.5, sin_val * 0.5 + 0.5]
-
-            ip1 = (i + 1) % nsides_1
-            self.indices[i, 0:3] = [0, vOffset + grp_size * i, vOffset + grp_size * ip1]
-
-            # Calculate the coordinates of the points on the upper circle of the cylinder
-            x_upper = radius_upper * cos_val
-            y_upper = radius_upper * sin_val
-            z_upper = hh
-
-            # UPDATE: side surface, we have to redefine the vertices above since they have different normals
-            # Assign the coordinates of the points on the upper and lower circles,
-            # the normal vector for the side surface, and the texture coordinates
-            # to the appropriate vertices in the vertex group
-            self.vertices[vOffset + grp_size * i + 1] = [
-                x_lower, y_lower, z_lower,
-                cos_val * cone_cos, sin_val * cone_cos, cone_sin, *color,
-                i / nsides, 0]
-            self.vertices[vOffset + grp_size * i + 2] = [
-                x_upper, y_upper, z_upper,
-                cos_val * cone_cos, sin_val * cone_cos, cone_sin, *color,
-                i / nsides, 1]
-            self.indices[i, 3:9] = [
-                vOffset + grp_size * i + 1, vOffset + grp_size * i + 2, vOffset + grp_size * ip1 + 2,
-                vOffset + grp_size * i + 1, vOffset + grp_size * ip1 + 2, vOffset + grp_size * ip1 + 1]
-
-            # Assign the indices of the vertices that make up the
-            # triangles on the upper surface of the cylinder
-            self.vertices[vOffset + grp_size * i + 3] = [
-                x_upper, y_upper, z_upper, 0, 0, 1, *color,
-                cos_val * 0.5 + 0.5, sin_val * 0.5 + 0.5]
-            self.indices[i, 9:12] = [1, vOffset + grp_size * i + 3, vOffset + grp_size * ip1 + 3]
-
-        self.indices = self.indices.flatten("C")
-
-    def draw(self):
-        self.vao.bind()
-        self.ebo.draw()
-        self.vao.unbind()
-
-    def initialize(self):
-        self.vao.bind()
-        self.vbo.setBuffer(self.vertices, 11)
-        self.ebo.setBuffer(self.indices)
-
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexPos"),
-                                  stride=11, offset=0, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexNormal"),
-                                  stride=11, offset=3, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexColor"),
-                                  stride=11, offset=6, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexTexture"),
-                                  stride=11, offset=9, attribSize=2)
-        self.vao.unbind()
+
+        # The cylinder is built from three patches, all of them use theta along the columns.
+        # The side surface goes from the lower circle (s = 0) to the upper circle (s = 1),
+        # the caps go from their center (s = 0) to the rim (s = 1).
+        # The caps need their own rim vertices since they have different normals from the side.
+        def side(grid: ParametricGrid):
+            r = radius_lower + grid.s * (radius_upper - radius_lower)
+            return ((r * grid.cosV, r * grid.sinV, grid.s * height - hh),
+                    (grid.cosV * cone_cos, grid.sinV * cone_cos, cone_sin),
+                    (grid.t, grid.s))
+
+        def cap(radius, z, nz):
+            def surface(grid: ParametricGrid):
+                return ((grid.s * radius * grid.cosV, grid.s * radius * grid.sinV, z),
+                        (0, 0, nz),
+                        (grid.s * grid.cosV * 0.5 + 0.5, grid.s * grid.sinV * 0.5 + 0.5))
+            return surface
+
+        # The lower cap walks theta backwards, so both caps wind counter-clockwise around their normals
+        self.vertices, self.indices = mergeMeshes([
+            generateSurface(cap(radius_lower, -hh, -1), 1, nsides, color, vRange=(pi, -pi), wrapU=False),
+            generateSurface(side, 1, nsides, color, wrapU=False),
+            generateSurface(cap(radius_upper, hh, 1), 1, nsides, color, wrapU=False),
+        ])
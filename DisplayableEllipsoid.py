@@ -3,7 +3,7 @@ Define displayable Ellipsoid here.
 """
 
 from Displayable import Displayable
-from GLBuffer import VAO, VBO, EBO
+from ParametricMesh import ParametricGrid, generateSurface
 import numpy as np
 import ColorType
 import math
@@ -35,14 +35,14 @@ except ImportError:
 
 
 class DisplayableEllipsoid(Displayable):
-    vao = None
-    vbo = None
-    ebo = None
     shaderProg = None
 
     vertices = None  # array to store vertices information
     indices = None  # stores triangle indices to vertices
 
+    # generation parameters, see Displayable.generateShared
+    parameterNames = ("radius_x", "radius_y", "radius_z", "slices", "stacks", "color")
+
     radius_x = None
     radius_y = None
     radius_z = None
@@ -56,16 +56,18 @@ class DisplayableEllipsoid(Displayable):
                  radius_z=1,
                  slices=30,
                  stacks=30,
-                 color=ColorType.ORANGE):
+                 color=ColorType.ORANGE,
+                 lodLevels=None):
         super(DisplayableEllipsoid, self).__init__()
         self.shaderProg = shaderProg
         self.shaderProg.use()
 
-        self.vao = VAO()
-        self.vbo = VBO()  # vbo can only be initiated with glProgram activated
-        self.ebo = EBO()
+        self.generateShared(radius_x, radius_y, radius_z, slices, stacks, color)
+        self.buildLodChain(self.defaultLodLevels if lodLevels is None else lodLevels)
 
-        self.generate(radius_x, radius_y, radius_z, slices, stacks, color)
+    def lodParameters(self, level: int) -> tuple:
+        return (self.radius_x, self.radius_y, self.radius_z,
+                max(3, self.slices >> level), max(3, self.stacks >> level), self.color)
 
     def generate(self,
                  radius_x, radius_y, radius_z, slices, stacks,
@@ -95,59 +97,16 @@ class DisplayableEllipsoid(Displayable):
         self.color = color
 
         pi = np.pi
-        # slices_1 and stacks_1 need 1 more to ensure generate
-        # correct index sequences using np.linspace
-        slices_1 = slices + 1
-        stacks_1 = stacks + 1
-
-        self.vertices = np.zeros((slices_1 * stacks_1, 11))
-        self.indices = np.zeros((slices_1 * stacks_1, 6), dtype=np.uint32)
-
-        # Loop through the ellipsoid's slices and stacks to generate vertices and indices
-        for i, phi in enumerate(np.linspace(-pi / 2, pi / 2, slices_1)):
-            for j, theta in enumerate(np.linspace(-pi, pi, stacks_1)):
-                # Compute the ellipsoid's coordinates and normal vector
-                vx = np.cos(phi) * np.cos(theta)
-                vy = np.cos(phi) * np.sin(theta)
-                vz = np.sin(phi)
-                x = radius_x * vx
-                y = radius_y * vy
-                z = radius_z * vz
-                nx = vx / radius_x
-                ny = vy / radius_y
-                nz = vz / radius_z
-
-                # Pre-compute the ellipsoid's texture indices for later
-                i_by_j = i * stacks_1 + j
-                ip1_by_j = (i + 1) % slices_1 * stacks_1 + j
-                i_by_jp1 = i * stacks_1 + (j + 1) % stacks_1
-                ip1_by_jp1 = (i + 1) % slices_1 * stacks_1 + (j + 1) % stacks_1
-
-                # Store the vertex and index information for this slice and stack
-                self.vertices[i_by_j] = [x, y, z, nx, ny, nz, *color, j / stacks, i / slices]
-                self.indices[i_by_j] = [
-                    i_by_j, ip1_by_j, i_by_jp1,
-                    ip1_by_jp1, ip1_by_j, i_by_jp1]
-
-        # Flatten the index array to make it compatible with GLSL EBO definition.
-        self.indices = self.indices.flatten("C")
-
-    def draw(self):
-        self.vao.bind()
-        self.ebo.draw()
-        self.vao.unbind()
-
-    def initialize(self):
-        self.vao.bind()
-        self.vbo.setBuffer(self.vertices, 11)
-        self.ebo.setBuffer(self.indices)
-
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexPos"),
-                                  stride=11, offset=0, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexNormal"),
-                                  stride=11, offset=3, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexColor"),
-                                  stride=11, offset=6, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexTexture"),
-                                  stride=11, offset=9, attribSize=2)
-        self.vao.unbind()
+        # Evaluate the ellipsoid over the whole (phi, theta) grid,
+        # phi on the rows and theta on the columns
+        def surface(grid: ParametricGrid):
+            # Compute the ellipsoid's coordinates and normal vector
+            vx = grid.cosU * grid.cosV
+            vy = grid.cosU * grid.sinV
+            vz = grid.sinU
+            return ((radius_x * vx, radius_y * vy, radius_z * vz),
+                    (vx / radius_x, vy / radius_y, vz / radius_z),
+                    (grid.t, grid.s))
+
+        self.vertices, self.indices = generateSurface(surface, slices, stacks, color,
+                                                      uRange=(-pi / 2, pi / 2), vRange=(-pi, pi))
@@ -8,8 +8,7 @@ First version in 10/20/2021
 from typing import Optional
 
 from Displayable import Displayable
-from GLBuffer import VAO, VBO, EBO
-import numpy as np
+from ParametricMesh import ParametricGrid, generateSurface
 import ColorType as Ct
 import math
 
@@ -40,14 +39,14 @@ except ImportError:
 
 
 class DisplayableSphere(Displayable):
-    vao = None
-    vbo = None
-    ebo = None
     shaderProg = None
 
     vertices = None  # array to store vertices information
     indices = None  # stores triangle indices to vertices
 
+    # generation parameters, see Displayable.generateShared
+    parameterNames = ("radius", "slices", "stacks", "color")
+
     # stores current cube's information, read-only
     radius = None
     slices = None
@@ -58,16 +57,17 @@ class DisplayableSphere(Displayable):
                  radius=1,
                  slices=30,
                  stacks=30,
-                 color=Ct.BLUE):
+                 color=Ct.BLUE,
+                 lodLevels: Optional[int] = None):
         super(DisplayableSphere, self).__init__()
         self.shaderProg = shaderProg
         self.shaderProg.use()
 
-        self.vao = VAO()
-        self.vbo = VBO()  # vbo can only be initiated with glProgram activated
-        self.ebo = EBO()
+        self.generateShared(radius, slices, stacks, color)
+        self.buildLodChain(self.defaultLodLevels if lodLevels is None else lodLevels)
 
-        self.generate(radius, slices, stacks, color)
+    def lodParameters(self, level: int) -> tuple:
+        return (self.radius, max(3, self.slices >> level), max(3, self.stacks >> level), self.color)
 
     def generate(self,
                  radius: float,
@@ -87,60 +87,13 @@ class DisplayableSphere(Displayable):
         self.color = color
         pi = math.pi
 
-        # Calculate the number of vertices and indices based on the number of slices and stacks
-        slices_1 = slices + 1
-        stacks_1 = stacks + 1
-        self.vertices = np.zeros((slices_1 * stacks_1, 11))
-        self.indices = np.zeros((slices_1 * stacks_1, 6), dtype=np.uint32)
-
-        # Loop over the slices and stacks, calculating the x, y, and z coordinates
-        # of each vertex and the corresponding normal vector
-        for i, phi in enumerate(np.linspace(-pi / 2, pi / 2, slices_1)):
-            for j, theta in enumerate(np.linspace(-pi, pi, stacks_1)):
-                x = radius * math.cos(phi) * math.cos(theta)
-                y = radius * math.cos(phi) * math.sin(theta)
-                z = radius * math.sin(phi)
-
-                nx = math.cos(phi) * math.cos(theta)
-                ny = math.cos(phi) * math.sin(theta)
-                nz = math.sin(phi)
-
-                # Encoding vertex order using C array order
-                i_by_j = i * stacks_1 + j
-                self.vertices[i_by_j] = [x, y, z, nx, ny, nz, *color, j / stacks, i / slices]
-
-                # I've combined the two loops here so that the number of loops can be reduced.
-                ip1_by_j = (i + 1) % slices_1 * stacks_1 + j
-                i_by_jp1 = i * stacks_1 + (j + 1) % stacks_1
-                ip1_by_jp1 = (i + 1) % slices_1 * stacks_1 + (j + 1) % stacks_1
-
-                # Set the indices in the correct order for CCW winding
-                self.indices[i_by_j] = [
-                    i_by_j, ip1_by_j, i_by_jp1,
-                    ip1_by_jp1, ip1_by_j, i_by_jp1]
-
-        self.indices = self.indices.flatten("C")
-
-    def draw(self):
-        self.vao.bind()
-        self.ebo.draw()
-        self.vao.unbind()
-
-    def initialize(self):
-        """
-        Remember to bind VAO before this initialization. If VAO is not bind, program might throw an error
-        in systems that don't enable a default VAO after GLProgram compilation
-        """
-        self.vao.bind()
-        self.vbo.setBuffer(self.vertices, 11)
-        self.ebo.setBuffer(self.indices)
-
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexPos"),
-                                  stride=11, offset=0, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexNormal"),
-                                  stride=11, offset=3, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexColor"),
-                                  stride=11, offset=6, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexTexture"),
-                                  stride=11, offset=9, attribSize=2)
-        self.vao.unbind()
+        # phi runs along the rows (slices) and theta along the columns (stacks),
+        # so the vertex order is i * (stacks + 1) + j
+        def surface(grid: ParametricGrid):
+            nx = grid.cosU * grid.cosV
+            ny = grid.cosU * grid.sinV
+            nz = grid.sinU
+            return (radius * nx, radius * ny, radius * nz), (nx, ny, nz), (grid.t, grid.s)
+
+        self.vertices, self.indices = generateSurface(surface, slices, stacks, color,
+                                                      uRange=(-pi / 2, pi / 2), vRange=(-pi, pi))
@@ -7,7 +7,7 @@ First version in 11/01/2021
 """
 
 from Displayable import Displayable
-from GLBuffer import VAO, VBO, EBO
+from ParametricMesh import ParametricGrid, generateSurface, VERTEX_ATTRIB_SIZE
 from Point import Point
 import numpy as np
 import ColorType
@@ -49,9 +49,6 @@ except ImportError:
 #   There should be no seams in the resulting texture-mapped model.
 
 class DisplayableTorus(Displayable):
-    vao = None
-    vbo = None
-    ebo = None
     shaderProg = None
 
     # stores current torus's information, read-only
@@ -64,16 +61,21 @@ class DisplayableTorus(Displayable):
     vertices = None
     indices = None
 
-    def __init__(self, shaderProg, innerRadius=0.25, outerRadius=0.5, nsides=36, rings=36, color=ColorType.SOFTBLUE):
+    # generation parameters, see Displayable.generateShared
+    parameterNames = ("innerRadius", "outerRadius", "nsides", "rings", "color")
+
+    def __init__(self, shaderProg, innerRadius=0.25, outerRadius=0.5, nsides=36, rings=36, color=ColorType.SOFTBLUE,
+                 lodLevels=None):
         super(DisplayableTorus, self).__init__()
         self.shaderProg = shaderProg
         self.shaderProg.use()
 
-        self.vao = VAO()
-        self.vbo = VBO()  # vbo can only be initiate with glProgram activated
-        self.ebo = EBO()
+        self.generateShared(innerRadius, outerRadius, nsides, rings, color)
+        self.buildLodChain(self.defaultLodLevels if lodLevels is None else lodLevels)
 
-        self.generate(innerRadius, outerRadius, nsides, rings, color)
+    def lodParameters(self, level: int) -> tuple:
+        return (self.innerRadius, self.outerRadius,
+                max(3, self.nsides >> level), max(3, self.rings >> level), self.color)
 
     def generate(self, innerRadius=0.25, outerRadius=0.5, nsides=36, rings=36, color=ColorType.SOFTBLUE):
         # The function generates a torus shape by setting its inner and outer radii,
@@ -115,76 +117,17 @@ class DisplayableTorus(Displayable):
         if b == 0:
             # If the torus has no thickness (b = 0),
             # set its vertices and indices to empty arrays.
-            self.vertices = np.zeros((0, 11))
-            self.indices = np.zeros(0)
+            self.vertices = np.zeros((0, VERTEX_ATTRIB_SIZE), dtype=np.float32)
+            self.indices = np.zeros(0, dtype=np.uint32)
             return
 
-        # We need to pad one extra row for both the number of sides and rings,
-        # to assign the correct texture coordinates to them.
-        nsides_1 = nsides + 1
-        rings_1 = rings + 1
-        self.vertices = np.zeros((nsides_1 * rings_1, 11))
-        self.indices = np.zeros((nsides_1 * rings_1, 6), dtype=np.uint32)
-
-        pi = np.pi
-        for i, u in enumerate(np.linspace(-pi, pi, nsides_1)):
-            for j, v in enumerate(np.linspace(-pi, pi, rings_1)):
-                # pre_compute
-                cos_u = np.cos(u)
-                sin_u = np.sin(u)
-                cos_v = np.cos(v)
-                sin_v = np.sin(v)
-                # a + b * np.cos(v)
-                comm_patt = a + b * cos_v
-
-                # compute the vertex position
-                x = comm_patt * cos_u
-                y = comm_patt * sin_u
-                z = b * sin_v
-                i_by_j = i * rings_1 + j
-
-                # compute the vertex normal
-                nx = np.sign(b) * cos_u * cos_v * np.sign(comm_patt)
-                ny = np.sign(b) * sin_u * cos_v * np.sign(comm_patt)
-                nz = np.sign(b) * sin_v * np.sign(comm_patt)
-
-                # compute the vertex color
-                self.vertices[i_by_j] = [x, y, z, nx, ny, nz, *color, i / nsides, j / rings]
-
-                # # compute the vertex texture coordinates
-                # self.vertices[vert_index, 9:11] = [u / (2 * pi), v / (2 * pi)]
-
-                i_by_jp1 = i * rings_1 + (j + 1) % rings_1
-                ip1_by_j = (i + 1) % nsides_1 * rings_1 + j
-                ip1_by_jp1 = (i + 1) % nsides_1 * rings_1 + (j + 1) % rings_1
-
-                # readjust the order to match CCW.
-                self.indices[i_by_j, 0:6] = [
-                    i_by_j, ip1_by_j, i_by_jp1,
-                    ip1_by_jp1, ip1_by_j, i_by_jp1]
-
-        self.indices = self.indices.flatten("C")
-
-    def draw(self):
-        self.vao.bind()
-        self.ebo.draw()
-        self.vao.unbind()
-
-    def initialize(self):
-        """
-        Remember to bind VAO before this initialization. If VAO is not bind, program might throw an error
-        in systems which don't enable a default VAO after GLProgram compilation
-        """
-        self.vao.bind()
-        self.vbo.setBuffer(self.vertices, 11)
-        self.ebo.setBuffer(self.indices)
-
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexPos"),
-                                  stride=11, offset=0, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexNormal"),
-                                  stride=11, offset=3, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexColor"),
-                                  stride=11, offset=6, attribSize=3)
-        self.vbo.setAttribPointer(self.shaderProg.getAttribLocation("vertexTexture"),
-                                  stride=11, offset=9, attribSize=2)
-        self.vao.unbind()
+        # u runs along the rows (nsides) and v along the columns (rings)
+        def surface(grid: ParametricGrid):
+            # a + b * np.cos(v)
+            comm_patt = a + b * grid.cosV
+            sign_patt = np.sign(b) * np.sign(comm_patt)
+            return ((comm_patt * grid.cosU, comm_patt * grid.sinU, b * grid.sinV),
+                    (grid.cosU * grid.cosV * sign_patt, grid.sinU * grid.cosV * sign_patt, grid.sinV * sign_patt),
+                    (grid.s, grid.t))
+
+        self.vertices, self.indices = generateSurface(surface, nsides, rings, color)
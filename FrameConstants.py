@@ -0,0 +1,44 @@
+"""
+The per-frame camera values, stored in a uniform buffer object read by every program.
+
+The block is uploaded once per frame with a single glBufferSubData, however many programs and shader variants
+draw that frame. Matrices are stored in column-major order like every matrix of the code base, which is also
+the std140 layout of a mat4.
+"""
+import numpy as np
+
+from UniformBuffer import UniformBuffer
+
+# FrameBlock in std140, every member is aligned on 16 bytes except the time packed after the vec3
+FRAME_DTYPE = np.dtype({
+    "names": ["projection", "view", "viewProjection", "viewPosition", "time"],
+    "formats": [("<f4", 16), ("<f4", 16), ("<f4", 16), ("<f4", 3), "<f4"],
+    "offsets": [0, 64, 128, 192, 204],
+    "itemsize": 208,
+})
+
+FRAME_BLOCK_BINDING = 1
+
+
+class FrameConstants(UniformBuffer):
+    def __init__(self):
+        super().__init__(np.zeros(1, dtype=FRAME_DTYPE), FRAME_BLOCK_BINDING)
+
+    def update(self, viewMat: np.ndarray, perspMat: np.ndarray, viewPosition, time: float):
+        """
+        Store and upload the camera of this frame
+
+        :param time: seconds since the start of the application
+        """
+        item = self.data[0:1]
+        item["projection"] = perspMat.flatten("C")
+        item["view"] = viewMat.flatten("C")
+        # column-major matrices multiply in reverse order, this is projection * view
+        item["viewProjection"] = (viewMat @ perspMat).flatten("C")
+        item["viewPosition"] = viewPosition
+        item["time"] = time
+        self.upload()
+
+
+# The process-wide instance, bound to FRAME_BLOCK_BINDING for every GLProgram
+frameConstants = FrameConstants()
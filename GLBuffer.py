@@ -33,6 +33,10 @@ except ImportError:
 import numpy as np
 import ctypes
 
+import VertexFormat
+from BoundingVolume import BoundingVolume
+from GLState import glState
+
 
 class VBO:
     """
@@ -51,25 +55,32 @@ class VBO:
     def bind(self):
         gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vbo)
 
-    def setBuffer(self, bufferDataArray: np.ndarray, vertexAttribSize: int):
+    def setBuffer(self, bufferDataArray: np.ndarray, vertexAttribSize: int, usage=gl.GL_STATIC_DRAW):
         """
         :param vertexAttribSize: the size of the vertex attribute
         :type vertexAttribSize: int
-        :param bufferDataArray: the vertices data. It will be flatten in row-major order if its dimension isn't one
+        :param usage: GL_STATIC_DRAW, or GL_STREAM_DRAW for data replaced every frame
+        :param bufferDataArray: the vertices data. It will be flatten in row-major order if its dimension isn't one.
+                                A structured array from VertexFormat.pack is uploaded as is, one vertex per item
         :type bufferDataArray: numpy.ndarray
         """
-        # type conversion
-        if bufferDataArray.dtype != np.dtype("float32"):
-            bufferDataArray = bufferDataArray.astype(np.dtype("float32"))
-        bufferData = bufferDataArray.flatten("C")  # flatten in row-major order
         self.vertexAttribSize = vertexAttribSize
-
-        bufferSize = bufferDataArray.size
-        self.vertexNum = bufferSize // vertexAttribSize  # for safety reason, take floor division to get int result
-        byteLength = 4 * bufferSize  # 4 is the size of float32
+        if bufferDataArray.dtype.names is not None:
+            bufferData = np.ascontiguousarray(bufferDataArray)
+            self.vertexNum = bufferData.size
+            byteLength = bufferData.nbytes
+        else:
+            # type conversion
+            if bufferDataArray.dtype != np.dtype("float32"):
+                bufferDataArray = bufferDataArray.astype(np.dtype("float32"))
+            bufferData = bufferDataArray.flatten("C")  # flatten in row-major order
+
+            bufferSize = bufferDataArray.size
+            self.vertexNum = bufferSize // vertexAttribSize  # for safety reason, take floor division to get int result
+            byteLength = 4 * bufferSize  # 4 is the size of float32
 
         self.bind()
-        gl.glBufferData(gl.GL_ARRAY_BUFFER, byteLength, bufferData, gl.GL_STATIC_DRAW)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, byteLength, bufferData, usage)
 
     def setAttribPointer(self, attribLoc, stride=0, offset=0, attribSize=0):
         attribSize = self.vertexAttribSize if attribSize == 0 else attribSize
@@ -99,6 +110,7 @@ class EBO:
     ebo = None
     indexNum = 0
     triangleNum = 0
+    indexType = None  # GL_UNSIGNED_SHORT or GL_UNSIGNED_INT
 
     def __init__(self):
         self.ebo = gl.glGenBuffers(1)
@@ -109,20 +121,35 @@ class EBO:
     def bind(self):
         gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.ebo)
 
-    def setBuffer(self, bufferDataArray: np.ndarray):
-        if bufferDataArray.dtype != np.dtype("int32"):
-            bufferDataArray = bufferDataArray.astype(np.dtype("int32"))
+    def setBuffer(self, bufferDataArray: np.ndarray, vertexNum: int = None):
+        """
+        :param bufferDataArray: the triangle indices. It will be flatten in row-major order if its dimension isn't one
+        :param vertexNum: the number of vertices the indices refer to. If it fits, 16 bits indices are uploaded.
+                          If not given, the largest index is used instead
+        """
         bufferData = bufferDataArray.flatten("C")  # row-major order flatten
+        if vertexNum is None:
+            vertexNum = int(bufferData.max()) + 1 if bufferData.size > 0 else 0
+
+        if vertexNum <= (1 << 16):
+            bufferData = bufferData.astype(np.dtype("uint16"))
+            self.indexType = gl.GL_UNSIGNED_SHORT
+        else:
+            bufferData = bufferData.astype(np.dtype("uint32"))
+            self.indexType = gl.GL_UNSIGNED_INT
 
         self.indexNum = bufferData.size
         self.triangleNum = self.indexNum // 3  # floor division to get triangle number
-        byteLength = 4 * self.indexNum
+        byteLength = bufferData.nbytes
 
         self.bind()
         gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, byteLength, bufferData, gl.GL_STATIC_DRAW)
 
     def draw(self):
-        gl.glDrawElements(gl.GL_TRIANGLES, self.indexNum, gl.GL_UNSIGNED_INT, None)
+        gl.glDrawElements(gl.GL_TRIANGLES, self.indexNum, self.indexType, None)
+
+    def drawInstanced(self, instanceNum: int):
+        gl.glDrawElementsInstanced(gl.GL_TRIANGLES, self.indexNum, self.indexType, None, instanceNum)
 
 
 class VAO:
@@ -138,10 +165,117 @@ class VAO:
     #     gl.glDeleteVertexArrays(1, self.vao)
 
     def bind(self):
-        gl.glBindVertexArray(self.vao)
+        glState.bindVertexArray(self.vao)
 
     def unbind(self):
-        gl.glBindVertexArray(0)
+        glState.bindVertexArray(0)
+
+
+class GLMesh:
+    """
+    A VAO with its VBO and EBO, filled with one pair of vertices and indices arrays.
+    The same GLMesh can be shared by several Displayable objects, see GeometryCache.
+    Vertices must follow the 11 columns layout: position, normal, color and texture coordinates,
+    they are converted to vertexFormat when uploaded.
+
+    For instanced draws, a second VBO holds one row of INSTANCE_ATTRIB_SIZE floats per instance:
+        Column | 0:16                       | 16:25                      | 25:28          | 28
+        Stores | model matrix, column-major | normal matrix, column-major | instance color | instance color on
+    """
+    INSTANCE_ATTRIB_SIZE = 29
+
+    vao = None
+    vbo = None
+    ebo = None
+    instanceVbo = None  # created by the first instanced draw
+    shaderProg = None
+    vertexFormat = None
+
+    vertices = None
+    indices = None
+    bounds = None  # BoundingVolume of the vertex positions, None if there is no vertex
+
+    key = None
+    parameters = None  # generation parameters of the Displayable which created this mesh
+    refCount = 0
+    uploaded = False
+    valid = True  # False once the GL context which owns the buffers is gone
+
+    def __init__(self, shaderProg, vertices: np.ndarray, indices: np.ndarray,
+                 vertexFormat: VertexFormat.VertexFormat = VertexFormat.STANDARD):
+        """
+        vbo can only be initiated with glProgram activated
+        """
+        self.shaderProg = shaderProg
+        self.vertexFormat = vertexFormat
+        self.vertices = vertices
+        self.indices = indices
+        self.bounds = BoundingVolume.fromPoints(vertices[:, 0:3])
+        self.parameters = {}
+
+        self.vao = VAO()
+        self.vbo = VBO()
+        self.ebo = EBO()
+
+    def initialize(self):
+        """
+        Upload the arrays to the GPU and set up the attributes. This only happens once,
+        further calls from the other Displayable objects sharing this mesh are free.
+        """
+        if self.uploaded:
+            return
+
+        self.vao.bind()
+        self.vbo.setBuffer(self.vertexFormat.pack(self.vertices), 11)
+        self.ebo.setBuffer(self.indices, len(self.vertices))
+
+        self.vertexFormat.setAttribPointers(self.vbo, self.shaderProg)
+        self.vao.unbind()
+        self.uploaded = True
+
+    def draw(self):
+        # the VAO is left bound through glState, so drawing the same mesh again skips the bind.
+        # Buffers are only set up in initialize, inside their own VAO, and Sketch unbinds it once the frame is drawn
+        self.vao.bind()
+        self.ebo.draw()
+
+    def drawInstanced(self, instanceData: np.ndarray):
+        """
+        Draw the mesh once per row of instanceData, see the class docstring for the row layout
+        """
+        self.vao.bind()
+        if self.instanceVbo is None:
+            self.instanceVbo = VBO()
+            self.setInstanceAttribPointers()
+        self.instanceVbo.setBuffer(instanceData, self.INSTANCE_ATTRIB_SIZE, gl.GL_STREAM_DRAW)
+        self.ebo.drawInstanced(len(instanceData))
+
+    def setInstanceAttribPointers(self):
+        # a matN attribute takes N consecutive locations, one per column
+        size = self.INSTANCE_ATTRIB_SIZE
+        modelLoc = self.shaderProg.getAttribLocation("instanceModel")
+        normalLoc = self.shaderProg.getAttribLocation("instanceNormal")
+        colorLoc = self.shaderProg.getAttribLocation("instanceAttribColor")
+        attribs = []
+        if modelLoc >= 0:
+            attribs += [(modelLoc + i, 4 * i, 4) for i in range(4)]
+        if normalLoc >= 0:
+            attribs += [(normalLoc + i, 16 + 3 * i, 3) for i in range(3)]
+        if colorLoc >= 0:
+            attribs.append((colorLoc, 25, 4))
+        for loc, offset, attribSize in attribs:
+            self.instanceVbo.setAttribPointer(loc, stride=size, offset=offset, attribSize=attribSize)
+            gl.glVertexAttribDivisor(loc, 1)
+
+    def delete(self):
+        if self.valid:
+            gl.glDeleteVertexArrays(1, [self.vao.vao])
+            glState.deleted(vertexArray=self.vao.vao)
+            gl.glDeleteBuffers(2, [self.vbo.vbo, self.ebo.ebo])
+            if self.instanceVbo is not None:
+                gl.glDeleteBuffers(1, [self.instanceVbo.vbo])
+        self.valid = False
+        self.uploaded = False
 
 
 # A global variable in this scope to store next texture id, there should be no duplicate textureUnitID
@@ -157,9 +291,10 @@ class Texture:
     def __init__(self):
         global NextTextureID
 
-        # assign a texture image unit for this sampler
+        # assign a texture image unit for this sampler,
+        # units 13 to 15 hold the texture buffers of the lights, see LightBuffer and LightClusters
         self.textureUnitID = NextTextureID
-        NextTextureID = NextTextureID % 16 + 1
+        NextTextureID = NextTextureID % 12 + 1
 
     def setTextureImage(self, image):
         self.textureName = gl.glGenTextures(1)
@@ -172,7 +307,7 @@ class Texture:
         height, width, channel = image.shape
         imageData = image.flatten("C")
 
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureName)
+        glState.bindTexture(self.textureUnitID, self.textureName)
         gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGB, width, height, 0, gl.GL_RGB, gl.GL_UNSIGNED_BYTE, imageData)
         gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
         self.setTextureParameters()
@@ -184,13 +319,14 @@ class Texture:
         gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
         gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
 
-    def bind(self, glslVariableLoc):
-        gl.glActiveTexture(gl.GL_TEXTURE0 + self.textureUnitID)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureName)
-        gl.glUniform1i(glslVariableLoc, self.textureUnitID)
+    def bind(self, shaderProg, glslVariableName):
+        """
+        Bind the texture to its unit and point the sampler glslVariableName of shaderProg at it
+        """
+        glState.bindTexture(self.textureUnitID, self.textureName)
+        shaderProg.setInt(glslVariableName, self.textureUnitID)
 
-    def unbind(self, glslVariableLoc):
-        gl.glActiveTexture(gl.GL_TEXTURE0)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
-        gl.glUniform1i(glslVariableLoc, 0)
+    def unbind(self, shaderProg, glslVariableName):
+        glState.bindTexture(0, 0)
+        shaderProg.setInt(glslVariableName, 0)
 
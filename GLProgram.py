@@ -1,4 +1,9 @@
 from Light import Light
+from GLState import glState
+from LightBuffer import lightBuffer
+from LightClusters import lightClusters
+from FrameConstants import frameConstants
+from ProgramBinaryCache import programBinaryCache
 
 try:
     import OpenGL
@@ -26,6 +31,44 @@ except ImportError:
     raise ImportError("Required dependency PyOpenGL not present")
 import numpy as np
 import math
+import os
+import string
+import time
+
+
+# GL_COMPLETION_STATUS_KHR, same value as GL_COMPLETION_STATUS_ARB
+GL_COMPLETION_STATUS = 0x91B1
+
+
+def parallelCompileSupported() -> bool:
+    """
+    Whether the current context can report the completion of a compile without blocking
+    """
+    try:
+        count = int(gl.glGetIntegerv(gl.GL_NUM_EXTENSIONS))
+        extensions = {gl.glGetStringi(gl.GL_EXTENSIONS, i) for i in range(count)}
+    except Exception:
+        return False
+    return bool({b"GL_KHR_parallel_shader_compile", b"GL_ARB_parallel_shader_compile"} & extensions)
+
+
+# the files read by GLProgram.genSources when templateDir is set
+VERTEX_TEMPLATE = "vertex.glsl"
+FRAGMENT_TEMPLATE = "fragment.glsl"
+
+# how a uniform is read back and uploaded again after a hot reload: GL type -> (components, integer, upload)
+UNIFORM_RESTORE = {
+    gl.GL_FLOAT: (1, False, lambda location, v: gl.glUniform1fv(location, 1, v)),
+    gl.GL_FLOAT_VEC2: (2, False, lambda location, v: gl.glUniform2fv(location, 1, v)),
+    gl.GL_FLOAT_VEC3: (3, False, lambda location, v: gl.glUniform3fv(location, 1, v)),
+    gl.GL_FLOAT_VEC4: (4, False, lambda location, v: gl.glUniform4fv(location, 1, v)),
+    gl.GL_FLOAT_MAT2: (4, False, lambda location, v: gl.glUniformMatrix2fv(location, 1, gl.GL_FALSE, v)),
+    gl.GL_FLOAT_MAT3: (9, False, lambda location, v: gl.glUniformMatrix3fv(location, 1, gl.GL_FALSE, v)),
+    gl.GL_FLOAT_MAT4: (16, False, lambda location, v: gl.glUniformMatrix4fv(location, 1, gl.GL_FALSE, v)),
+    gl.GL_INT: (1, True, lambda location, v: gl.glUniform1iv(location, 1, v)),
+    gl.GL_BOOL: (1, True, lambda location, v: gl.glUniform1iv(location, 1, v)),
+    gl.GL_SAMPLER_2D: (1, True, lambda location, v: gl.glUniform1iv(location, 1, v)),
+}
 
 
 def perspectiveMatrix(angleOfView, near, far):
@@ -54,10 +97,64 @@ class GLProgram:
     ready = False  # a control flag which reflect if this GLprogram is ready
     debug = 0
 
-    def __init__(self) -> None:
+    # the value last uploaded to every uniform location, so that uploading it again can be skipped
+    uniformCache = None
+    uniformCacheOn = True
+    uniformCacheHits = 0
+    uniformCacheMisses = 0
+
+    # filled at link time from the active uniforms and attributes, so setters never ask the driver for a name
+    uniformLocations = None  # GLSL name -> location
+    uniformTypes = None  # GLSL name -> GL type
+    attribLocations = None  # GLSL name -> location
+    handles = None  # key of attribs -> uniform location
+
+    # fixed before linking, so the VAOs set up with one program also work with every shader variant
+    attribBindings = {
+        "vertexPos": 0,
+        "vertexNormal": 1,
+        "vertexColor": 2,
+        "vertexTexture": 3,
+        "instanceModel": 4,  # a mat4 takes 4 locations
+        "instanceNormal": 8,  # a mat3 takes 3 locations
+        "instanceAttribColor": 11,
+    }
+
+    # load the linked program from ProgramBinaryCache when it was already compiled by a previous run
+    binaryCacheOn = True
+    fromBinaryCache = False
+    compileSeconds = 0.0  # time from the start of the last compile until the program was ready
+
+    # set between beginCompile and finishCompile: the shaders, the binary cache key and when it started
+    pendingCompile = None
+    pendingFrames = 0  # pollCompile calls so far
+    compileStart = 0.0
+    # without completion status, pollCompile waits this many calls before asking for the link status
+    deferFrames = 2
+
+    # read the sources from VERTEX_TEMPLATE and FRAGMENT_TEMPLATE in this directory instead of the built-in ones,
+    # see exportTemplates and ShaderWatcher
+    templateDir = None
+
+    # a shader variant has its routing and normal mapping compiled in, None is decided at runtime by uniforms
+    routingFlags = None
+    normalMapOn = None
+
+    def __init__(self, routingFlags: int = None, normalMapOn: bool = None) -> None:
+        """
+        :param routingFlags: compile a variant for this value of routingFlagsOf, see ShaderVariantCache
+        :param normalMapOn: compile a variant with the normal mapping always on or always off
+        """
         self.program = gl.glCreateProgram()
 
         self.ready = False
+        self.routingFlags = routingFlags
+        self.normalMapOn = normalMapOn
+        self.uniformCache = {}
+        self.uniformLocations = {}
+        self.uniformTypes = {}
+        self.attribLocations = {}
+        self.handles = {}
 
         # define attribs name and corresponding method to set it
         self.attribs = {
@@ -66,19 +163,33 @@ class GLProgram:
             "vertexColor": "aColor",
             "vertexTexture": "aTexture",
 
+            "instanceModel": "aInstanceModel",
+            "instanceNormal": "aInstanceNormal",
+            "instanceAttribColor": "aInstanceColor",
+            "instanced": "u_instanced",
+
             "textureImage": "txt_text",
             "normalMap": "txt_norm",
             "useNormalMap": "txt_normOn",
 
+            "frameBlock": "FrameBlock",
             "projectionMat": "projection",
             "viewMat": "view",
+            "viewProjectionMat": "viewProjection",
+            "time": "time",
             "modelMat": "model",
+            "normalMat": "normalMat",
+
+            "instanceColor": "u_instanceColor",
+            "useInstanceColor": "u_instanceColorOn",
 
             "viewPosition": "viewPosition",
             "material": "material",
-            "light": "light",
+            "lightData": "lightData",
+            "clusterBlock": "ClusterBlock",
+            "clusterData": "clusterData",
+            "clusterLights": "clusterLights",
 
-            "maxLightsNum": "20",
             "maxMaterialNum": "20",
 
             "ambientOn": "l_ambientOn",
@@ -89,39 +200,35 @@ class GLProgram:
         self.attribs["specular"] = self.attribs["material"] + ".specular"
         self.attribs["ambient"] = self.attribs["material"] + ".ambient"
         self.attribs["highlight"] = self.attribs["material"] + ".highlight"
-        for i in range(int(self.attribs["maxLightsNum"])):
-            self.attribs[f"light[{i}].on"] = f"{self.attribs['light']}[{i}].on"
-            self.attribs[f"light[{i}].position"] = f"{self.attribs['light']}[{i}].position"
-            self.attribs[f"light[{i}].color"] = f"{self.attribs['light']}[{i}].color"
-            self.attribs[f"light[{i}].infiniteOn"] = f"{self.attribs['light']}[{i}].infiniteOn"
-            self.attribs[f"light[{i}].infiniteDirection"] = f"{self.attribs['light']}[{i}].infiniteDirection"
-            self.attribs[f"light[{i}].radialOn"] = f"{self.attribs['light']}[{i}].radialOn"
-            self.attribs[f"light[{i}].spotOn"] = f"{self.attribs['light']}[{i}].spotOn"
-            self.attribs[f"light[{i}].spotDirection"] = f"{self.attribs['light']}[{i}].spotDirection"
-            self.attribs[f"light[{i}].spotRadialFactor"] = f"{self.attribs['light']}[{i}].spotRadialFactor"
-            self.attribs[f"light[{i}].spotAngleLimit"] = f"{self.attribs['light']}[{i}].spotAngleLimit"
-            self.attribs[f"light[{i}].spotExpAttenuation"] = f"{self.attribs['light']}[{i}].spotExpAttenuation"
-
-        self.vertexShaderSource = self.genVertexShaderSource()
-        self.fragmentShaderSource = self.genFragShaderSource()
+
+        self.vertexShaderSource, self.fragmentShaderSource = self.genSources()
 
     def __del__(self) -> None:
         try:
             gl.glDeleteProgram(self.program)
+            glState.deleted(program=self.program)
         except Exception as e:
             pass
 
     @staticmethod
-    def load_shader(src: str, shader_type: int) -> int:
+    def load_shader(src: str, shader_type: int, checkStatus: bool = True) -> int:
+        """
+        :param checkStatus: wait for the compile to finish and raise on errors, see checkShader
+        """
         shader = gl.glCreateShader(shader_type)
         gl.glShaderSource(shader, src)
         gl.glCompileShader(shader)
+        if checkStatus:
+            GLProgram.checkShader(shader)
+        return shader
+
+    @staticmethod
+    def checkShader(shader: int):
         error = gl.glGetShaderiv(shader, gl.GL_COMPILE_STATUS)
         if error != gl.GL_TRUE:
             info = gl.glGetShaderInfoLog(shader)
             gl.glDeleteShader(shader)
             raise Exception(info)
-        return shader
 
     def genVertexShaderSource(self):
         vss = f'''
@@ -137,24 +244,85 @@ class GLProgram:
         out vec2 vTexture;
         out int materialIndex;
         
-        uniform mat4 {self.attribs["projectionMat"]};
-        uniform mat4 {self.attribs["viewMat"]};
+        {self.genFrameBlockSource()}
         uniform mat4 {self.attribs["modelMat"]};
+        // transpose(inverse(mat3(model))), computed once per Component on the CPU
+        uniform mat3 {self.attribs["normalMat"]};
+        // per Component base color, replaces the color stored in the vertex buffer when it is on
+        uniform vec3 {self.attribs["instanceColor"]};
+        uniform bool {self.attribs["useInstanceColor"]};
+        
+        // instanced draws read the per Component values above from these attributes instead
+        in mat4 {self.attribs["instanceModel"]};
+        in mat3 {self.attribs["instanceNormal"]};
+        in vec4 {self.attribs["instanceAttribColor"]};  // rgb, and a = 1 if it replaces the vertex color
+        uniform bool {self.attribs["instanced"]};
         
         void main()
         {{
-            gl_Position = {self.attribs["projectionMat"]} * {self.attribs["viewMat"]} * {self.attribs["modelMat"]} * vec4({self.attribs["vertexPos"]}, 1.0);
-            vPos = vec3(model * vec4({self.attribs["vertexPos"]}, 1.0));
-            vColor = {self.attribs["vertexColor"]};
-            vNormal = normalize(transpose(inverse({self.attribs["modelMat"]})) * vec4({self.attribs["vertexNormal"]}, 0.0) ).xyz;
+            mat4 modelMatrix = {self.attribs["instanced"]} ? {self.attribs["instanceModel"]} : {self.attribs["modelMat"]};
+            mat3 normalMatrix = {self.attribs["instanced"]} ? {self.attribs["instanceNormal"]} : {self.attribs["normalMat"]};
+            bool colorOn = {self.attribs["instanced"]} ? {self.attribs["instanceAttribColor"]}.a > 0.5 : {self.attribs["useInstanceColor"]};
+            vec3 baseColor = {self.attribs["instanced"]} ? {self.attribs["instanceAttribColor"]}.rgb : {self.attribs["instanceColor"]};
+            
+            gl_Position = {self.attribs["viewProjectionMat"]} * modelMatrix * vec4({self.attribs["vertexPos"]}, 1.0);
+            vPos = vec3(modelMatrix * vec4({self.attribs["vertexPos"]}, 1.0));
+            vColor = colorOn ? baseColor : {self.attribs["vertexColor"]};
+            vNormal = normalize(normalMatrix * {self.attribs["vertexNormal"]});
             vTexture = {self.attribs["vertexTexture"]};
         }}
         '''
         return vss
 
+    def genFrameBlockSource(self):
+        """
+        The camera values of the frame, filled by FrameConstants and shared by every program and both stages
+        """
+        return f"""layout(std140) uniform {self.attribs["frameBlock"]}{{
+    mat4 {self.attribs["projectionMat"]};
+    mat4 {self.attribs["viewMat"]};
+    mat4 {self.attribs["viewProjectionMat"]};
+    vec3 {self.attribs["viewPosition"]};
+    float {self.attribs["time"]};
+}};"""
+
+    def genRoutingSource(self):
+        """
+        The uber shader reads the routing and the normal mapping from uniforms. A variant has them as constants,
+        so the compiler drops the unused branches, and its results array only has a slot per used routing
+        """
+        if self.routingFlags is None:
+            routing = f"""uniform int renderingFlag;
+#define ROUTING_ON(bit) ((renderingFlag >> bit & 0x1) == 1)
+#define RESULT_SLOTS 8"""
+        else:
+            routing = f"""#define ROUTING_FLAGS {self.routingFlags}
+#define ROUTING_ON(bit) (((ROUTING_FLAGS >> bit) & 0x1) == 1)
+#define RESULT_SLOTS {self.resultSlots(self.routingFlags)}"""
+        if self.normalMapOn is None:
+            normalMap = f"""uniform bool {self.attribs["useNormalMap"]};
+#define NORMAL_MAP_ON {self.attribs["useNormalMap"]}"""
+        else:
+            normalMap = f"#define NORMAL_MAP_ON {'true' if self.normalMapOn else 'false'}"
+        return routing + "\n" + normalMap
+
+    @staticmethod
+    def resultSlots(routingFlags: int) -> int:
+        """
+        How many colors the fragment shader mixes for routingFlags: one per routing bit, "texture" only counts
+        without "lighting", and "bump" has no color of its own
+        """
+        slots = bin(routingFlags & 0b1101111).count("1")
+        if routingFlags & (0x1 << 8) and not routingFlags & 0x1:
+            slots += 1
+        return max(slots, 1)
+
     def genFragShaderSource(self):
         # macros
-        _light = self.attribs["light"]
+        _lightData = self.attribs["lightData"]
+        _clusterBlock = self.attribs["clusterBlock"]
+        _clusterData = self.attribs["clusterData"]
+        _clusterLights = self.attribs["clusterLights"]
         _material = self.attribs["material"]
         _viewPosition = self.attribs["viewPosition"]
         _txtrImg = self.attribs["textureImage"]
@@ -166,7 +334,6 @@ class GLProgram:
 
         fss = f"""
 #version 330 core
-#define MAX_LIGHT_NUM {self.attribs["maxLightsNum"]}
 #define MAX_MATERIAL_NUM {self.attribs["maxMaterialNum"]}
 struct Material{{
     vec4 ambient;
@@ -188,6 +355,7 @@ struct Light{{
     vec3 spotRadialFactor;
     float spotAngleLimit;
     float spotExpAttenuation;
+    float range;
 }};
 
 in vec3 vPos;
@@ -195,19 +363,126 @@ in vec3 vColor;
 smooth in vec3 vNormal;
 in vec2 vTexture;
 
-uniform int renderingFlag;
+{self.genRoutingSource()}
 uniform sampler2D {_txtrImg};
 uniform sampler2D {_txtrNorm};
-uniform bool {_useNorm};
 
-uniform vec3 {_viewPosition};
+{self.genFrameBlockSource()}
 uniform Material {_material};
-uniform Light {_light}[MAX_LIGHT_NUM];
+// the lights, 8 texels each, filled by LightBuffer and shared by every program
+uniform samplerBuffer {_lightData};
+// filled by LightClusters every frame
+layout(std140) uniform {_clusterBlock}{{
+    ivec3 clusterGrid;  // tiles across, tiles up and depth slices
+    int lightCount;
+    vec4 clusterDepth;  // near, far, and slices / log(far / near)
+    vec2 viewportSize;
+    bool clusteredOn;
+}};
+// offset and count of every cluster in clusterLights
+uniform usamplerBuffer {_clusterData};
+// the light indices of every cluster
+uniform usamplerBuffer {_clusterLights};
 // switch for ambient, diffuse and specular on/off
 uniform bool {_aOn};
 uniform bool {_dOn};
 uniform bool {_sOn};
 
+Light fetchLight(int index){{
+    int t = index * 8;
+    vec4 t4 = texelFetch({_lightData}, t + 4);
+    vec4 t6 = texelFetch({_lightData}, t + 6);
+    vec4 t7 = texelFetch({_lightData}, t + 7);
+    Light l;
+    l.on = texelFetch({_lightData}, t).x > 0.5;
+    l.position = texelFetch({_lightData}, t + 1).xyz;
+    l.color = texelFetch({_lightData}, t + 2);
+    l.infiniteOn = texelFetch({_lightData}, t + 3).x > 0.5;
+    l.infiniteDirection = t4.xyz;
+    l.spotOn = t4.w > 0.5;
+    l.spotDirection = texelFetch({_lightData}, t + 5).xyz;
+    l.spotRadialFactor = t6.xyz;
+    l.spotAngleLimit = t6.w;
+    l.spotExpAttenuation = t7.x;
+    l.range = t7.y;
+    return l;
+}}
+
+// the cluster of this fragment, LightClusters.bin uses the same slices
+int clusterIndex(){{
+    float depth = max(-({self.attribs["viewMat"]} * vec4(vPos, 1.0)).z, clusterDepth.x);
+    int depthSlice = clamp(int(log(depth / clusterDepth.x) * clusterDepth.z), 0, clusterGrid.z - 1);
+    ivec2 tile = clamp(ivec2(gl_FragCoord.xy / viewportSize * vec2(clusterGrid.xy)), ivec2(0), clusterGrid.xy - 1);
+    return (depthSlice * clusterGrid.y + tile.y) * clusterGrid.x + tile.x;
+}}
+
+// diffuse and specular of one light
+vec4 shadeLight(Light l, vec3 compNormal){{
+    if (!l.on)
+        return vec4(0.0);
+
+    //////////////// then compute the diffuse ////////////////
+    // L is the direction from the light to the vertex
+    vec3 L;
+    
+    if (!l.infiniteOn){{
+        L = normalize(l.position - vPos);
+    }} else {{
+        L = normalize(l.infiniteDirection);
+    }}
+    
+    if (!{_dOn} && !{_sOn})
+        return vec4(0.0);
+    
+    vec4 i_diffuse = vec4(0.0);
+    vec3 N = normalize(compNormal);
+    float N_dot_L = dot(N, L);
+    if ({_dOn} && N_dot_L > 0.0)
+        i_diffuse = ({_material}.diffuse * N_dot_L) * l.color;
+
+    //////////////// then compute the specular ////////////////
+    // V is the direction from the vertex to the camera
+    vec3 V = normalize({_viewPosition} - vPos);
+    // R is the reflection of L about N, 2 * N_dot_L * N - L;
+    vec3 R = reflect(-L, N);
+
+    float R_dot_V = max(dot(R, V), 0.0);
+    vec4 i_specular = vec4(0.0);
+    if ({_sOn} && N_dot_L > 0.0 && R_dot_V > 0.0) {{
+        float specFact = pow(R_dot_V, {_material}.highlight);
+        i_specular = {_material}.specular * specFact * l.color;
+    }}
+    
+    float f_radial = 1.0;
+    if (l.spotOn && !l.infiniteOn){{
+        float dist = length(l.position - vPos);
+        float a = l.spotRadialFactor[0];
+        float b = l.spotRadialFactor[1];
+        float c = l.spotRadialFactor[2];
+        f_radial = 1.0 / (a + b * dist + c * dist * dist);
+    }}
+    float f_angular = 1.0;
+    if (l.spotOn){{
+        // unlikely L, vObj3 should always be vector from position to render point.
+        vec3 vObj = normalize(l.position - vPos);
+        float cos_angle = dot(vObj, normalize(l.spotDirection));
+        if (cos_angle > l.spotAngleLimit) {{
+            f_angular = pow(cos_angle, l.spotExpAttenuation);
+        }} else {{
+            f_angular = 0.0;
+        }}
+    }}
+    // a light with a range fades out smoothly before it, so the clusters it isn't binned to miss nothing
+    float f_range = 1.0;
+    if (l.range > 0.0 && !l.infiniteOn){{
+        float x = length(l.position - vPos) / l.range;
+        f_range = clamp(1.0 - x * x * x * x, 0.0, 1.0);
+        f_range *= f_range;
+    }}
+    
+    return f_radial * f_angular * f_range * (i_diffuse + i_specular);
+}}
+
 out vec4 FragColor;
 void main()
 {{
@@ -217,8 +492,8 @@ void main()
     FragColor = -1 * abs(placeHolder);
     FragColor = clamp(FragColor, 0, 1);
     
-    vec4 results[8];
-    for(int i=0; i<8; i+=1)
+    vec4 results[RESULT_SLOTS];
+    for(int i=0; i<RESULT_SLOTS; i+=1)
         results[i]=vec4(0.0);
     int ri=0;
     vec3 compNormal = vNormal;
@@ -228,7 +503,7 @@ void main()
     //   1. Perform the same steps as Texture Mapping above, except that instead of using the image for vertex 
     //   color, the image is used to modify the normals.
     //   2. Use the input normal map (“./assets/normalmap.jpg”) on both the sphere and the torus.
-    if ({_useNorm}) {{
+    if (NORMAL_MAP_ON) {{
         vec3 normalMap = texture({_txtrNorm}, vTexture).rgb;
         normalMap = normalize(normalMap * 2.0 - 1.0);
         vec3 tangent = normalize(vec3(1.0, 0.0, 0.0));
@@ -237,8 +512,8 @@ void main()
         compNormal = normalize(TBN * vNormal);
     }}
 
-    bool useLighting = (renderingFlag >> 0 & 0x1) == 1;
-    bool useTexture = (renderingFlag >> 8 & 0x1) == 1;
+    bool useLighting = ROUTING_ON(0);
+    bool useTexture = ROUTING_ON(8);
     // Reserved for illumination rendering, routing name is "lighting" or "illumination"
     if (useLighting) {{
         vec4 v4Color;
@@ -266,63 +541,17 @@ void main()
         }}
         
         // for each light, we compute diffuse and specular
-        for (int i = 0; i < MAX_LIGHT_NUM; i += 1){{
-            if (!{_light}[i].on)
-                continue;
-        
-            //////////////// then compute the diffuse ////////////////
-            // L is the direction from the light to the vertex
-            vec3 L;
-            
-            if (!{_light}[i].infiniteOn){{
-                L = normalize({_light}[i].position - vPos);
-            }} else {{
-                L = normalize({_light}[i].infiniteDirection);
+        if (clusteredOn){{
+            // only the lights reaching the cluster of this fragment
+            uvec2 cluster = texelFetch({_clusterData}, clusterIndex()).xy;
+            for (uint i = 0u; i < cluster.y; i += 1u){{
+                int index = int(texelFetch({_clusterLights}, int(cluster.x + i)).x);
+                iSum += shadeLight(fetchLight(index), compNormal);
             }}
-            
-            if (!{_dOn} && !{_sOn})
-                continue;
-            
-            vec4 i_diffuse = vec4(0.0);
-            vec3 N = normalize(compNormal);
-            float N_dot_L = dot(N, L);
-            if ({_dOn} && N_dot_L > 0.0)
-                i_diffuse = ({_material}.diffuse * N_dot_L) * {_light}[i].color;
-        
-            //////////////// then compute the specular ////////////////
-            // V is the direction from the vertex to the camera
-            vec3 V = normalize({_viewPosition} - vPos);
-            // R is the reflection of L about N, 2 * N_dot_L * N - L;
-            vec3 R = reflect(-L, N);
-    
-            float R_dot_V = max(dot(R, V), 0.0);
-            vec4 i_specular = vec4(0.0);
-            if ({_sOn} && N_dot_L > 0.0 && R_dot_V > 0.0) {{
-                float specFact = pow(R_dot_V, {_material}.highlight);
-                i_specular = {_material}.specular * specFact * {_light}[i].color;
-            }}
-            
-            float f_radial = 1.0;
-            if ({_light}[i].spotOn && !{_light}[i].infiniteOn){{
-                float dist = length({_light}[i].position - vPos);
-                float a = {_light}[i].spotRadialFactor[0];
-                float b = {_light}[i].spotRadialFactor[1];
-                float c = {_light}[i].spotRadialFactor[2];
-                f_radial = 1.0 / (a + b * dist + c * dist * dist);
-            }}
-            float f_angular = 1.0;
-            if ({_light}[i].spotOn){{
-                // unlikely L, vObj3 should always be vector from position to render point.
-                vec3 vObj = normalize({_light}[i].position - vPos);
-                float cos_angle = dot(vObj, normalize({_light}[i].spotDirection));
-                if (cos_angle > {_light}[i].spotAngleLimit) {{
-                    f_angular = pow(cos_angle, {_light}[i].spotExpAttenuation);
-                }} else {{
-                    f_angular = 0.0;
-                }}
+        }} else {{
+            for (int i = 0; i < lightCount; i += 1){{
+                iSum += shadeLight(fetchLight(i), compNormal);
             }}
-            
-            iSum += f_radial * f_angular * (i_diffuse + i_specular);
         }}
         // avoid the result is out of bounds
         iSum = min(iSum, vec4(1.0));
@@ -333,19 +562,19 @@ void main()
     }}
     
     // Reserved for rendering with vertex color, routing name is "vertex"
-    if ((renderingFlag >> 1 & 0x1) == 1){{
+    if (ROUTING_ON(1)){{
         results[ri] = vec4(vColor, 1.0);
         ri+=1;
     }}
     
     // Reserved for rendering with fixed color, routing name is "pure"
-    if ((renderingFlag >> 2 & 0x1) == 1){{
+    if (ROUTING_ON(2)){{
         results[ri] = vec4(0, 0, 0, 1.0);
         ri+=1;
     }}
     
     // Reserved for normal rendering, routing name is "normal"
-    if ((renderingFlag >> 3 & 0x1) == 1){{
+    if (ROUTING_ON(3)){{
     
         ////////// Set Normal Rendering
         // Requirements:
@@ -360,7 +589,7 @@ void main()
     }}
     
     // Reserved for artist rendering, routing name is "artist"
-    if ((renderingFlag >> 5 & 0x1) == 1){{
+    if (ROUTING_ON(5)){{
     
         ////////// BONUS 8: Artist Rendering (advanced)
         // Requirements:
@@ -373,7 +602,7 @@ void main()
     }}
     
     // Reserved for some customized rendering, routing name is "custom"
-    if ((renderingFlag >> 6 & 0x1) == 1){{
+    if (ROUTING_ON(6)){{
         results[ri] = vec4(0.5, 0.5, 0.5, 1.0);
         ri+=1;
     }}
@@ -397,6 +626,45 @@ void main()
         #     f.write(fss)
         return fss
 
+    def genSources(self):
+        """
+        The vertex and fragment shader sources, from the templates in templateDir when it is set
+        """
+        if self.templateDir is None:
+            return self.genVertexShaderSource(), self.genFragShaderSource()
+        return self.fillTemplate(VERTEX_TEMPLATE), self.fillTemplate(FRAGMENT_TEMPLATE)
+
+    def fillTemplate(self, fileName: str) -> str:
+        """
+        A template is GLSL where ${key} stands for attribs[key], ${frameBlockSource} for genFrameBlockSource
+        and ${routingSource} for genRoutingSource
+        """
+        with open(os.path.join(self.templateDir, fileName)) as f:
+            template = string.Template(f.read())
+        return template.substitute(self.attribs, frameBlockSource=self.genFrameBlockSource(),
+                                   routingSource=self.genRoutingSource())
+
+    def templateSources(self):
+        """
+        The built-in sources turned into templates for fillTemplate
+        """
+        template = GLProgram.__new__(GLProgram)
+        template.attribs = {key: "${" + key + "}" for key in self.attribs}
+        template.genFrameBlockSource = lambda: "${frameBlockSource}"
+        template.genRoutingSource = lambda: "${routingSource}"
+        return template.genVertexShaderSource(), template.genFragShaderSource()
+
+    def exportTemplates(self, directory: str):
+        """
+        Write the built-in sources as templates to directory, a template which is already there is kept
+        """
+        os.makedirs(directory, exist_ok=True)
+        for fileName, source in zip((VERTEX_TEMPLATE, FRAGMENT_TEMPLATE), self.templateSources()):
+            path = os.path.join(directory, fileName)
+            if not os.path.exists(path):
+                with open(path, "w") as f:
+                    f.write(source)
+
     def set_vss(self, vss: str):
         if not isinstance(vss, str):
             raise TypeError("Vertex shader source code must be a string")
@@ -409,25 +677,82 @@ void main()
 
     def getAttribLocation(self, name):
         programName = self.getAttribName(name)
-        attribLoc = gl.glGetAttribLocation(self.program, programName)
+        attribLoc = self.attribLocations.get(programName, -1)
         if attribLoc == -1 and self.debug > 1:
             print(f"Warning: Attrib {name} cannot found. Might have been optimized off")
         return attribLoc
 
     def getUniformLocation(self, name, lookThroughAttribs=True):
+        """
+        :param name: a key of attribs, a GLSL name if lookThroughAttribs is False, or a location from
+                     uniformHandle, which is returned as is
+        """
+        if isinstance(name, int):
+            return name
         if lookThroughAttribs:
-            variableName = self.getAttribName(name)
+            uniformLoc = self.handles.get(name, -1)
         else:
-            variableName = name
-        uniformLoc = gl.glGetUniformLocation(self.program, variableName)
+            uniformLoc = self.uniformLocations.get(name, -1)
         if uniformLoc == -1 and self.debug > 1:
             print(f"Warning: Uniform {name} cannot found. Might have been optimized off")
         return uniformLoc
 
+    def uniformHandle(self, name, lookThroughAttribs=True) -> int:
+        """
+        The location of a uniform, which every setter accepts in place of its name
+        """
+        return self.getUniformLocation(name, lookThroughAttribs)
+
+    def buildLocationTable(self):
+        """
+        Enumerate the active uniforms and attributes of the linked program once.
+        Array uniforms are reported by their first element, GL doesn't promise the others follow it in location,
+        so every element is looked up by name
+        """
+        self.uniformLocations = {}
+        self.uniformTypes = {}
+        for i in range(int(gl.glGetProgramiv(self.program, gl.GL_ACTIVE_UNIFORMS))):
+            name, size, uniformType = gl.glGetActiveUniform(self.program, i)
+            name = name.decode() if isinstance(name, bytes) else name
+            location = gl.glGetUniformLocation(self.program, name)
+            if location == -1:
+                # a member of a uniform block, set through its buffer
+                continue
+            self.uniformLocations[name] = location
+            self.uniformTypes[name] = uniformType
+            if name.endswith("[0]"):
+                base = name[:-3]
+                for k in range(1, int(size)):
+                    self.uniformLocations[f"{base}[{k}]"] = gl.glGetUniformLocation(self.program, f"{base}[{k}]")
+                    self.uniformTypes[f"{base}[{k}]"] = uniformType
+                self.uniformLocations[base] = location
+
+        self.attribLocations = {}
+        for i in range(int(gl.glGetProgramiv(self.program, gl.GL_ACTIVE_ATTRIBUTES))):
+            name, _, _ = gl.glGetActiveAttrib(self.program, i)
+            name = name.decode() if isinstance(name, bytes) else name
+            self.attribLocations[name] = gl.glGetAttribLocation(self.program, name)
+
+        self.handles = {key: self.uniformLocations[name] for key, name in self.attribs.items()
+                        if name in self.uniformLocations}
+
     def getAttribName(self, attribIndexName):
         return self.attribs[attribIndexName]
 
     def compile(self, vs_src=None, fs_src=None) -> None:
+        """
+        Compile and link the program, and wait until it is ready
+        """
+        if self.beginCompile(vs_src, fs_src):
+            self.finishCompile()
+
+    def beginCompile(self, vs_src=None, fs_src=None) -> bool:
+        """
+        Hand the sources to the driver without waiting for the result, then call pollCompile once per frame.
+        A program found in ProgramBinaryCache is ready at once.
+
+        :return: True if the compile is pending
+        """
         if vs_src:
             self.set_vss(vs_src)
         else:
@@ -441,21 +766,143 @@ void main()
         if not (vs_src and fs_src):
             raise Exception("shader source code missing")
 
-        vs = self.load_shader(vs_src, gl.GL_VERTEX_SHADER)
+        self.compileStart = time.perf_counter()
+        key = programBinaryCache.key(vs_src, fs_src, self.attribBindings) if self.binaryCacheOn else None
+        self.fromBinaryCache = key is not None and programBinaryCache.load(self.program, key)
+        if self.fromBinaryCache:
+            self.linked()
+            return False
+
+        vs = self.load_shader(vs_src, gl.GL_VERTEX_SHADER, checkStatus=False)
         if not vs:
-            return
-        fs = self.load_shader(fs_src, gl.GL_FRAGMENT_SHADER)
+            return False
+        fs = self.load_shader(fs_src, gl.GL_FRAGMENT_SHADER, checkStatus=False)
         if not fs:
-            return
+            return False
         gl.glAttachShader(self.program, vs)
         gl.glAttachShader(self.program, fs)
+        for name, location in self.attribBindings.items():
+            gl.glBindAttribLocation(self.program, location, self.getAttribName(name))
+        if key is not None:
+            programBinaryCache.prepare(self.program)
         gl.glLinkProgram(self.program)
+        self.pendingCompile = (vs, fs, key)
+        self.pendingFrames = 0
+        return True
+
+    def pollCompile(self, completionStatusOn: bool = False) -> bool:
+        """
+        Finish a pending compile if the driver is done with it, without blocking
+
+        :param completionStatusOn: the driver has GL_KHR_parallel_shader_compile or GL_ARB_parallel_shader_compile.
+                                   Otherwise the link status is only asked for after deferFrames calls, when a
+                                   driver compiling on its own thread should be done
+        :return: whether the program is ready
+        """
+        if self.pendingCompile is None:
+            return self.ready
+        self.pendingFrames += 1
+        if completionStatusOn:
+            # PyOpenGL doesn't know the output size of GL_COMPLETION_STATUS, so pass the array ourselves
+            status = np.zeros(1, dtype=np.int32)
+            gl.glGetProgramiv(self.program, GL_COMPLETION_STATUS, status)
+            if not status[0]:
+                return False
+        elif self.pendingFrames < self.deferFrames:
+            return False
+        self.finishCompile()
+        return True
+
+    def finishCompile(self):
+        """
+        Wait for the pending compile, raise if it failed
+        """
+        vs, fs, key = self.pendingCompile
+        self.pendingCompile = None
+        self.checkShader(vs)
+        self.checkShader(fs)
         error = gl.glGetProgramiv(self.program, gl.GL_LINK_STATUS)
         if error != gl.GL_TRUE:
             info = gl.glGetShaderInfoLog(self.program)
             raise Exception(info)
+        if key is not None:
+            programBinaryCache.store(self.program, key)
+        self.linked()
 
+    def linked(self):
+        self.compileSeconds = time.perf_counter() - self.compileStart
+        programBinaryCache.record(self.fromBinaryCache, self.compileSeconds)
+
+        # linking resets every uniform to zero
+        self.uniformCache = {}
+        self.buildLocationTable()
+        self.bindUniformBlock("clusterBlock", lightClusters.binding)
+        self.bindUniformBlock("frameBlock", frameConstants.binding)
         self.ready = True
+        # the buffer textures have units of their own, the other samplers never use them
+        self.setInt("lightData", lightBuffer.unit)
+        self.setInt("clusterData", lightClusters.clusters.unit)
+        self.setInt("clusterLights", lightClusters.lights.unit)
+
+    def swapSources(self, vs_src: str, fs_src: str):
+        """
+        Relink with new sources while the program is in use. The new program is linked under a new GL name,
+        so a compile error raises and leaves the current program as it was. Uniforms keep their values
+        """
+        values = self.uniformValues()
+        oldProgram, oldSources = self.program, (self.vertexShaderSource, self.fragmentShaderSource)
+        self.program = gl.glCreateProgram()
+        try:
+            self.compile(vs_src, fs_src)
+        except Exception:
+            gl.glDeleteProgram(self.program)
+            self.program = oldProgram
+            self.vertexShaderSource, self.fragmentShaderSource = oldSources
+            raise
+        gl.glDeleteProgram(oldProgram)
+        glState.deleted(program=oldProgram)
+        self.restoreUniformValues(values)
+
+    def uniformValues(self) -> dict:
+        """
+        Read back every uniform outside the uniform blocks, GLSL name -> (GL type, value)
+        """
+        values = {}
+        for name, location in self.uniformLocations.items():
+            uniformType = self.uniformTypes.get(name)
+            if uniformType not in UNIFORM_RESTORE or name + "[0]" in self.uniformLocations:
+                continue
+            components, integer, _ = UNIFORM_RESTORE[uniformType]
+            value = np.zeros(components, dtype=np.int32 if integer else np.float32)
+            if integer:
+                gl.glGetUniformiv(self.program, location, value)
+            else:
+                gl.glGetUniformfv(self.program, location, value)
+            values[name] = (uniformType, value)
+        return values
+
+    def restoreUniformValues(self, values: dict):
+        """
+        Upload the values of uniformValues to the uniforms which still exist with the same type
+        """
+        self.use()
+        for name, (uniformType, value) in values.items():
+            if self.uniformTypes.get(name) != uniformType:
+                continue
+            location = self.uniformLocations[name]
+            UNIFORM_RESTORE[uniformType][2](location, value)
+            self.uniformCache[location] = np.asarray(value).tobytes()
+
+    def bindUniformBlock(self, name, binding: int):
+        """
+        Read the uniform block name from the buffer bound to binding with glBindBufferBase
+        """
+        blockIndex = gl.glGetUniformBlockIndex(self.program, self.getAttribName(name))
+        if blockIndex == gl.GL_INVALID_INDEX:
+            if self.debug > 1:
+                print(f"Warning: Uniform block {name} cannot found. Might have been optimized off")
+            return
+        gl.glUniformBlockBinding(self.program, blockIndex, binding)
 
     def setFragmentShaderRouting(self, routing="lighting"):
         """
@@ -469,6 +916,14 @@ void main()
         "custom": some customized rendering
         "texture": this must use previous routing, if set to true, then mix color with texture
         """
+        self.use()
+        self.setInt("renderingFlag", self.routingFlagsOf(routing), lookThroughAttribs=False)
+
+    @staticmethod
+    def routingFlagsOf(routing) -> int:
+        """
+        The renderingFlag bits of a routing name, see setFragmentShaderRouting
+        """
         renderingFlag = 0
         if isinstance(routing, str):
             routing = routing.lower()
@@ -488,9 +943,7 @@ void main()
                 renderingFlag = renderingFlag | (0x1 << 6)
             if "texture" in routing:
                 renderingFlag = renderingFlag | (0x1 << 8)
-
-        self.use()
-        self.setInt("renderingFlag", renderingFlag, lookThroughAttribs=False)
+        return renderingFlag
 
     def use(self):
         """
@@ -498,79 +951,114 @@ void main()
         """
         if not self.ready:
             raise Exception("GLProgram must compile before use it")
-        gl.glUseProgram(self.program)
+        glState.useProgram(self.program)
 
     def setLight(self, lightIndex: int, light: Light):
         if not isinstance(light, Light):
             raise TypeError("light type must be Light")
 
-        _light = self.attribs["light"]
-        self.setBool(f"{_light}[{lightIndex}].on", light.enabled, False)
-        self.setVec3(f"{_light}[{lightIndex}].position", light.position, False)
-        self.setVec4(f"{_light}[{lightIndex}].color", light.color, False)
-        self.setBool(f"{_light}[{lightIndex}].infiniteOn", light.infiniteOn, False)
-        self.setVec3(f"{_light}[{lightIndex}].infiniteDirection", light.position, False)
-        self.setBool(f"{_light}[{lightIndex}].spotOn", light.spotOn, False)
-        self.setVec3(f"{_light}[{lightIndex}].spotDirection", light.spotDirection, False)
-        self.setVec3(f"{_light}[{lightIndex}].spotRadialFactor", light.spotRadialFactor, False)
-        self.setFloat(f"{_light}[{lightIndex}].spotAngleLimit", light.spotAngleLimit, False)
-        self.setFloat(f"{_light}[{lightIndex}].spotExpAttenuation", light.spotExpAttenuation, False)
+        lightBuffer.setLight(lightIndex, light)
+
+    def setLights(self, lights):
+        """
+        Set lights from index 0 and turn off the others, with a single upload
+        """
+        for light in lights:
+            if not isinstance(light, Light):
+                raise TypeError("light type must be Light")
+        lightBuffer.setLights(lights)
 
     def clearAllLights(self):
-        maxLightsNum = int(self.attribs["maxLightsNum"])
-        light = Light()
-        for i in range(maxLightsNum):
-            self.setLight(i, light)
+        lightBuffer.clear()
+
+    def uniformChanged(self, location, value) -> bool:
+        """
+        Compare value with the last value uploaded to location and remember it.
+        Return False when they are the same and the upload can be skipped
+        """
+        if not self.uniformCacheOn or location == -1:
+            return True
+        data = np.asarray(value).tobytes()
+        if self.uniformCache.get(location) == data:
+            self.uniformCacheHits += 1
+            return False
+        self.uniformCache[location] = data
+        self.uniformCacheMisses += 1
+        return True
+
+    def uniformCacheStats(self) -> dict:
+        return {"hits": self.uniformCacheHits, "misses": self.uniformCacheMisses}
 
     # some help methods to set uniform in program
     def setMat4(self, name, mat, lookThroughAttribs=True):
         self.use()
         if mat.shape != (4, 4):
             raise Exception("Projection Matrix must have 4x4 shape")
-        gl.glUniformMatrix4fv(self.getUniformLocation(name, lookThroughAttribs), 1, gl.GL_FALSE, mat.flatten("C"))
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        value = mat.flatten("C")
+        if self.uniformChanged(location, value):
+            gl.glUniformMatrix4fv(location, 1, gl.GL_FALSE, value)
 
     def setMat3(self, name, mat, lookThroughAttribs=True):
         self.use()
         if mat.shape != (3, 3):
             raise Exception("Projection Matrix must have 3x3 shape")
-        gl.glUniformMatrix3fv(self.getUniformLocation(name, lookThroughAttribs), 1, gl.GL_FALSE, mat.flatten("C"))
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        value = mat.flatten("C")
+        if self.uniformChanged(location, value):
+            gl.glUniformMatrix3fv(location, 1, gl.GL_FALSE, value)
 
     def setMat2(self, name, mat, lookThroughAttribs=True):
         self.use()
         if mat.shape != (2, 2):
             raise Exception("Projection Matrix must have 2x2 shape")
-        gl.glUniformMatrix2fv(self.getUniformLocation(name, lookThroughAttribs), 1, gl.GL_FALSE, mat.flatten("C"))
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        value = mat.flatten("C")
+        if self.uniformChanged(location, value):
+            gl.glUniformMatrix2fv(location, 1, gl.GL_FALSE, value)
 
     def setVec4(self, name, vec, lookThroughAttribs=True):
         self.use()
         if vec.size != 4:
             raise Exception("Vector must have size 4")
-        gl.glUniform4fv(self.getUniformLocation(name, lookThroughAttribs), 1, vec)
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        if self.uniformChanged(location, vec):
+            gl.glUniform4fv(location, 1, vec)
 
     def setVec3(self, name, vec, lookThroughAttribs=True):
         self.use()
         if vec.size != 3:
             raise Exception("Vector must have size 3")
-        gl.glUniform3fv(self.getUniformLocation(name, lookThroughAttribs), 1, vec)
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        if self.uniformChanged(location, vec):
+            gl.glUniform3fv(location, 1, vec)
 
     def setVec2(self, name, vec, lookThroughAttribs=True):
         self.use()
         if vec.size != 2:
             raise Exception("Vector must have size 2")
-        gl.glUniform2fv(self.getUniformLocation(name, lookThroughAttribs), 1, vec)
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        if self.uniformChanged(location, vec):
+            gl.glUniform2fv(location, 1, vec)
 
     def setBool(self, name, value, lookThroughAttribs=True):
         self.use()
         if value not in (0, 1):
             raise Exception("bool only accept True/False/0/1")
-        gl.glUniform1i(self.getUniformLocation(name, lookThroughAttribs), int(value))
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        if self.uniformChanged(location, int(value)):
+            gl.glUniform1i(location, int(value))
 
     def setInt(self, name, value, lookThroughAttribs=True):
         self.use()
         if value != int(value):
             raise Exception("set int only accept  integer")
-        gl.glUniform1i(self.getUniformLocation(name, lookThroughAttribs), int(value))
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        if self.uniformChanged(location, int(value)):
+            gl.glUniform1i(location, int(value))
 
     def setFloat(self, name, value, lookThroughAttribs=True):
         self.use()
-        gl.glUniform1f(self.getUniformLocation(name, lookThroughAttribs), float(value))
+        location = self.getUniformLocation(name, lookThroughAttribs)
+        if self.uniformChanged(location, float(value)):
+            gl.glUniform1f(location, float(value))
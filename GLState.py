@@ -0,0 +1,111 @@
+"""
+A process-wide shadow of the GL binding state, so binding what is already bound costs no GL call.
+
+It tracks the current program, the vertex array, the active texture unit and the texture bound to every unit.
+Every bind in the code base goes through it, raw binds elsewhere would make it stale.
+"""
+from typing import Dict
+
+try:
+    import OpenGL
+
+    try:
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+    except ImportError:
+        from ctypes import util
+
+        orig_util_find_library = util.find_library
+
+
+        def new_util_find_library(name):
+            res = orig_util_find_library(name)
+            if res:
+                return res
+            return '/System/Library/Frameworks/' + name + '.framework/' + name
+
+
+        util.find_library = new_util_find_library
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+except ImportError:
+    raise ImportError("Required dependency PyOpenGL not present")
+
+
+class GLState:
+    program = None
+    vertexArray = None
+    activeUnit = None
+    textures: Dict[int, int] = None  # texture unit -> texture bound to it
+
+    issued: Dict[str, int] = None  # GL calls made, per kind
+    avoided: Dict[str, int] = None  # GL calls skipped because the binding was already current
+
+    def __init__(self):
+        self.textures = {}
+        self.resetStats()
+
+    def resetStats(self):
+        self.issued = {"program": 0, "vertexArray": 0, "activeTexture": 0, "texture": 0}
+        self.avoided = dict(self.issued)
+
+    def invalidate(self):
+        """
+        Forget every binding without any GL call. Call this when the GL context is recreated
+        """
+        self.program = None
+        self.vertexArray = None
+        self.activeUnit = None
+        self.textures = {}
+
+    def _changed(self, kind: str, current, value) -> bool:
+        if current == value:
+            self.avoided[kind] += 1
+            return False
+        self.issued[kind] += 1
+        return True
+
+    def useProgram(self, program: int):
+        if self._changed("program", self.program, program):
+            gl.glUseProgram(program)
+            self.program = program
+
+    def bindVertexArray(self, vertexArray: int):
+        if self._changed("vertexArray", self.vertexArray, vertexArray):
+            gl.glBindVertexArray(vertexArray)
+            self.vertexArray = vertexArray
+
+    def activeTexture(self, unit: int):
+        if self._changed("activeTexture", self.activeUnit, unit):
+            gl.glActiveTexture(gl.GL_TEXTURE0 + unit)
+            self.activeUnit = unit
+
+    def bindTexture(self, unit: int, texture: int, target: int = gl.GL_TEXTURE_2D):
+        """
+        Bind texture to target of unit, the active unit only changes if the binding does.
+        A unit is only ever used with one target, the buffer textures have units of their own
+        """
+        if self._changed("texture", self.textures.get(unit), texture):
+            self.activeTexture(unit)
+            gl.glBindTexture(target, texture)
+            self.textures[unit] = texture
+
+    def deleted(self, program: int = None, vertexArray: int = None):
+        """
+        Forget the bindings of deleted objects, so a new object reusing the name gets bound again
+        """
+        if program is not None and self.program == program:
+            self.program = None
+        if vertexArray is not None and self.vertexArray == vertexArray:
+            self.vertexArray = None
+
+    def stats(self) -> dict:
+        return {
+            "issued": sum(self.issued.values()),
+            "avoided": sum(self.avoided.values()),
+            **{kind + "Avoided": n for kind, n in self.avoided.items()},
+        }
+
+
+# The process-wide instance, there is a single GL context
+glState = GLState()
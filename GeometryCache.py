@@ -0,0 +1,89 @@
+"""
+A process-wide cache of GPU meshes, so identical Displayable objects share one VAO/VBO/EBO.
+
+Meshes are keyed by the shader program, the vertex format, the Displayable type and its generation parameters.
+Every acquire must be paired with a release; a mesh's buffers are deleted once nobody uses it anymore.
+"""
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from GLBuffer import GLMesh
+from VertexFormat import VertexFormat, STANDARD
+from MeshOptimizer import optimizeIndices
+
+
+class GeometryCache:
+    meshes: Dict[Hashable, GLMesh] = None
+
+    hits = 0
+    misses = 0
+
+    def __init__(self):
+        self.meshes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, shaderProg, key: Optional[Hashable],
+                build: Callable[[], Tuple[np.ndarray, np.ndarray, dict]],
+                vertexFormat: VertexFormat = STANDARD) -> GLMesh:
+        """
+        Get the mesh stored under key, or create it.
+
+        :param shaderProg: the GLProgram the mesh attributes are bound to
+        :param key: identify the mesh for this shaderProg. If it is None, the mesh will never be shared
+        :param build: called on cache miss only, returns vertices, indices and the generation parameters.
+                      The indices are optimized with MeshOptimizer before the mesh is created
+        :param vertexFormat: how the vertices are stored in the VBO
+        :return: the shared mesh, its reference count already includes the caller
+        """
+        cacheKey = None if key is None else (shaderProg, vertexFormat.name, key)
+        mesh = self.meshes.get(cacheKey) if cacheKey is not None else None
+        if mesh is None:
+            self.misses += 1
+            vertices, indices, parameters = build()
+            # drop the degenerate triangles and reorder the rest for the vertex cache, once per shared mesh
+            indices = optimizeIndices(vertices, indices)
+            mesh = GLMesh(shaderProg, vertices, indices, vertexFormat)
+            mesh.parameters = parameters
+            # unshared meshes are still tracked, so invalidate can reach them
+            mesh.key = cacheKey if cacheKey is not None else ("unshared", id(mesh))
+            self.meshes[mesh.key] = mesh
+        else:
+            self.hits += 1
+
+        mesh.refCount += 1
+        return mesh
+
+    def release(self, mesh: GLMesh):
+        """
+        Drop one reference to the mesh, its GL buffers are deleted when the last reference is gone
+        """
+        mesh.refCount -= 1
+        if mesh.refCount > 0:
+            return
+        if self.meshes.get(mesh.key) is mesh:
+            del self.meshes[mesh.key]
+        mesh.delete()
+
+    def invalidate(self):
+        """
+        Forget every mesh without any GL call. Call this when the GL context is recreated,
+        since the old buffer names mean nothing in the new context.
+        """
+        for mesh in self.meshes.values():
+            mesh.valid = False
+        self.meshes.clear()
+
+    def stats(self) -> dict:
+        return {
+            "meshes": len(self.meshes),
+            "uploaded": sum(1 for m in self.meshes.values() if m.uploaded),
+            "references": sum(m.refCount for m in self.meshes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# The process-wide instance shared by all Displayable objects
+geometryCache = GeometryCache()
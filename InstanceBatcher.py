@@ -0,0 +1,73 @@
+"""
+Draw Components which share a mesh, a material, a routing and textures with one glDrawElementsInstanced call.
+
+The per Component values, model matrix, normal matrix and base color, go to a per-instance attribute buffer
+instead of uniforms, see GLMesh.drawInstanced. Everything else is set once per batch.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from Component import Component
+from GLBuffer import GLMesh
+from RenderContext import RenderContext
+
+
+class InstanceBatcher:
+    # groups smaller than this are drawn one by one, an instanced draw of 1 saves nothing
+    minInstances = 2
+
+    def draw(self, components: List[Component], shaderProg, context: Optional[RenderContext] = None):
+        """
+        Draw components, grouped by Component.batchKey at their current level of detail
+        """
+        for members, level in self.group(components, context):
+            if len(members) < self.minInstances:
+                for c in members:
+                    c.drawSelf(shaderProg, context)
+            else:
+                members[0].setSharedUniforms(shaderProg)
+                self.drawInstanced(members, level, shaderProg, context)
+
+    @staticmethod
+    def group(components: List[Component], context: Optional[RenderContext] = None) -> List[Tuple[List[Component], int]]:
+        """
+        Split components by Component.batchKey
+
+        :return: the Components of every group, with the level of detail they share
+        """
+        groups = {}
+        for c in components:
+            level = c.selectLodLevel(context) if context is not None else 0
+            groups.setdefault(c.batchKey(level), ([], level))[0].append(c)
+        return list(groups.values())
+
+    def drawInstanced(self, members: List[Component], level: int, shaderProg, context: Optional[RenderContext] = None):
+        """
+        Draw members with one call, the shared uniforms of members[0] must already be set
+        """
+        shaderProg.setBool("instanced", True)
+        mesh = members[0].displayObj.lodMesh(level)
+        mesh.drawInstanced(self.instanceData(members))
+        shaderProg.setBool("instanced", False)
+
+        if context is not None:
+            context.count("drawn", len(members))
+            context.count("instancedDraws")
+            context.count("instances", len(members))
+            context.count("triangles", len(members) * (mesh.indices.size // 3))
+
+    @staticmethod
+    def instanceData(components: List[Component]) -> np.ndarray:
+        """
+        One row per Component, in the layout of GLMesh.drawInstanced
+        """
+        data = np.zeros((len(components), GLMesh.INSTANCE_ATTRIB_SIZE), dtype=np.float32)
+        data[:, 0:16] = [c.transformationMat.ravel() for c in components]
+        data[:, 16:25] = [c.normalMat.ravel() for c in components]
+        for row, c in zip(data, components):
+            instanceColorOn, color = c.instanceColor()
+            if instanceColorOn:
+                row[25:28] = tuple(color)
+                row[28] = 1.0
+        return data
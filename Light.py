@@ -28,6 +28,10 @@ class Light:
     spotAngleLimit: Union[float, int]
     spotExpAttenuation: Union[float, int]
 
+    # distance where a point or spot light has faded out, 0 lights everything. LightClusters only bins the lights
+    # with a range into the clusters they reach, the others are in every cluster
+    range: float = 0.0
+
     def __init__(self,
                  position: Union[np.ndarray, Point, None] = None,
                  color: Optional[np.ndarray] = None,
@@ -35,7 +39,8 @@ class Light:
                  spotDirection: Union[np.ndarray, Point, None] = None,
                  spotRadialFactor: Optional[np.ndarray] = None,
                  spotAngleLimit: Union[float] = 0,
-                 spotExpAttenuation: Union[float, int] = 1.0):
+                 spotExpAttenuation: Union[float, int] = 1.0,
+                 range: Union[float, int] = 0):
         # set basic light
         if position is not None:
             self.setPosition(position)
@@ -65,6 +70,7 @@ class Light:
             self.spotRadialFactor = np.array((0, 0, 0))
         self.setSpotAngleLimit(spotAngleLimit)
         self.setSpotExpAttenuation(spotExpAttenuation)
+        self.setRange(range)
 
     def __repr__(self):
         return f"pos: {self.position}, color:{self.color},\
@@ -115,6 +121,11 @@ class Light:
             raise TypeError("spotExpAttenuation must be a int/float")
         self.spotExpAttenuation = spotExpAttenuation
 
+    def setRange(self, range: typing.Union[float, int]):
+        if type(range) not in (int, float) or range < 0:
+            raise TypeError("range must be a non negative int/float")
+        self.range = range
+
     def setSpotDirection(self, spotDirection: Union[np.ndarray, Point]):
         if (not isinstance(spotDirection, np.ndarray)) and (not isinstance(spotDirection, Point)):
             raise TypeError("spotDirection must be ndarray/Point")
@@ -0,0 +1,78 @@
+"""
+The lights of the scene, stored in a texture buffer read by the fragment shader with texelFetch.
+
+The CPU copy is a numpy structured array whose item is 8 RGBA32F texels, so a light is written in place and
+one glBufferSubData uploads one light or all of them. Bools are stored as 0.0 or 1.0, see fetchLight in
+GLProgram. There is no fixed maximum, the buffer grows with the lights.
+Every program samples the same buffer texture on LIGHT_DATA_UNIT.
+"""
+from typing import List
+
+import numpy as np
+
+try:
+    import OpenGL.GL as gl
+except ImportError:
+    raise ImportError("Required dependency PyOpenGL not present")
+
+from Light import Light
+from TextureBuffer import TextureBuffer
+
+# the texels of a light: on | position | color | infiniteOn | infiniteDirection, spotOn | spotDirection |
+# spotRadialFactor, spotAngleLimit | spotExpAttenuation, range
+LIGHT_DTYPE = np.dtype({
+    "names": ["on", "position", "color", "infiniteOn", "infiniteDirection", "spotOn", "spotDirection",
+              "spotRadialFactor", "spotAngleLimit", "spotExpAttenuation", "range"],
+    "formats": ["<f4", ("<f4", 3), ("<f4", 4), "<f4", ("<f4", 3), "<f4", ("<f4", 3), ("<f4", 3), "<f4", "<f4",
+                "<f4"],
+    "offsets": [0, 16, 32, 48, 64, 76, 80, 96, 108, 112, 116],
+    "itemsize": 128,
+})
+
+LIGHT_DATA_UNIT = 13
+
+
+class LightBuffer(TextureBuffer):
+    count = 0  # lights in use, from index 0
+
+    def __init__(self, capacity: int = 32):
+        super().__init__(np.zeros(capacity, dtype=LIGHT_DTYPE), gl.GL_RGBA32F, LIGHT_DATA_UNIT)
+
+    @staticmethod
+    def write(item, light: Light):
+        item["on"] = light.enabled
+        item["position"] = light.position
+        item["color"] = light.color
+        item["infiniteOn"] = light.infiniteOn
+        # the shader reads the direction of an infinite light from its position
+        item["infiniteDirection"] = light.position
+        item["spotOn"] = light.spotOn
+        item["spotDirection"] = light.spotDirection
+        item["spotRadialFactor"] = light.spotRadialFactor
+        item["spotAngleLimit"] = light.spotAngleLimit
+        item["spotExpAttenuation"] = light.spotExpAttenuation
+        item["range"] = light.range
+
+    def setLight(self, index: int, light: Light):
+        self.resize(index + 1)
+        self.write(self.data[index:index + 1], light)
+        self.count = max(self.count, index + 1)
+        self.upload(index, index + 1)
+
+    def setLights(self, lights: List[Light]):
+        """
+        Store lights from index 0 and drop the others, with one upload
+        """
+        self.resize(len(lights))
+        self.data[:] = np.zeros(1, dtype=LIGHT_DTYPE)
+        for i, light in enumerate(lights):
+            self.write(self.data[i:i + 1], light)
+        self.count = len(lights)
+        self.upload()
+
+    def clear(self):
+        self.setLights([])
+
+
+# The process-wide instance, sampled on LIGHT_DATA_UNIT by every GLProgram
+lightBuffer = LightBuffer()
@@ -0,0 +1,169 @@
+"""
+Clustered forward lighting: every frame the lights are binned into a grid of view space froxels, so a fragment
+only shades the lights which can reach its cluster.
+
+The grid splits the screen into tiles and the view depth into slices growing exponentially between near and
+far. A light with a range is bounded by a sphere: its depth gives a slice range, and the projection of its view
+space box a tile range, every cluster in between gets the light. A light without a range, or an infinite one,
+lights every cluster. The binning is vectorized over all the lights with numpy.
+
+Two buffer textures hold the result: clusterData is the offset and count of every cluster in clusterLights,
+clusterLights the light indices of the clusters one after the other. ClusterBlock carries the grid and the
+light count; with clustering off the fragment shader loops over every light instead.
+"""
+from typing import Tuple
+
+import numpy as np
+
+try:
+    import OpenGL.GL as gl
+except ImportError:
+    raise ImportError("Required dependency PyOpenGL not present")
+
+from LightBuffer import LightBuffer
+from TextureBuffer import TextureBuffer
+from UniformBuffer import UniformBuffer
+
+# ClusterBlock in std140, the light count is packed after the ivec3
+CLUSTER_DTYPE = np.dtype({
+    "names": ["grid", "lightCount", "depth", "viewportSize", "clusteredOn"],
+    "formats": [("<i4", 3), "<i4", ("<f4", 4), ("<f4", 2), "<i4"],
+    "offsets": [0, 12, 16, 32, 40],
+    "itemsize": 48,
+})
+
+CLUSTER_BLOCK_BINDING = 2
+CLUSTER_DATA_UNIT = 14
+CLUSTER_LIGHTS_UNIT = 15
+
+
+class LightClusters(UniformBuffer):
+    gridSize = (16, 9, 24)  # tiles across, tiles up and depth slices
+    near = 0.1  # the first slice covers everything closer
+    far = 100.0  # the last slice covers everything further
+
+    clusters: TextureBuffer = None  # offset and count of every cluster in lights
+    lights: TextureBuffer = None  # light indices, cluster after cluster
+
+    binned = 0  # lights binned in the last frame
+    references = 0  # cluster light list entries in the last frame
+
+    def __init__(self, gridSize: Tuple[int, int, int] = (16, 9, 24)):
+        super().__init__(np.zeros(1, dtype=CLUSTER_DTYPE), CLUSTER_BLOCK_BINDING)
+        self.gridSize = gridSize
+        self.clusters = TextureBuffer(np.zeros((int(np.prod(gridSize)), 2), dtype=np.uint32), gl.GL_RG32UI,
+                                      CLUSTER_DATA_UNIT)
+        self.lights = TextureBuffer(np.zeros(64, dtype=np.uint32), gl.GL_R32UI, CLUSTER_LIGHTS_UNIT)
+
+    def update(self, lightBuffer: LightBuffer, viewMat: np.ndarray, perspMat: np.ndarray, viewportSize,
+               clusteredOn: bool = True):
+        """
+        Bin the lights of lightBuffer for this camera and upload the clusters, call this once per frame
+        """
+        item = self.data[0:1]
+        item["grid"] = self.gridSize
+        item["lightCount"] = lightBuffer.count
+        item["depth"] = (self.near, self.far, self.gridSize[2] / np.log(self.far / self.near), 0.0)
+        item["viewportSize"] = viewportSize
+        item["clusteredOn"] = clusteredOn
+        self.upload()
+
+        if clusteredOn:
+            offsets, counts, indices = self.bin(lightBuffer.data[:lightBuffer.count], viewMat, perspMat)
+            self.clusters.data[:, 0] = offsets
+            self.clusters.data[:, 1] = counts
+            self.clusters.upload()
+            self.lights.resize(len(indices))
+            self.lights.data[:len(indices)] = indices
+            self.lights.upload(0, len(indices))
+            self.references = len(indices)
+        self.bind(lightBuffer)
+
+    def bind(self, lightBuffer: LightBuffer):
+        lightBuffer.bind()
+        # sampling a texture buffer which has never been uploaded is undefined, the first update creates them
+        if self.clusters.texture is not None:
+            self.clusters.bind()
+            self.lights.bind()
+
+    def bin(self, lights: np.ndarray, viewMat: np.ndarray, perspMat: np.ndarray):
+        """
+        :param lights: LIGHT_DTYPE items
+        :return: the offset and the count of every cluster, and the light indices of the clusters
+        """
+        gx, gy, gz = self.gridSize
+        on = lights["on"] != 0
+        radius = lights["range"].astype(np.float64)
+        local = on & (lights["infiniteOn"] == 0) & (radius > 0)
+
+        # view space centers, the camera looks down -z
+        centers = np.c_[lights["position"], np.ones(len(lights))] @ viewMat
+        depth = -centers[:, 2]
+        nearest = np.maximum(depth - radius, 1e-4)
+        furthest = depth + radius
+
+        # the slices between the nearest and the furthest point of the sphere
+        scale = gz / np.log(self.far / self.near)
+        k0 = self.slice(nearest, scale)
+        k1 = self.slice(furthest, scale)
+
+        # the projection of the view space box of the sphere, x / -z is extreme at the corners of the box
+        inverse = 1 / np.stack([nearest, np.maximum(furthest, 1e-4)])
+        tiles = []
+        for axis, count in ((0, gx), (1, gy)):
+            corners = perspMat[axis, axis] * np.stack([centers[:, axis] - radius, centers[:, axis] + radius])
+            ndc = corners[:, None, :] * inverse[None, :, :]
+            low, high = ndc.min(axis=(0, 1)), ndc.max(axis=(0, 1))
+            local &= (high > -1) & (low < 1)
+            tiles.append((np.clip(np.floor((low + 1) / 2 * count), 0, count - 1),
+                          np.clip(np.floor((high + 1) / 2 * count), 0, count - 1)))
+        local &= furthest > 0
+        (ix0, ix1), (iy0, iy1) = tiles
+
+        # the lights without a range are in every cluster
+        everywhere = on & ~((lights["infiniteOn"] == 0) & (radius > 0))
+        for low, high, count in ((ix0, ix1, gx), (iy0, iy1, gy), (k0, k1, gz)):
+            low[everywhere] = 0
+            high[everywhere] = count - 1
+
+        selected = np.flatnonzero(local | everywhere)
+        ix0, iy0, k0 = (a[selected].astype(np.int64) for a in (ix0, iy0, k0))
+        nx = ix1[selected].astype(np.int64) - ix0 + 1
+        ny = iy1[selected].astype(np.int64) - iy0 + 1
+        nz = k1[selected].astype(np.int64) - k0 + 1
+
+        # one entry per light and cluster of its box, the box is walked x first
+        sizes = nx * ny * nz
+        total = int(sizes.sum())
+        within = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        nxr, nyr = np.repeat(nx, sizes), np.repeat(ny, sizes)
+        dx = within % nxr
+        dy = within // nxr % nyr
+        dz = within // (nxr * nyr)
+        cluster = ((np.repeat(k0, sizes) + dz) * gy + np.repeat(iy0, sizes) + dy) * gx + np.repeat(ix0, sizes) + dx
+
+        # a stable sort keeps the lights of a cluster in index order
+        order = np.argsort(cluster, kind="stable")
+        indices = np.repeat(selected, sizes)[order].astype(np.uint32)
+        counts = np.bincount(cluster, minlength=gx * gy * gz)
+        self.binned = len(selected)
+        return np.cumsum(counts) - counts, counts, indices
+
+    def slice(self, depth: np.ndarray, scale: float) -> np.ndarray:
+        """
+        The depth slice of view depths, the same as clusterIndex in the fragment shader
+        """
+        return np.clip(np.floor(np.log(np.maximum(depth, self.near) / self.near) * scale), 0, self.gridSize[2] - 1)
+
+    def invalidate(self):
+        super().invalidate()
+        self.clusters.invalidate()
+        self.lights.invalidate()
+
+    def stats(self) -> dict:
+        return {"binned": self.binned, "references": self.references,
+                "clusters": int(np.prod(self.gridSize))}
+
+
+# The process-wide instance, bound to CLUSTER_BLOCK_BINDING for every GLProgram
+lightClusters = LightClusters()
@@ -0,0 +1,161 @@
+"""
+Post-generation passes over triangle index buffers.
+
+The parametric meshes duplicate their seam vertices for the texture coordinates and collapse whole rows
+into the poles, so the wrapped grids carry bands of zero-area triangles. These passes remove them and
+reorder the remaining triangles for the post-transform vertex cache, using Tipsify from
+Sander, Nehab and Barczak, "Fast Triangle Reordering for Vertex Locality and Reduced Overdraw", 2007.
+
+Vertices are never touched, so the passes can run after generate without changing the vertex buffer.
+"""
+from collections import deque
+
+import numpy as np
+
+# A typical post-transform cache size, the exact value matters little for Tipsify
+VERTEX_CACHE_SIZE = 16
+
+# Tipsify runs a Python loop over the triangles, bigger meshes keep their generation order
+TIPSIFY_MAX_TRIANGLES = 1 << 16
+
+
+def removeDegenerateTriangles(vertices: np.ndarray, indices: np.ndarray, tolerance: float = 1e-10) -> np.ndarray:
+    """
+    Drop the triangles with a repeated index, a zero area or the same vertices as an earlier triangle.
+    The order of the remaining triangles is kept.
+
+    :param vertices: the vertex array, the positions are the first 3 columns
+    :param indices: flattened triangle indices
+    :param tolerance: triangles with twice their area under tolerance * extent ** 2 are degenerate,
+                      extent being the size of the mesh bounding box
+    :return: the filtered indices, with the same dtype
+    """
+    triangles = indices.reshape((-1, 3))
+    if len(triangles) == 0:
+        return indices
+
+    keep = (triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & \
+           (triangles[:, 0] != triangles[:, 2])
+
+    positions = vertices[:, 0:3].astype(np.float64)
+    p0, p1, p2 = (positions[triangles[:, k]] for k in range(3))
+    doubleArea = np.linalg.norm(np.cross(p1 - p0, p2 - p0), axis=1)
+    extent = np.ptp(positions[triangles.ravel()], axis=0).max()
+    keep &= doubleArea > tolerance * extent ** 2
+
+    # the same three vertices drawn twice, whatever the winding, only the first one is kept
+    _, first = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+    unique = np.zeros(len(triangles), dtype=bool)
+    unique[first] = True
+    keep &= unique
+
+    return triangles[keep].ravel()
+
+
+def tipsify(indices: np.ndarray, vertexCount: int, cacheSize: int = VERTEX_CACHE_SIZE) -> np.ndarray:
+    """
+    Reorder the triangles for the post-transform vertex cache.
+    Triangles are emitted as fans around a vertex, the next fan vertex is the one which is still in the cache
+    and has the fewest triangles left.
+
+    :return: the reordered indices, with the same dtype
+    """
+    triangles = indices.reshape((-1, 3))
+    triangleCount = len(triangles)
+    if triangleCount == 0:
+        return indices
+
+    # vertex -> adjacent triangles, in CSR form
+    flat = triangles.ravel()
+    adjacency = (np.argsort(flat, kind="stable") // 3).tolist()
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(flat, minlength=vertexCount))]).tolist()
+    live = np.bincount(flat, minlength=vertexCount).tolist()
+    triangleList = triangles.tolist()
+
+    cacheTime = [0] * vertexCount
+    emitted = [False] * triangleCount
+    deadEnd = []
+    result = []
+    timeStamp = cacheSize + 1
+    cursor = 0
+
+    fanning = int(flat[0])
+    while fanning >= 0:
+        candidates = []
+        for t in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            result.append(t)
+            for v in triangleList[t]:
+                deadEnd.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if timeStamp - cacheTime[v] > cacheSize:
+                    cacheTime[v] = timeStamp
+                    timeStamp += 1
+
+        # the candidate still in the cache after its remaining fan is emitted, and the oldest of them
+        fanning = -1
+        best = -1
+        for v in candidates:
+            if live[v] <= 0:
+                continue
+            priority = 0
+            if timeStamp - cacheTime[v] + 2 * live[v] <= cacheSize:
+                priority = timeStamp - cacheTime[v]
+            if priority > best:
+                best = priority
+                fanning = v
+
+        if fanning < 0:
+            # dead end, go back to a recently used vertex, or to the next vertex in input order
+            while deadEnd:
+                v = deadEnd.pop()
+                if live[v] > 0:
+                    fanning = v
+                    break
+            else:
+                while cursor < vertexCount and live[cursor] <= 0:
+                    cursor += 1
+                if cursor < vertexCount:
+                    fanning = cursor
+
+    return triangles[result].ravel()
+
+
+def averageCacheMissRatio(indices: np.ndarray, cacheSize: int = VERTEX_CACHE_SIZE) -> float:
+    """
+    Simulate a FIFO post-transform cache and return the number of vertex transforms per triangle (ACMR).
+    0.5 is the best a regular grid can reach, 3 means no reuse at all.
+    """
+    triangleCount = indices.size // 3
+    if triangleCount == 0:
+        return 0.0
+
+    cache = deque()
+    inCache = set()
+    misses = 0
+    for v in indices.ravel().tolist():
+        if v in inCache:
+            continue
+        misses += 1
+        cache.append(v)
+        inCache.add(v)
+        if len(cache) > cacheSize:
+            inCache.discard(cache.popleft())
+    return misses / triangleCount
+
+
+def optimizeIndices(vertices: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    Run every pass: degenerate and duplicate removal, then vertex cache ordering when the mesh is small enough.
+    The new order is only kept if it has a lower ACMR, tiny meshes like the cylinder caps already fit in the cache.
+    """
+    indices = removeDegenerateTriangles(vertices, indices)
+    if 0 < indices.size // 3 <= TIPSIFY_MAX_TRIANGLES:
+        reordered = tipsify(indices, len(vertices))
+        if averageCacheMissRatio(reordered) < averageCacheMissRatio(indices):
+            indices = reordered
+    return indices
+
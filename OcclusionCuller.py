@@ -0,0 +1,218 @@
+"""
+Occlusion culling with hardware occlusion queries.
+
+Every frame, split sorts the Components into those found visible in the previous frame, which the caller draws
+first by any path (render queue, instancing) as occluders, and those found hidden. Then finish draws the bounding
+box of every Component inside a GL_ANY_SAMPLES_PASSED query, with color and depth writes off, and draws the
+hidden Components under conditional rendering on their query, so the GPU skips them when the box is still hidden.
+Neither the GPU nor the CPU ever waits: conditional rendering uses GL_QUERY_NO_WAIT, so a draw whose query isn't
+done yet is simply made, and query results are only read one frame later, when they are available. A conditional
+draw counts as occluded once its query result comes back hidden, the GPU may still have made the draw if the
+result wasn't ready in time, so the counter is an upper bound.
+"""
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from Component import Component
+from GeometryCache import geometryCache
+from ParametricMesh import VERTEX_ATTRIB_SIZE
+from RenderContext import RenderContext
+
+try:
+    import OpenGL
+
+    try:
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+    except ImportError:
+        from ctypes import util
+
+        orig_util_find_library = util.find_library
+
+
+        def new_util_find_library(name):
+            res = orig_util_find_library(name)
+            if res:
+                return res
+            return '/System/Library/Frameworks/' + name + '.framework/' + name
+
+
+        util.find_library = new_util_find_library
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+except ImportError:
+    raise ImportError("Required dependency PyOpenGL not present")
+
+
+def unitBox():
+    """
+    The [0, 1]^3 box as 8 vertices and 12 triangles in the Displayable vertex layout
+    """
+    corners = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=np.float32)
+    vertices = np.zeros((8, VERTEX_ATTRIB_SIZE), dtype=np.float32)
+    vertices[:, 0:3] = corners
+    vertices[:, 3:6] = corners * 2 - 1
+    # corner index is 4x + 2y + z
+    indices = np.array([
+        0, 1, 3, 0, 3, 2,  # x = 0
+        4, 6, 7, 4, 7, 5,  # x = 1
+        0, 4, 5, 0, 5, 1,  # y = 0
+        2, 3, 7, 2, 7, 6,  # y = 1
+        0, 2, 6, 0, 6, 4,  # z = 0
+        1, 5, 7, 1, 7, 3,  # z = 1
+    ], dtype=np.uint32)
+    return vertices, indices, {}
+
+
+class OcclusionState:
+    """
+    The occlusion query of one Component
+    """
+    query = None
+    pending = False  # a query was issued and its result hasn't been read yet
+    visible = True  # the last known result
+    conditionalDraws = 0  # draws made under conditional rendering on the pending query
+
+    def __init__(self, query):
+        self.query = query
+
+
+class OcclusionCuller:
+    shaderProg = None
+    boxMesh = None
+    states: Dict[int, OcclusionState] = None  # id(Component) -> OcclusionState
+
+    # boxes are grown by this fraction of their size, so flat faces don't hide their own box in the depth test
+    boxMargin = 0.01
+    conditionalRenderOn = True
+
+    def __init__(self, shaderProg):
+        self.shaderProg = shaderProg
+        self.states = {}
+        self.boxMesh = geometryCache.acquire(shaderProg, ("OcclusionCullerBox",), unitBox)
+        self.boxMesh.initialize()
+        # conditional rendering is core since OpenGL 3.0, but the loader may not expose it
+        self.conditionalRenderOn = bool(gl.glBeginConditionalRender)
+
+    def reset(self):
+        """
+        Delete every query, call this when the scene changes
+        """
+        if self.states:
+            gl.glDeleteQueries(len(self.states), [s.query for s in self.states.values()])
+        self.states = {}
+
+    def draw(self, components: List[Component], shaderProg, context: RenderContext):
+        """
+        Draw components, which already passed frustum culling, one by one
+        """
+        occluders, hidden = self.split(components, context)
+        for c in occluders:
+            c.drawSelf(shaderProg, context)
+        self.finish(components, hidden, shaderProg, context)
+
+    def split(self, components: List[Component], context: RenderContext) -> Tuple[List[Component], List[Component]]:
+        """
+        Read the available query results, forget the Components which were not passed this frame, and split
+        components into the ones to draw now and the ones found hidden in the previous frame
+
+        :param components: every Component which passed frustum culling
+        """
+        cameraPos = np.linalg.inv(context.viewMat)[3, 0:3]
+        states = {}
+        occluders = []
+        hidden = []
+        for c in components:
+            state = self.states.pop(id(c), None)
+            if state is None:
+                state = OcclusionState(int(gl.glGenQueries(1)[0]))
+            states[id(c)] = state
+            self.readResult(state, context)
+            if state.visible or self.insideBox(c, cameraPos):
+                occluders.append(c)
+            else:
+                hidden.append(c)
+
+        # the Components left the frustum or the scene, their query would only be issued again
+        if self.states:
+            gl.glDeleteQueries(len(self.states), [s.query for s in self.states.values()])
+        self.states = states
+        return occluders, hidden
+
+    def finish(self, components: List[Component], hidden: List[Component], shaderProg, context: RenderContext):
+        """
+        Issue the queries of components, then draw hidden under conditional rendering, after the occluders
+        """
+        cameraPos = np.linalg.inv(context.viewMat)[3, 0:3]
+        self.issueQueries(components, shaderProg, context, cameraPos)
+
+        for c in hidden:
+            state = self.states[id(c)]
+            if self.conditionalRenderOn:
+                # never stall on the box of this frame, the draw is made if its result isn't ready
+                gl.glBeginConditionalRender(state.query, gl.GL_QUERY_NO_WAIT)
+                c.drawSelf(shaderProg, context)
+                gl.glEndConditionalRender()
+                state.conditionalDraws += 1
+            else:
+                # without conditional rendering, the Component shows up again one frame after its box does
+                context.count("occluded")
+
+    def readResult(self, state: OcclusionState, context: RenderContext):
+        """
+        Update state.visible from its last query, if the result is already there
+        """
+        if not state.pending:
+            return
+        value = np.zeros(1, dtype=np.uint32)
+        gl.glGetQueryObjectuiv(state.query, gl.GL_QUERY_RESULT_AVAILABLE, value)
+        if not value[0]:
+            return
+        gl.glGetQueryObjectuiv(state.query, gl.GL_QUERY_RESULT, value)
+        state.visible = bool(value[0])
+        state.pending = False
+        if not state.visible:
+            context.count("occluded", state.conditionalDraws)
+        state.conditionalDraws = 0
+
+    def insideBox(self, component: Component, cameraPos: np.ndarray) -> bool:
+        """
+        The box faces are clipped by the near plane when the camera is inside, so the query can't be trusted
+        """
+        bounds = component.worldBounds
+        margin = (bounds.aabbMax - bounds.aabbMin) * self.boxMargin + 1e-3
+        return bool(np.all(cameraPos >= bounds.aabbMin - margin) and np.all(cameraPos <= bounds.aabbMax + margin))
+
+    def issueQueries(self, components: List[Component], shaderProg, context: RenderContext, cameraPos: np.ndarray):
+        gl.glColorMask(gl.GL_FALSE, gl.GL_FALSE, gl.GL_FALSE, gl.GL_FALSE)
+        gl.glDepthMask(gl.GL_FALSE)
+        gl.glDepthFunc(gl.GL_LEQUAL)
+        shaderProg.setFragmentShaderRouting("pure")
+        shaderProg.setMat3("normalMat", np.identity(3))
+
+        for c in components:
+            state = self.states[id(c)]
+            if state.pending:
+                # the previous result is still on its way, don't wait for it
+                continue
+            if self.insideBox(c, cameraPos):
+                state.visible = True
+                continue
+
+            bounds = c.worldBounds
+            margin = (bounds.aabbMax - bounds.aabbMin) * self.boxMargin + 1e-3
+            size = bounds.aabbMax - bounds.aabbMin + 2 * margin
+            boxMat = np.diag([*size, 1.0])
+            boxMat[3, 0:3] = bounds.aabbMin - margin
+            shaderProg.setMat4("modelMat", boxMat)
+
+            gl.glBeginQuery(gl.GL_ANY_SAMPLES_PASSED, state.query)
+            self.boxMesh.draw()
+            gl.glEndQuery(gl.GL_ANY_SAMPLES_PASSED)
+            state.pending = True
+            context.count("occlusionQueries")
+
+        gl.glDepthFunc(gl.GL_LESS)
+        gl.glDepthMask(gl.GL_TRUE)
+        gl.glColorMask(gl.GL_TRUE, gl.GL_TRUE, gl.GL_TRUE, gl.GL_TRUE)
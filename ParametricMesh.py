@@ -0,0 +1,141 @@
+"""
+A shared kernel to generate triangle meshes from parametric surfaces.
+
+Every Displayable stores its vertices with the following layout, one row per vertex:
+    Column | 0:3                | 3:6           | 6:9          | 9:11
+    Stores | Vertex coordinates | Vertex normal | Vertex Color | Vertex texture Coordinates
+
+A surface is a vectorized function which takes a ParametricGrid and returns three tuples
+(x, y, z), (nx, ny, nz) and (s, t). Every item only needs to be broadcastable to the grid shape,
+so the surface never has to loop over the vertices.
+"""
+import functools
+import math
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+VERTEX_ATTRIB_SIZE = 11
+
+
+@functools.lru_cache(maxsize=128)
+def trigTable(start: float, stop: float, steps: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sample [start, stop] with steps + 1 angles and return the angles with their cosine and sine.
+    Results are cached per resolution and are read-only.
+    """
+    angles = np.linspace(start, stop, steps + 1)
+    cos = np.cos(angles)
+    sin = np.sin(angles)
+    for a in (angles, cos, sin):
+        a.setflags(write=False)
+    return angles, cos, sin
+
+
+@functools.lru_cache(maxsize=128)
+def gridIndices(uSteps: int, vSteps: int, wrapU: bool = True, wrapV: bool = True) -> np.ndarray:
+    """
+    Triangle indices of a (uSteps + 1) x (vSteps + 1) vertex grid stored in C order.
+    Every vertex (i, j) owns the quad spanned with (i + 1, j + 1), split into two triangles which are both
+    counter-clockwise around du x dv.
+    With wrapping on, the last row/column is connected back to the first one,
+    otherwise the last row/column owns no quad. The result is cached and read-only.
+    """
+    rows = uSteps + 1
+    cols = vSteps + 1
+    i = np.arange(rows if wrapU else uSteps)[:, np.newaxis]
+    j = np.arange(cols if wrapV else vSteps)[np.newaxis, :]
+    i_by_j = i * cols + j
+    ip1_by_j = (i + 1) % rows * cols + j
+    i_by_jp1 = i * cols + (j + 1) % cols
+    ip1_by_jp1 = (i + 1) % rows * cols + (j + 1) % cols
+
+    indices = np.stack([
+        i_by_j, ip1_by_j, i_by_jp1,
+        ip1_by_jp1, i_by_jp1, ip1_by_j], axis=-1).astype(np.uint32).flatten("C")
+    indices.setflags(write=False)
+    return indices
+
+
+class ParametricGrid:
+    """
+    The (u, v) sampling grid handed over to a surface function.
+    u varies along the rows and v along the columns, so u has shape (rows, 1) and v has shape (1, cols).
+    s and t are the normalized parameters in [0, 1], and the cosine/sine of u and v come from the
+    cached trig tables.
+    """
+    uSteps = 0
+    vSteps = 0
+    shape = None
+
+    u = None
+    v = None
+    cosU = None
+    sinU = None
+    cosV = None
+    sinV = None
+    s = None
+    t = None
+
+    def __init__(self, uSteps: int, vSteps: int, uRange: Sequence[float], vRange: Sequence[float]):
+        self.uSteps = uSteps
+        self.vSteps = vSteps
+        self.shape = (uSteps + 1, vSteps + 1)
+
+        u, cosU, sinU = trigTable(float(uRange[0]), float(uRange[1]), uSteps)
+        v, cosV, sinV = trigTable(float(vRange[0]), float(vRange[1]), vSteps)
+        self.u = u[:, np.newaxis]
+        self.cosU = cosU[:, np.newaxis]
+        self.sinU = sinU[:, np.newaxis]
+        self.v = v[np.newaxis, :]
+        self.cosV = cosV[np.newaxis, :]
+        self.sinV = sinV[np.newaxis, :]
+        self.s = (np.arange(uSteps + 1) / uSteps)[:, np.newaxis]
+        self.t = (np.arange(vSteps + 1) / vSteps)[np.newaxis, :]
+
+
+SurfaceFunction = Callable[[ParametricGrid], Tuple[Sequence, Sequence, Sequence]]
+
+
+def generateSurface(surface: SurfaceFunction,
+                    uSteps: int,
+                    vSteps: int,
+                    color,
+                    uRange: Sequence[float] = (-math.pi, math.pi),
+                    vRange: Sequence[float] = (-math.pi, math.pi),
+                    wrapU: bool = True,
+                    wrapV: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate a parametric surface on a (uSteps + 1) x (vSteps + 1) grid.
+
+    :param surface: vectorized function, grid -> ((x, y, z), (nx, ny, nz), (s, t))
+    :param uSteps: number of segments along u
+    :param vSteps: number of segments along v
+    :param color: vertex color, anything iterable with r, g, b
+    :param uRange: the first and the last value of u
+    :param vRange: the first and the last value of v
+    :param wrapU: connect the last row back to the first one
+    :param wrapV: connect the last column back to the first one
+    :return: float32 vertices with shape (N, 11) and flattened uint32 triangle indices
+    """
+    grid = ParametricGrid(uSteps, vSteps, uRange, vRange)
+    position, normal, uv = surface(grid)
+
+    vertices = np.empty((*grid.shape, VERTEX_ATTRIB_SIZE), dtype=np.float32)
+    for k, value in enumerate((*position, *normal)):
+        vertices[..., k] = value
+    vertices[..., 6:9] = tuple(color)
+    vertices[..., 9] = uv[0]
+    vertices[..., 10] = uv[1]
+
+    return vertices.reshape((-1, VERTEX_ATTRIB_SIZE)), gridIndices(uSteps, vSteps, wrapU, wrapV)
+
+
+def mergeMeshes(meshes: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenate several (vertices, indices) pairs into a single mesh, indices are offset accordingly
+    """
+    offsets = np.cumsum([0] + [len(v) for v, _ in meshes[:-1]])
+    vertices = np.concatenate([v for v, _ in meshes])
+    indices = np.concatenate([i + np.uint32(o) for (_, i), o in zip(meshes, offsets)])
+    return vertices, indices
@@ -0,0 +1,108 @@
+"""
+Pick the Component under the mouse on the CPU.
+
+The click is turned into a world space ray, the BVH gives the Components whose bounds are hit, nearest first,
+and their triangles are intersected with the ray all at once with numpy. Nothing is read back from the GPU.
+All matrices are stored in column-major order, so points are row vectors: p @ M.
+"""
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from BVH import BVH
+from Component import Component
+
+
+class PickResult:
+    component: Component = None
+    point = None  # numpy.ndarray(3), the hit point in world space
+    distance = 0.0  # along the ray direction, in units of its length
+    triangle = -1  # index of the triangle hit in the Displayable's mesh
+
+    def __init__(self, component, point, distance, triangle):
+        self.component = component
+        self.point = point
+        self.distance = distance
+        self.triangle = triangle
+
+
+def pickRay(viewMat: np.ndarray, perspMat: np.ndarray, viewportSize, x: float, y: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The world space ray under the window point (x, y), y going up from the bottom of the viewport.
+    Same math as gluUnProject in Sketch.unprojectCanvas, without querying the viewport from OpenGL.
+
+    :return: origin on the near plane, and direction from the near plane to the far plane
+    """
+    ndcX = 2.0 * x / viewportSize[0] - 1.0
+    ndcY = 2.0 * y / viewportSize[1] - 1.0
+    inverse = np.linalg.inv(viewMat @ perspMat)
+    near = np.array([ndcX, ndcY, -1.0, 1.0]) @ inverse
+    far = np.array([ndcX, ndcY, 1.0, 1.0]) @ inverse
+    near = near[0:3] / near[3]
+    far = far[0:3] / far[3]
+    return near, far - near
+
+
+def intersectTriangles(origin: np.ndarray, direction: np.ndarray,
+                       p0: np.ndarray, p1: np.ndarray, p2: np.ndarray) -> np.ndarray:
+    """
+    Möller and Trumbore, "Fast, Minimum Storage Ray/Triangle Intersection", 1997, over arrays of triangles.
+    Both faces are hit, since nothing is culled when drawing.
+
+    :param p0, p1, p2: (N, 3) arrays with the triangle corners
+    :return: the ray parameter t of every triangle, infinity where it is missed or behind the origin
+    """
+    edge1 = p1 - p0
+    edge2 = p2 - p0
+    pvec = np.cross(direction, edge2)
+    det = (edge1 * pvec).sum(axis=1)
+    valid = np.abs(det) > 1e-12
+    inverseDet = np.divide(1.0, det, out=np.zeros_like(det), where=valid)
+
+    tvec = origin - p0
+    u = (tvec * pvec).sum(axis=1) * inverseDet
+    qvec = np.cross(tvec, edge1)
+    v = (qvec @ direction) * inverseDet
+    t = (edge2 * qvec).sum(axis=1) * inverseDet
+
+    hit = valid & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= 0.0)
+    return np.where(hit, t, math.inf)
+
+
+def pickComponent(component: Component, origin: np.ndarray, direction: np.ndarray) -> Tuple[float, int]:
+    """
+    Intersect the ray with the full resolution mesh of component.
+    The ray is moved to the local space instead of moving every vertex, t stays the same under the affine map.
+
+    :return: the nearest t and the triangle index, or infinity and -1
+    """
+    mesh = component.displayObj.mesh
+    if mesh is None or mesh.indices.size == 0:
+        return math.inf, -1
+    inverse = np.linalg.inv(component.transformationMat)
+    localOrigin = np.append(origin, 1.0) @ inverse
+    localDirection = np.append(direction, 0.0) @ inverse
+
+    positions = mesh.vertices[:, 0:3].astype(np.float64)
+    triangles = mesh.indices.reshape((-1, 3))
+    t = intersectTriangles(localOrigin[0:3], localDirection[0:3],
+                           positions[triangles[:, 0]], positions[triangles[:, 1]], positions[triangles[:, 2]])
+    nearest = int(np.argmin(t))
+    return float(t[nearest]), nearest if math.isfinite(t[nearest]) else -1
+
+
+def pick(bvh: BVH, origin: np.ndarray, direction: np.ndarray) -> Optional[PickResult]:
+    """
+    The nearest Component hit by the ray. The bvh must be up to date with the scene graph.
+    Candidates are tested in the order the ray enters their bounds, so the search stops as soon as the best hit
+    is closer than the next box.
+    """
+    best = None
+    for entry, component in bvh.queryRay(origin, direction):
+        if best is not None and entry > best.distance:
+            break
+        t, triangle = pickComponent(component, origin, direction)
+        if triangle >= 0 and (best is None or t < best.distance):
+            best = PickResult(component, origin + t * direction, t, triangle)
+    return best
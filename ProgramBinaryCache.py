@@ -0,0 +1,166 @@
+"""
+Linked shader programs saved to disk with glGetProgramBinary and loaded back with glProgramBinary.
+
+A binary is only valid for the driver which produced it, so the file name hashes the GL vendor, renderer and
+version together with the shader sources and the attribute bindings. Whenever something fails, the driver has
+no binary format, the file is missing or the driver rejects it, the program is simply compiled from source.
+Load and compile times are recorded, so cold and warm startups can be compared.
+"""
+import hashlib
+import os
+from typing import Optional
+
+import numpy as np
+
+try:
+    import OpenGL
+
+    try:
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+    except ImportError:
+        from ctypes import util
+
+        orig_util_find_library = util.find_library
+
+
+        def new_util_find_library(name):
+            res = orig_util_find_library(name)
+            if res:
+                return res
+            return '/System/Library/Frameworks/' + name + '.framework/' + name
+
+
+        util.find_library = new_util_find_library
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+except ImportError:
+    raise ImportError("Required dependency PyOpenGL not present")
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".shadercache")
+
+
+class ProgramBinaryCache:
+    directory = CACHE_DIR
+    supported = None  # decided with the first GL context, None until then
+    driver = None  # vendor, renderer and version of the GL context
+
+    hits = 0
+    misses = 0
+    loadSeconds = 0.0  # total time spent in programs loaded from a binary
+    compileSeconds = 0.0  # total time spent in programs compiled from source
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = directory
+
+    def invalidate(self):
+        """
+        Ask the driver again with the next program, call this when the GL context is recreated
+        """
+        self.supported = None
+        self.driver = None
+
+    def checkSupport(self) -> bool:
+        if self.supported is None:
+            try:
+                self.supported = bool(gl.glGetProgramBinary) and bool(gl.glProgramBinary) and \
+                                 int(gl.glGetIntegerv(gl.GL_NUM_PROGRAM_BINARY_FORMATS)) > 0
+                self.driver = "|".join(str(gl.glGetString(name)) for name in
+                                       (gl.GL_VENDOR, gl.GL_RENDERER, gl.GL_VERSION))
+            except Exception:
+                self.supported = False
+        return self.supported
+
+    def key(self, *sources) -> Optional[str]:
+        """
+        The file name of a program, None if binaries aren't supported
+
+        :param sources: everything that goes into the linked program, the shader sources and attribute bindings
+        """
+        if not self.checkSupport():
+            return None
+        digest = hashlib.sha256(self.driver.encode())
+        for source in sources:
+            digest.update(b"\0" + str(source).encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".bin")
+
+    def prepare(self, program: int):
+        """
+        Must be called before linking, or the driver may not keep the binary around
+        """
+        gl.glProgramParameteri(program, gl.GL_PROGRAM_BINARY_RETRIEVABLE_HINT, gl.GL_TRUE)
+
+    def load(self, program: int, key: str) -> bool:
+        """
+        Link program from the stored binary, return False if the program must be compiled from source
+        """
+        try:
+            with open(self.path(key), "rb") as f:
+                content = f.read()
+        except OSError:
+            return False
+        if len(content) <= 4:
+            self.remove(key)
+            return False
+
+        binaryFormat = int(np.frombuffer(content[0:4], dtype=np.uint32)[0])
+        binary = np.frombuffer(content[4:], dtype=np.uint8)
+        try:
+            gl.glProgramBinary(program, binaryFormat, binary, binary.size)
+            linked = gl.glGetProgramiv(program, gl.GL_LINK_STATUS) == gl.GL_TRUE
+        except Exception:
+            linked = False
+        if not linked:
+            # a driver update can reject old binaries, replace it with the next compile
+            self.remove(key)
+        return linked
+
+    def store(self, program: int, key: str):
+        try:
+            length = int(gl.glGetProgramiv(program, gl.GL_PROGRAM_BINARY_LENGTH))
+            if length <= 0:
+                return
+            written = np.zeros(1, dtype=np.int32)
+            binaryFormat = np.zeros(1, dtype=np.uint32)
+            binary = np.zeros(length, dtype=np.uint8)
+            gl.glGetProgramBinary(program, length, written, binaryFormat, binary)
+            os.makedirs(self.directory, exist_ok=True)
+            # write then rename, so a crash never leaves a truncated binary behind
+            temporary = self.path(key) + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(binaryFormat.tobytes())
+                f.write(binary[0:int(written[0])].tobytes())
+            os.replace(temporary, self.path(key))
+        except Exception:
+            # the cache is only an optimization
+            pass
+
+    def remove(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def record(self, fromBinary: bool, seconds: float):
+        if fromBinary:
+            self.hits += 1
+            self.loadSeconds += seconds
+        else:
+            self.misses += 1
+            self.compileSeconds += seconds
+
+    def stats(self) -> dict:
+        return {
+            "supported": bool(self.supported),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loadSeconds": self.loadSeconds,
+            "compileSeconds": self.compileSeconds,
+        }
+
+
+# The process-wide instance used by GLProgram.compile
+programBinaryCache = ProgramBinaryCache()
@@ -0,0 +1,106 @@
+"""
+Define the per-frame information handed down the Component tree while drawing.
+All matrices are stored in column-major order, the same as the ones uploaded to the shader.
+"""
+import math
+from typing import Dict, Optional
+
+import numpy as np
+
+from BoundingVolume import BoundingVolume
+
+# results of RenderContext.classify
+OUTSIDE = -1
+INTERSECT = 0
+INSIDE = 1
+
+
+class RenderContext:
+    viewMat = None
+    perspMat = None
+    viewportSize = None  # (width, height) in pixels
+
+    # the 6 frustum planes (a, b, c, d) in world space with unit normals pointing inside: left, right, bottom,
+    # top, near, far. A point p is inside a plane when a*x + b*y + c*z + d >= 0
+    frustumPlanes = None
+    cullingOn = True
+
+    # per-frame counters, reset by beginFrame
+    stats: Dict[str, int] = None
+
+    def __init__(self):
+        self.viewportSize = (1, 1)
+        self.stats = {}
+
+    def beginFrame(self, viewMat: np.ndarray, perspMat: np.ndarray, viewportSize):
+        self.viewMat = viewMat
+        self.perspMat = perspMat
+        self.viewportSize = (max(1, viewportSize[0]), max(1, viewportSize[1]))
+        self.stats = {
+            "triangles": 0,
+            "drawn": 0,
+            "culled": 0,
+        }
+
+        # Gribb and Hartmann, the planes are the sums and differences of the clip matrix rows.
+        # The stored matrix is the transpose, so its columns are used instead
+        clip = viewMat @ perspMat
+        planes = np.array([clip[:, 3] + clip[:, 0], clip[:, 3] - clip[:, 0],
+                           clip[:, 3] + clip[:, 1], clip[:, 3] - clip[:, 1],
+                           clip[:, 3] + clip[:, 2], clip[:, 3] - clip[:, 2]])
+        self.frustumPlanes = planes / np.linalg.norm(planes[:, 0:3], axis=1)[:, np.newaxis]
+
+    def count(self, name: str, value: int = 1):
+        self.stats[name] = self.stats.get(name, 0) + value
+
+    def classify(self, bounds: Optional[BoundingVolume]) -> int:
+        """
+        Test a world space BoundingVolume against the view frustum.
+        The sphere is tested first, the box only when the sphere crosses a plane.
+
+        :return: OUTSIDE, INTERSECT or INSIDE. Always INSIDE if culling is off, OUTSIDE if bounds is None
+        """
+        if bounds is None:
+            return OUTSIDE
+        if not self.cullingOn or self.frustumPlanes is None:
+            return INSIDE
+
+        normals = self.frustumPlanes[:, 0:3]
+        distance = normals @ bounds.center + self.frustumPlanes[:, 3]
+        if (distance < -bounds.radius).any():
+            return OUTSIDE
+        if (distance >= bounds.radius).all():
+            return INSIDE
+
+        return self.classifyBox(bounds.aabbMin, bounds.aabbMax)
+
+    def classifyBox(self, aabbMin: np.ndarray, aabbMax: np.ndarray) -> int:
+        """
+        Test a world space axis aligned box against the view frustum
+
+        :return: OUTSIDE, INTERSECT or INSIDE. Always INSIDE if culling is off
+        """
+        if not self.cullingOn or self.frustumPlanes is None:
+            return INSIDE
+
+        normals = self.frustumPlanes[:, 0:3]
+        boxCenter = (aabbMin + aabbMax) * 0.5
+        halfExtent = (aabbMax - aabbMin) * 0.5
+        distance = normals @ boxCenter + self.frustumPlanes[:, 3]
+        reach = np.abs(normals) @ halfExtent
+        if (distance < -reach).any():
+            return OUTSIDE
+        if (distance >= reach).all():
+            return INSIDE
+        return INTERSECT
+
+    def screenSize(self, center: np.ndarray, radius: float) -> float:
+        """
+        Approximate diameter in pixels of a world space sphere after projection.
+        Return infinity if the camera is inside the sphere.
+        """
+        viewPos = np.append(center, 1.0) @ self.viewMat
+        distance = -viewPos[2]
+        if distance <= radius:
+            return math.inf
+        return radius * self.perspMat[1, 1] * self.viewportSize[1] / distance
@@ -0,0 +1,126 @@
+"""
+Collect the draws of a frame first, then sort and submit them so that GL state changes as little as possible.
+
+Packets are sorted by program, routing, bound textures, material and finally front-to-back depth, so the
+depth test rejects hidden fragments early within a run of identical state. While submitting, the routing,
+textures and material are only set when they differ from the previous packet, and every change is counted
+in the RenderContext stats.
+"""
+from typing import List, Optional
+
+import numpy as np
+
+from Component import Component
+from RenderContext import RenderContext
+
+
+class DrawPacket:
+    """
+    One draw call: a single Component, or several drawn instanced when they share a batchKey
+    """
+    components: List[Component] = None
+    level = 0
+    shaderProg = None
+    program = 0  # the GL name of shaderProg
+    routing = None
+    textures = None
+    material = None
+    depth = 0.0
+
+    def __init__(self, components: List[Component], level: int, shaderProg, depth: float):
+        first = components[0]
+        self.components = components
+        self.level = level
+        self.shaderProg = shaderProg
+        self.program = shaderProg.program
+        self.routing = str(first.renderingRouting)
+        self.textures = first.textureKey()
+        self.material = first.materialKey()
+        self.depth = depth
+
+    def sortKey(self):
+        return self.program, self.routing, self.textures, self.material, self.depth
+
+
+class RenderQueue:
+    packets: List[DrawPacket] = None
+    # when set, Components sharing a batchKey are merged into one instanced packet
+    batcher = None
+    # when set, every Component is drawn with the shader variant of its routing instead of shaderProg
+    variants = None
+
+    def __init__(self, batcher=None, variants=None):
+        self.packets = []
+        self.batcher = batcher
+        self.variants = variants
+
+    def clear(self):
+        self.packets = []
+
+    def collect(self, components: List[Component], shaderProg, context: RenderContext):
+        """
+        Add a packet for every Component of components, they should already have passed culling
+        """
+        if self.batcher is not None:
+            groups = self.batcher.group(components, context)
+        else:
+            groups = [([c], c.selectLodLevel(context)) for c in components]
+
+        for members, level in groups:
+            # members of a group share their routing and textures, so they share a variant too
+            program = self.variants.programFor(members[0]) if self.variants is not None else shaderProg
+            if self.batcher is None or len(members) < self.batcher.minInstances:
+                for c in members:
+                    self.packets.append(DrawPacket([c], level, program, self.viewDepth(c, context)))
+            else:
+                depth = min(self.viewDepth(c, context) for c in members)
+                self.packets.append(DrawPacket(members, level, program, depth))
+
+    @staticmethod
+    def viewDepth(component: Component, context: RenderContext) -> float:
+        """
+        Distance of the bounds center in front of the camera, the camera looks down -z in view space
+        """
+        center = component.worldBounds.center
+        return -float(np.append(center, 1.0) @ context.viewMat[:, 2])
+
+    def submit(self, context: Optional[RenderContext] = None):
+        """
+        Sort and draw every packet with the program it was collected with, then empty the queue
+        """
+        self.packets.sort(key=DrawPacket.sortKey)
+        program = routing = textures = material = None
+        for packet in self.packets:
+            first = packet.components[0]
+            shaderProg = packet.shaderProg
+            if packet.program != program:
+                program = packet.program
+                shaderProg.use()
+                # uniforms belong to a program, the next one starts from its own values
+                routing = textures = material = None
+                self.countChange(context, "programChanges")
+            if packet.routing != routing:
+                routing = packet.routing
+                # a shader variant has its routing compiled in
+                if shaderProg.routingFlags is None:
+                    shaderProg.setFragmentShaderRouting(first.renderingRouting)
+                    self.countChange(context, "routingChanges")
+            if packet.textures != textures:
+                textures = packet.textures
+                first.bindTextures(shaderProg)
+                self.countChange(context, "textureChanges")
+            if packet.material != material:
+                material = packet.material
+                first.setMaterialUniforms(shaderProg)
+                self.countChange(context, "materialChanges")
+
+            if len(packet.components) > 1:
+                self.batcher.drawInstanced(packet.components, packet.level, shaderProg, context)
+            else:
+                first.drawSelf(shaderProg, context, sharedUniforms=False)
+        self.clear()
+
+    @staticmethod
+    def countChange(context: Optional[RenderContext], name: str):
+        if context is not None:
+            context.count(name)
@@ -117,7 +117,7 @@ class SceneOne(Scene, Animation):
             lPos = self.lightPos(self.lRadius, self.lAngles[i], self.lTransformations[i])
             self.lightCubes[i].setCurrentPosition(Point(lPos))
             self.lights[i].setPosition(lPos)
-            self.shaderProg.setLight(i, v)
+        self.shaderProg.setLights(self.lights)
 
         for c in self.children:
             if isinstance(c, Animation):
@@ -74,12 +74,10 @@ def get_candle(shaderProg,
     candle_line.addChild(candle_base)
 
     def turn_on(component):
-        component.displayObj = DisplayableCylinder(shaderProg, 0.01, 0.01, 0.08, 3, line_color)
-        component.displayObj.initialize()
+        component.setColor(line_color)
 
     def turn_off(component):
-        component.displayObj = DisplayableCylinder(shaderProg, 0.01, 0.01, 0.08, 3, Ct.BLACK)
-        component.displayObj.initialize()
+        component.setColor(Ct.BLACK)
 
     candle_line.turn_on = turn_on
     candle_line.turn_off = turn_off
@@ -87,6 +85,9 @@ def get_candle(shaderProg,
 
 
 class SceneThree(Scene):
+    # the table, the cake and the boxes hide most of what sits behind them
+    occlusionCullingOn = True
+
     def __init__(self, shaderProg: GLProgram):
         Scene.__init__(self, shaderProg)
 
@@ -244,14 +245,14 @@ class SceneThree(Scene):
         self.lightCubes.append(flash1_obj)
 
         lighter_color = Ct.ColorType(255 / 255, 196 / 255, 103 / 255)
-        # add 5 candles
+        # add 5 candles, a candle only lights the table around it, so the clusters further away skip it
         r = 0.3
         for i, theta in enumerate(np.linspace(-pi, pi, 6)):
             if i == 0:
                 continue
             l_pos = Point((0.2 + r * math.cos(theta), 0.1, r * math.sin(theta)))
             candle = get_candle(shaderProg, l_pos, lighter_color, height=0.23)
-            candle_light = Light(l_pos, np.array((*lighter_color, 1.0)))
+            candle_light = Light(l_pos, np.array((*lighter_color, 1.0)), range=2.5)
             self.lights.append(candle_light)
             self.lightCubes.append(candle)
             if i != 3:
@@ -264,7 +265,7 @@ class SceneThree(Scene):
                                 thickness=0.15, nsides=24, candle_color=Ct.RED,
                                 candle_texture="assets/red_candle.png",
                                 normal_texture="assets/red_candle_norm.png")
-        candle_light = Light(l_pos, np.array((*Ct.RED, 1.0)))
+        candle_light = Light(l_pos, np.array((*Ct.RED, 1.0)), range=1.5)
         self.lights.append(candle_light)
         self.lightCubes.append(red_candle)
         self.addChild(red_candle)
@@ -12,6 +12,8 @@ class Scene(Component):
     lightCubes: List[Component] = []
     shaderProg: GLProgram = None
     glutility: GLUtility = None
+    # draw with OcclusionCuller, worth it when large objects hide many others
+    occlusionCullingOn: bool = False
 
     def __init__(self, shaderProg: GLProgram):
         super().__init__(Point((0, 0, 0)))
@@ -19,8 +21,6 @@ class Scene(Component):
         self.glutility = GLUtility()
 
     def initialize(self):
-        self.shaderProg.clearAllLights()
-        for i, v in enumerate(self.lights):
-            if v.enabled:
-                self.shaderProg.setLight(i, v)
+        # disabled lights are stored turned off
+        self.shaderProg.setLights(self.lights)
         super().initialize()
@@ -0,0 +1,135 @@
+"""
+Specialized programs compiled on demand from the uber shader of GLProgram.
+
+A variant has the routing flags and the normal mapping toggle of a Component compiled in as constants, so the
+fragment shader has no runtime branch on them and only as many result slots as the routing mixes.
+The texture toggle is bit 8 of the routing flags. The lights and the camera come from uniform buffers shared by
+every program; the few uniforms set once for the whole scene are remembered and sent to every variant.
+
+Variants compile asynchronously: a missing variant is handed to the driver and the base program draws its
+Components until poll sees the variant linked. With GL_KHR_parallel_shader_compile the driver compiles on its
+own threads and reports completion without blocking; otherwise the link status is asked a few frames later,
+by which time a driver compiling on its own thread is usually done.
+"""
+from typing import Dict, Hashable, Set, Tuple
+
+from GLProgram import GLProgram, parallelCompileSupported
+
+try:
+    from OpenGL.GL.KHR.parallel_shader_compile import glMaxShaderCompilerThreadsKHR
+except ImportError:
+    glMaxShaderCompilerThreadsKHR = None
+
+
+class ShaderVariantCache:
+    base: GLProgram = None  # the uber program, used when variants are off
+    programs: Dict[Hashable, GLProgram] = None
+    sharedBools: Dict[str, bool] = None  # scene-wide switches, set on every variant
+    pending: Dict[Hashable, GLProgram] = None  # variants the driver is still compiling
+    failed: Set[Hashable] = None  # variants which didn't compile, drawn with the base program
+
+    asyncOn = True  # compile variants without blocking the frame
+    parallelCompileOn = False  # the driver reports completion, decided at construction
+
+    def __init__(self, base: GLProgram, asyncOn: bool = True):
+        self.base = base
+        self.programs = {}
+        self.sharedBools = {}
+        self.pending = {}
+        self.failed = set()
+        self.asyncOn = asyncOn
+        self.parallelCompileOn = asyncOn and parallelCompileSupported()
+        if self.parallelCompileOn and glMaxShaderCompilerThreadsKHR is not None:
+            try:
+                # 0xFFFFFFFF lets the driver pick the number of threads
+                glMaxShaderCompilerThreadsKHR(0xFFFFFFFF)
+            except Exception:
+                pass
+
+    @staticmethod
+    def key(routing, normalMapOn: bool) -> Tuple[int, bool]:
+        return GLProgram.routingFlagsOf(routing), bool(normalMapOn)
+
+    def get(self, routing, normalMapOn: bool) -> GLProgram:
+        """
+        The smallest program which draws this routing. The first request starts its compile, and until
+        it is linked the base program is returned
+        """
+        key = self.key(routing, normalMapOn)
+        program = self.programs.get(key)
+        if program is not None:
+            return program
+        if key in self.pending or key in self.failed:
+            return self.base
+
+        try:
+            # with GLProgram.templateDir set, a broken template already raises here
+            program = GLProgram(*key)
+            if not self.asyncOn:
+                program.compile()
+            elif program.beginCompile():
+                self.pending[key] = program
+                return self.base
+        except Exception as e:
+            self.fail(key, e)
+            return self.base
+        self.ready(key, program)
+        return program
+
+    def poll(self):
+        """
+        Move the variants the driver has finished to the ready programs, call this once per frame
+        """
+        for key, program in list(self.pending.items()):
+            try:
+                if not program.pollCompile(self.parallelCompileOn):
+                    continue
+            except Exception as e:
+                del self.pending[key]
+                self.fail(key, e)
+                continue
+            del self.pending[key]
+            self.ready(key, program)
+
+    def ready(self, key, program: GLProgram):
+        for name, value in self.sharedBools.items():
+            program.setBool(name, value)
+        self.programs[key] = program
+
+    def fail(self, key, error: Exception):
+        print(f"shader variant {key} failed to compile, drawing it with the uber shader: {error}")
+        self.failed.add(key)
+
+    def retryFailed(self):
+        """
+        Compile the failed variants again on their next request, e.g. after their templates changed
+        """
+        self.failed.clear()
+
+    def restartPending(self):
+        """
+        Drop the variants the driver is still compiling, e.g. from templates which just changed. They are
+        compiled again, from the current sources, on their next request. A dropped GLProgram deletes its GL program
+        """
+        self.pending.clear()
+
+    def programFor(self, component) -> GLProgram:
+        return self.get(component.renderingRouting, component.normalMapOn)
+
+    def setBool(self, name, value: bool):
+        """
+        Set a bool uniform of the base program and of every variant, present and future
+        """
+        self.sharedBools[name] = value
+        self.base.setBool(name, value)
+        # pending variants get the value when they are ready
+        for program in self.programs.values():
+            program.setBool(name, value)
+
+    def stats(self) -> dict:
+        return {
+            "variants": len(self.programs),
+            "pending": len(self.pending),
+            "failed": len(self.failed),
+            "parallelCompile": self.parallelCompileOn,
+        }
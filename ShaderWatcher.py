@@ -0,0 +1,113 @@
+"""
+Hot reload of the shader sources from GLSL templates on disk.
+
+GLProgram reads its sources from the templates when GLProgram.templateDir is set, see GLProgram.fillTemplate.
+A background thread polls the modification times of the templates, it never touches GL. The GL thread calls
+reload once per frame: when a template changed, every program regenerates its sources, and only the programs
+whose sources differ are relinked, in place and with their uniform values, see GLProgram.swapSources.
+A template with an error is reported and the program keeps drawing with its previous sources.
+"""
+import os
+import threading
+from typing import Dict, Iterable
+
+from GLProgram import GLProgram, VERTEX_TEMPLATE, FRAGMENT_TEMPLATE
+
+SHADER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shaders")
+
+
+class ShaderWatcher:
+    directory = SHADER_DIR
+    interval = 0.5  # seconds between two polls of the templates
+
+    mtimes: Dict[str, float] = None  # template path -> modification time
+    changed: threading.Event = None  # set by the polling thread, cleared by reload
+    stopped: threading.Event = None
+    thread: threading.Thread = None
+
+    reloads = 0  # programs relinked
+    failures = 0  # relinks which failed and kept the previous program
+
+    def __init__(self, directory: str = SHADER_DIR, interval: float = 0.5):
+        self.directory = directory
+        self.interval = interval
+        self.mtimes = {}
+        self.changed = threading.Event()
+        self.stopped = threading.Event()
+
+    def paths(self):
+        return [os.path.join(self.directory, name) for name in (VERTEX_TEMPLATE, FRAGMENT_TEMPLATE)]
+
+    def start(self, program: GLProgram):
+        """
+        Export the built-in sources of program as templates if they are missing, then start watching them.
+        Programs created from now on read their sources from the templates
+        """
+        program.exportTemplates(self.directory)
+        GLProgram.templateDir = self.directory
+        self.scan()
+        self.changed.clear()
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name="ShaderWatcher", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stop watching, programs go back to the built-in sources with their next compile
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        GLProgram.templateDir = None
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if self.scan():
+                self.changed.set()
+
+    def scan(self) -> bool:
+        """
+        Read the modification times of the templates, return True if one changed since the last scan
+        """
+        changed = False
+        for path in self.paths():
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                # an editor may replace the file, try again with the next scan
+                continue
+            if self.mtimes.get(path) != mtime:
+                changed = changed or path in self.mtimes
+                self.mtimes[path] = mtime
+        return changed
+
+    def reload(self, programs: Iterable[GLProgram]) -> int:
+        """
+        Relink the programs whose sources changed, call this from the GL thread once per frame
+
+        :return: the number of programs relinked
+        """
+        if not self.changed.is_set():
+            return 0
+        self.changed.clear()
+        swapped = 0
+        for program in programs:
+            if not program.ready:
+                continue
+            try:
+                sources = program.genSources()
+                if sources == (program.vertexShaderSource, program.fragmentShaderSource):
+                    continue
+                program.swapSources(*sources)
+            except Exception as e:
+                self.failures += 1
+                print(f"shader reload failed, keeping the previous program: {e}")
+                continue
+            swapped += 1
+        self.reloads += swapped
+        return swapped
+
+    def stats(self) -> dict:
+        return {"watching": self.thread is not None, "reloads": self.reloads, "failures": self.failures}
@@ -8,6 +8,7 @@ First version Created on 09/28/2018
 '''
 import os
 import math
+import time
 from typing import List
 
 import numpy as np
@@ -22,6 +23,20 @@ from Point import Point
 from CanvasBase import CanvasBase
 from GLProgram import GLProgram
 from GLBuffer import VAO, VBO, EBO, Texture
+from GeometryCache import geometryCache
+from GLState import glState
+from LightBuffer import lightBuffer
+from LightClusters import lightClusters
+from FrameConstants import frameConstants
+from ProgramBinaryCache import programBinaryCache
+from RenderContext import RenderContext
+from BVH import BVH
+import Picking
+from OcclusionCuller import OcclusionCuller
+from InstanceBatcher import InstanceBatcher
+from RenderQueue import RenderQueue
+from ShaderVariantCache import ShaderVariantCache
+from ShaderWatcher import ShaderWatcher
 import GLUtility
 from SceneOne import SceneOne
 from SceneTwo import SceneTwo
@@ -101,6 +116,7 @@ class Sketch(CanvasBase):
     glutility = None
 
     frameCount = 0
+    startTime = 0.0  # time.perf_counter() when the canvas was created, FrameBlock.time counts from it
 
     lookAtPt = None
     upVector = None
@@ -112,6 +128,28 @@ class Sketch(CanvasBase):
 
     viewMat = None
     perspMat = None
+    renderContext = None
+    # cull with a BVH over the drawable Components instead of walking the scene graph, toggled with "b"
+    bvh = None
+    bvhOn = False
+    occlusionCuller = None
+    # draw the Components sharing a mesh and a material with one instanced call, toggled with "i"
+    instanceBatcher = None
+    instancingOn = True
+    # sort the draws of a frame by GL state before submitting them, toggled with "q"
+    renderQueue = None
+    renderQueueOn = True
+    # draw every routing with its own specialized program, toggled with "v". Only the render queue uses them
+    shaderVariants = None
+    shaderVariantsOn = True
+    # read the shaders from the GLSL templates in ShaderWatcher.SHADER_DIR and relink the programs when they
+    # are saved, toggled with "h"
+    shaderWatcher = None
+    shaderHotReloadOn = False
+    # shade every fragment with the lights binned to its cluster only, toggled with "c"
+    clusteredLightingOn = True
+    # the last object picked with the left mouse button, Picking.PickResult or None
+    pickResult = None
 
     pauseScene = False
 
@@ -147,6 +185,12 @@ class Sketch(CanvasBase):
         self.resetView()
 
         self.glutility = GLUtility.GLUtility()
+        self.renderContext = RenderContext()
+        self.bvh = BVH()
+        self.instanceBatcher = InstanceBatcher()
+        self.renderQueue = RenderQueue()
+        self.shaderWatcher = ShaderWatcher()
+        self.startTime = time.perf_counter()
 
     def resetView(self):
         self.lookAtPt = [0, 0, 0]
@@ -157,6 +201,7 @@ class Sketch(CanvasBase):
 
     def switchScene(self, scene):
         self.scene = scene
+        self.occlusionCuller.reset()
         self.topLevelComponent.clear()
         self.topLevelComponent.addChild(self.scene)
         self.topLevelComponent.initialize()
@@ -166,8 +211,35 @@ class Sketch(CanvasBase):
         self.switchScene(self.sceneList[self.sceneIndex](self.shaderProg))
 
     def InitGL(self):
-        self.shaderProg = GLProgram()
-        self.shaderProg.compile()
+        # InitGL also runs after every resize with a brand new GL context, buffers from the old one are gone
+        geometryCache.invalidate()
+        glState.invalidate()
+        lightBuffer.invalidate()
+        lightClusters.invalidate()
+        frameConstants.invalidate()
+        programBinaryCache.invalidate()
+
+        try:
+            self.shaderProg = GLProgram()
+            self.shaderProg.compile()
+        except Exception as e:
+            if GLProgram.templateDir is None:
+                raise
+            # a broken template must not take the canvas down, the next hot reload picks up the fixed one
+            print(f"shader templates failed, drawing with the built-in shaders: {e}")
+            templateDir, GLProgram.templateDir = GLProgram.templateDir, None
+            try:
+                self.shaderProg = GLProgram()
+                self.shaderProg.compile()
+            finally:
+                GLProgram.templateDir = templateDir
+        if self.debug > 0:
+            source = "binary cache" if self.shaderProg.fromBinaryCache else "source"
+            print(f"Shader program loaded from {source} in {self.shaderProg.compileSeconds * 1000:.1f} ms")
+        # the variants of the previous context are gone with it
+        self.shaderVariants = ShaderVariantCache(self.shaderProg)
+        # the queries of the previous culler belong to the old context
+        self.occlusionCuller = OcclusionCuller(self.shaderProg)
 
 
         # instantiate models, then can only be done with a compiled GL program
@@ -185,11 +257,9 @@ class Sketch(CanvasBase):
 
         # set basic viewing matrix
         self.perspMat = self.glutility.perspective(45, self.size.width, self.size.height, 0.01, 100)
-        self.shaderProg.setMat4("projectionMat", self.perspMat)
-        self.shaderProg.setMat4("viewMat", self.glutility.view(self.getCameraPos(), self.lookAtPt, self.upVector))
+        # the projection, view and camera position go to frameConstants in every OnDraw
         self.shaderProg.setMat4("modelMat", np.identity(4))
-
-        self.shaderProg.setVec3("viewPosition", np.array(self.getCameraPos()))
+        self.shaderProg.setMat3("normalMat", np.identity(3))
 
         self.updateLight(False)
 
@@ -230,20 +300,60 @@ class Sketch(CanvasBase):
     def OnDraw(self):
         gl.glClearColor(*self.backgroundColor, 1.0)
         gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        if self.shaderHotReloadOn and self.shaderWatcher.changed.is_set():
+            # the variants which failed with the previous templates get another chance, and the ones still
+            # compiling from them start over, reload only relinks the programs which are ready
+            self.shaderVariants.retryFailed()
+            self.shaderVariants.restartPending()
+            self.shaderWatcher.reload([self.shaderProg, *self.shaderVariants.programs.values()])
 
         self.viewMat = self.glutility.view(self.getCameraPos(), self.lookAtPt, self.upVector)
-        self.shaderProg.setMat4("viewMat", self.viewMat)
-        self.shaderProg.setVec3("viewPosition", np.array(self.getCameraPos()))
+        frameConstants.update(self.viewMat, self.perspMat, self.getCameraPos(), time.perf_counter() - self.startTime)
 
         if not self.pauseScene and isinstance(self.scene, Animation):
             self.scene.animationUpdate()
         self.topLevelComponent.update(np.identity(4))
-        self.topLevelComponent.draw(self.shaderProg)
+        self.renderContext.beginFrame(self.viewMat, self.perspMat, self.size)
+        lightClusters.update(lightBuffer, self.viewMat, self.perspMat, (self.size[0], self.size[1]),
+                             self.clusteredLightingOn)
+        # glState.stats() then covers this frame only
+        glState.resetStats()
+        if self.bvhOn:
+            self.bvh.update(self.topLevelComponent)
+            visible = self.bvh.queryFrustum(self.renderContext)
+            self.renderContext.count("culled", len(self.bvh.components) - len(visible))
+        else:
+            # walk the scene graph, a subtree outside the view frustum is culled with a single test
+            visible = self.topLevelComponent.collectVisible(self.renderContext)
+
+        candidates, hidden = visible, []
+        if self.scene.occlusionCullingOn:
+            # the Components hidden in the last frame wait for their occlusion query, the others occlude them
+            visible, hidden = self.occlusionCuller.split(candidates, self.renderContext)
+
+        if self.renderQueueOn:
+            self.renderQueue.batcher = self.instanceBatcher if self.instancingOn else None
+            self.renderQueue.variants = self.shaderVariants if self.shaderVariantsOn else None
+            if self.shaderVariantsOn:
+                # variants linked since the last frame replace the uber shader from now on
+                self.shaderVariants.poll()
+            self.renderQueue.collect(visible, self.shaderProg, self.renderContext)
+            self.renderQueue.submit(self.renderContext)
+        elif self.instancingOn:
+            self.instanceBatcher.draw(visible, self.shaderProg, self.renderContext)
+        else:
+            for c in visible:
+                c.drawSelf(self.shaderProg, self.renderContext)
+
+        if self.scene.occlusionCullingOn:
+            self.occlusionCuller.finish(candidates, hidden, self.shaderProg, self.renderContext)
 
         # draw the axes on the canvas bottom right corner
         resultPt = self.unprojectCanvas(0.9 * self.size[0], 0.1 * self.size[1], 0.3)
         self.basisAxes.setCurrentPosition(resultPt)
         self.basisAxes.draw(self.shaderProg)
+        # the last mesh drawn leaves its VAO bound, nothing outside the frame may edit it by accident
+        glState.bindVertexArray(0)
 
         self.SwapBuffers()
 
@@ -295,9 +405,22 @@ class Sketch(CanvasBase):
         result = Point([(1 - u) * r1 + u * r2 for r1, r2 in zip(result1, result2)])
         return result
 
+    def pick(self, x, y):
+        """
+        Find the object under a canvas point, on the CPU only
+
+        :return: the Picking.PickResult with the Component and the world space hit point, or None
+        """
+        if self.viewMat is None or self.perspMat is None:
+            return None
+        origin, direction = Picking.pickRay(self.viewMat, self.perspMat, self.size, x, y)
+        self.bvh.update(self.topLevelComponent)
+        return Picking.pick(self.bvh, origin, direction)
+
     def Interrupt_MouseL(self, x, y):
         """
-        When mouse click detected, store current position in last_mouse_leftPosition
+        When mouse click detected, store current position in last_mouse_leftPosition,
+        and pick the object under it
 
         :param x: Mouse click's x coordinate
         :type x: int
@@ -307,6 +430,7 @@ class Sketch(CanvasBase):
         """
         self.last_mouse_leftPosition[0] = x
         self.last_mouse_leftPosition[1] = y
+        self.pickResult = self.pick(x, y)
 
     def Interrupt_MouseMiddleDragging(self, x, y):
         """
@@ -378,9 +502,9 @@ class Sketch(CanvasBase):
         Update light properties
         :return: None
         """
-        self.shaderProg.setBool('specularOn', self.specularOn)
-        self.shaderProg.setBool('diffuseOn', self.diffuseOn)
-        self.shaderProg.setBool('ambientOn', self.ambientOn)
+        self.shaderVariants.setBool('specularOn', self.specularOn)
+        self.shaderVariants.setBool('diffuseOn', self.diffuseOn)
+        self.shaderVariants.setBool('ambientOn', self.ambientOn)
         if update:
             self.update()
 
@@ -414,6 +538,31 @@ class Sketch(CanvasBase):
         elif chr(keycode) in "pP":
             # toggle pause of the animation
             self.pauseScene = not self.pauseScene
+        elif chr(keycode) in "bB":
+            # toggle the BVH culling
+            self.bvhOn = not self.bvhOn
+        elif chr(keycode) in "iI":
+            # toggle the instanced rendering
+            self.instancingOn = not self.instancingOn
+        elif chr(keycode) in "qQ":
+            # toggle the sorted render queue
+            self.renderQueueOn = not self.renderQueueOn
+        elif chr(keycode) in "vV":
+            # toggle the shader variants
+            self.shaderVariantsOn = not self.shaderVariantsOn
+        elif chr(keycode) in "cC":
+            # toggle the clustered lighting
+            self.clusteredLightingOn = not self.clusteredLightingOn
+        elif chr(keycode) in "hH":
+            # toggle the shader hot reload, the templates are written on first use
+            self.shaderHotReloadOn = not self.shaderHotReloadOn
+            if self.shaderHotReloadOn:
+                self.shaderWatcher.start(self.shaderProg)
+            else:
+                self.shaderWatcher.stop()
+        elif chr(keycode) in "oO":
+            # toggle the occlusion culling of the current scene
+            self.scene.occlusionCullingOn = not self.scene.occlusionCullingOn
         elif chr(keycode) in "sS":
             # toggle the specular lighting
             self.specularOn = not self.specularOn
@@ -0,0 +1,93 @@
+"""
+A buffer object read in the shaders through a buffer texture (samplerBuffer / usamplerBuffer) with texelFetch.
+
+Unlike a uniform buffer it has no small size limit, so it holds arrays whose length changes at runtime. The CPU
+copy is a numpy array which grows on demand; a range of items is uploaded with one call, and the whole buffer
+is reallocated when the array grew. The texture sits on a texture unit reserved for it, see GLBuffer.Texture.
+"""
+import numpy as np
+
+try:
+    import OpenGL
+
+    try:
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+    except ImportError:
+        from ctypes import util
+
+        orig_util_find_library = util.find_library
+
+
+        def new_util_find_library(name):
+            res = orig_util_find_library(name)
+            if res:
+                return res
+            return '/System/Library/Frameworks/' + name + '.framework/' + name
+
+
+        util.find_library = new_util_find_library
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+except ImportError:
+    raise ImportError("Required dependency PyOpenGL not present")
+
+from GLState import glState
+
+
+class TextureBuffer:
+    data: np.ndarray = None  # the CPU copy, its items are uploaded as raw bytes
+    internalFormat = None  # how the shader reads the bytes, e.g. GL_RGBA32F or GL_R32UI
+    unit = 0  # the texture unit of the buffer texture
+    buffer = None
+    texture = None
+    allocated = 0  # items allocated on the GPU
+    uploads = 0
+
+    def __init__(self, data: np.ndarray, internalFormat: int, unit: int):
+        self.data = data
+        self.internalFormat = internalFormat
+        self.unit = unit
+
+    def resize(self, size: int):
+        """
+        Make room for at least size items, keeping the current ones. The capacity doubles to keep reallocations rare
+        """
+        if size <= len(self.data):
+            return
+        grown = np.zeros((max(size, 2 * len(self.data)),) + self.data.shape[1:], dtype=self.data.dtype)
+        grown[:len(self.data)] = self.data
+        self.data = grown
+
+    def upload(self, start: int = 0, end: int = None):
+        """
+        Upload the items [start, end). The buffer and its texture are created on first use, and the whole array
+        is uploaded again whenever it grew
+        """
+        end = len(self.data) if end is None else end
+        if self.buffer is None:
+            self.buffer = gl.glGenBuffers(1)
+            self.texture = gl.glGenTextures(1)
+        gl.glBindBuffer(gl.GL_TEXTURE_BUFFER, self.buffer)
+        if self.allocated != len(self.data):
+            gl.glBufferData(gl.GL_TEXTURE_BUFFER, self.data.nbytes, self.data.view(np.uint8), gl.GL_DYNAMIC_DRAW)
+            if not self.allocated:
+                self.bind()
+                gl.glTexBuffer(gl.GL_TEXTURE_BUFFER, self.internalFormat, self.buffer)
+            self.allocated = len(self.data)
+        elif end > start:
+            itemSize = self.data.nbytes // len(self.data)
+            gl.glBufferSubData(gl.GL_TEXTURE_BUFFER, start * itemSize, (end - start) * itemSize,
+                               self.data[start:end].view(np.uint8))
+        self.uploads += 1
+
+    def bind(self):
+        glState.bindTexture(self.unit, self.texture, gl.GL_TEXTURE_BUFFER)
+
+    def invalidate(self):
+        """
+        Forget the buffer without any GL call, the data is uploaded again to the next context
+        """
+        self.buffer = None
+        self.texture = None
+        self.allocated = 0
@@ -0,0 +1,65 @@
+"""
+A uniform buffer object backed by a numpy structured array, whose dtype spells out the std140 layout of the
+uniform block. Items are written in place on the CPU, then a range of them is uploaded with one call.
+"""
+import numpy as np
+
+try:
+    import OpenGL
+
+    try:
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+    except ImportError:
+        from ctypes import util
+
+        orig_util_find_library = util.find_library
+
+
+        def new_util_find_library(name):
+            res = orig_util_find_library(name)
+            if res:
+                return res
+            return '/System/Library/Frameworks/' + name + '.framework/' + name
+
+
+        util.find_library = new_util_find_library
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+except ImportError:
+    raise ImportError("Required dependency PyOpenGL not present")
+
+
+class UniformBuffer:
+    data: np.ndarray = None  # the CPU copy, its items are uploaded as raw bytes
+    ubo = None
+    binding = 0  # the binding point every program reads the block from
+    uploads = 0
+
+    def __init__(self, data: np.ndarray, binding: int):
+        self.data = data
+        self.binding = binding
+
+    def upload(self, start: int = 0, end: int = None):
+        """
+        Upload the items [start, end). The buffer is created and bound to its binding point on first use,
+        with the whole array
+        """
+        end = len(self.data) if end is None else end
+        if self.ubo is None:
+            self.ubo = gl.glGenBuffers(1)
+            gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.ubo)
+            gl.glBufferData(gl.GL_UNIFORM_BUFFER, self.data.nbytes, self.data.view(np.uint8), gl.GL_DYNAMIC_DRAW)
+            gl.glBindBufferBase(gl.GL_UNIFORM_BUFFER, self.binding, self.ubo)
+        else:
+            itemSize = self.data.dtype.itemsize
+            gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.ubo)
+            gl.glBufferSubData(gl.GL_UNIFORM_BUFFER, start * itemSize, (end - start) * itemSize,
+                               self.data[start:end].view(np.uint8))
+        self.uploads += 1
+
+    def invalidate(self):
+        """
+        Forget the buffer without any GL call, the data is uploaded again to the next context
+        """
+        self.ubo = None
@@ -0,0 +1,167 @@
+"""
+Describe how the vertices of a mesh are stored in its VBO.
+
+The Displayable objects always generate float vertices with the 11 columns layout of ParametricMesh,
+a VertexFormat converts them to the bytes uploaded to the GPU and sets up the matching attribute pointers.
+The shader inputs stay the same for every format, the packed ones are converted back to float by the
+vertex fetch.
+
+    Format   | position        | normal                 | color          | texture      | bytes
+    STANDARD | 3 x float32     | 3 x float32            | 3 x float32    | 2 x float32  | 44
+    PACKED   | 4 x half float  | INT_2_10_10_10_REV     | 4 x uint8      | 2 x half     | 20
+"""
+import ctypes
+
+import numpy as np
+
+try:
+    import OpenGL
+
+    try:
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+    except ImportError:
+        from ctypes import util
+
+        orig_util_find_library = util.find_library
+
+
+        def new_util_find_library(name):
+            res = orig_util_find_library(name)
+            if res:
+                return res
+            return '/System/Library/Frameworks/' + name + '.framework/' + name
+
+
+        util.find_library = new_util_find_library
+        import OpenGL.GL as gl
+        import OpenGL.GLU as glu
+except ImportError:
+    raise ImportError("Required dependency PyOpenGL not present")
+
+
+class VertexAttribute:
+    """
+    One vertex attribute inside a VertexFormat
+    """
+    name = None  # the GLProgram attribs key, e.g. "vertexPos"
+    field = None  # the field of the packed numpy dtype
+    size = 0  # number of components handed to glVertexAttribPointer
+    glType = None
+    normalized = False
+    pack = None  # function turning (N, 11) float vertices into the field values
+
+    def __init__(self, name: str, field: str, size: int, glType, pack, normalized: bool = False):
+        self.name = name
+        self.field = field
+        self.size = size
+        self.glType = glType
+        self.pack = pack
+        self.normalized = normalized
+
+
+class VertexFormat:
+    """
+    A vertex layout: a numpy structured dtype for the CPU side and the attributes which read it on the GPU
+    """
+    name = None
+    dtype = None
+    attributes = None
+
+    def __init__(self, name: str, dtype: np.dtype, attributes):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.attributes = list(attributes)
+
+    @property
+    def stride(self) -> int:
+        return self.dtype.itemsize
+
+    def pack(self, vertices: np.ndarray) -> np.ndarray:
+        """
+        Convert float vertices in the 11 columns layout to this format
+
+        :param vertices: array with shape (N, 11)
+        :return: a structured array with shape (N,) and dtype self.dtype
+        """
+        packed = np.zeros(len(vertices), dtype=self.dtype)
+        for attrib in self.attributes:
+            packed[attrib.field] = attrib.pack(vertices)
+        return packed
+
+    def setAttribPointers(self, vbo, shaderProg):
+        """
+        Bind vbo and point every attribute of shaderProg to its field. The VAO must be bound.
+        """
+        vbo.bind()
+        for attrib in self.attributes:
+            attribLoc = shaderProg.getAttribLocation(attrib.name)
+            # If the attribLoc is not available, skip it
+            if attribLoc < 0:
+                continue
+            offset = ctypes.c_void_p(self.dtype.fields[attrib.field][1])
+            gl.glVertexAttribPointer(attribLoc, attrib.size, attrib.glType,
+                                     gl.GL_TRUE if attrib.normalized else gl.GL_FALSE, self.stride, offset)
+            gl.glEnableVertexAttribArray(attribLoc)
+
+
+def packNormals(normals: np.ndarray) -> np.ndarray:
+    """
+    Pack normals to signed normalized GL_INT_2_10_10_10_REV: x in the lowest 10 bits, then y and z,
+    the 2 bits of w are left to 0. The normals are normalized first, e.g. an ellipsoid emits non-unit ones,
+    a zero normal stays zero
+    """
+    normals = np.asarray(normals, dtype=np.float64)
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = normals / np.where(length > 0, length, 1.0)
+    q = np.rint(np.clip(normals, -1.0, 1.0) * 511).astype(np.int32) & 0x3FF
+    return (q[:, 0] | (q[:, 1] << 10) | (q[:, 2] << 20)).astype(np.uint32)
+
+
+def unpackNormals(packed: np.ndarray) -> np.ndarray:
+    """
+    Reverse of packNormals, the same conversion as the GPU vertex fetch
+    """
+    packed = packed.astype(np.uint32)
+    q = np.stack([(packed >> shift) & 0x3FF for shift in (0, 10, 20)], axis=-1).astype(np.int32)
+    q = np.where(q >= 512, q - 1024, q)
+    return np.maximum(q / 511.0, -1.0)
+
+
+def _padded(columns: np.ndarray, width: int, fill: float) -> np.ndarray:
+    result = np.full((len(columns), width), fill, dtype=np.float64)
+    result[:, :columns.shape[1]] = columns
+    return result
+
+
+# 11 float32, the layout generated by the Displayable objects
+STANDARD = VertexFormat("standard", [
+    ("position", np.float32, 3),
+    ("normal", np.float32, 3),
+    ("color", np.float32, 3),
+    ("texture", np.float32, 2),
+], [
+    VertexAttribute("vertexPos", "position", 3, gl.GL_FLOAT, lambda v: v[:, 0:3]),
+    VertexAttribute("vertexNormal", "normal", 3, gl.GL_FLOAT, lambda v: v[:, 3:6]),
+    VertexAttribute("vertexColor", "color", 3, gl.GL_FLOAT, lambda v: v[:, 6:9]),
+    VertexAttribute("vertexTexture", "texture", 2, gl.GL_FLOAT, lambda v: v[:, 9:11]),
+])
+
+# 20 bytes per vertex. Half floats keep about 3 significant digits, enough for positions within a few units
+# of the model origin and for texture coordinates which don't repeat more than a few hundred times.
+# Positions take 4 halves so the normal starts on 4 bytes, GL_INT_2_10_10_10_REV requires 4 components
+PACKED = VertexFormat("packed", [
+    ("position", np.float16, 4),
+    ("normal", np.uint32),
+    ("color", np.uint8, 4),
+    ("texture", np.float16, 2),
+], [
+    VertexAttribute("vertexPos", "position", 3, gl.GL_HALF_FLOAT, lambda v: _padded(v[:, 0:3], 4, 1.0)),
+    VertexAttribute("vertexNormal", "normal", 4, gl.GL_INT_2_10_10_10_REV, lambda v: packNormals(v[:, 3:6]),
+                    normalized=True),
+    VertexAttribute("vertexColor", "color", 4, gl.GL_UNSIGNED_BYTE,
+                    lambda v: np.rint(_padded(np.clip(v[:, 6:9], 0.0, 1.0), 4, 1.0) * 255), normalized=True),
+    VertexAttribute("vertexTexture", "texture", 2, gl.GL_HALF_FLOAT, lambda v: v[:, 9:11]),
+])
+
+formats = {f.name: f for f in (STANDARD, PACKED)}
@@ -0,0 +1,50 @@
+"""
+An offscreen OpenGL 3.3 core context through EGL, so tests can run against a real driver without a window.
+Import this module before anything imports OpenGL, it selects the EGL platform of PyOpenGL.
+"""
+import ctypes
+import os
+import sys
+
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+# Mesa can create a context without any display server
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+context = None
+
+
+def createContext(width: int = 800, height: int = 600):
+    """
+    Make a context current, return None if the platform has no usable EGL
+    """
+    global context
+    if context is not None:
+        return context
+    try:
+        from OpenGL import EGL
+
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(display, ctypes.pointer(major), ctypes.pointer(minor)):
+            return None
+        configAttribs = (EGL.EGLint * 7)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                         EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                                         EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_NONE)
+        config, count = EGL.EGLConfig(), EGL.EGLint()
+        if not EGL.eglChooseConfig(display, configAttribs, ctypes.pointer(config), 1, ctypes.pointer(count)) \
+                or not count.value:
+            return None
+        surface = EGL.eglCreatePbufferSurface(display, config, (EGL.EGLint * 5)(
+            EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE))
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        contextAttribs = (EGL.EGLint * 7)(EGL.EGL_CONTEXT_MAJOR_VERSION, 3, EGL.EGL_CONTEXT_MINOR_VERSION, 3,
+                                          EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK,
+                                          EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT, EGL.EGL_NONE)
+        eglContext = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, contextAttribs)
+        if not eglContext or not EGL.eglMakeCurrent(display, surface, surface, eglContext):
+            return None
+    except Exception:
+        return None
+    context = (display, surface, eglContext)
+    return context
@@ -0,0 +1,77 @@
+import unittest
+
+from HeadlessContext import createContext
+
+import numpy as np
+
+
+def setUpModule():
+    if createContext() is None:
+        raise unittest.SkipTest("no OpenGL context available through EGL")
+
+
+class BVHUpdateTest(unittest.TestCase):
+    def setUp(self):
+        from BVH import BVH
+        from Component import Component
+        from DisplayableCube import DisplayableCube
+        from GLProgram import GLProgram
+        from Point import Point
+
+        self.prog = GLProgram()
+        self.prog.compile()
+        self.top = Component(Point((0, 0, 0)))
+        self.cubes = [Component(Point((i * 7 % 10, 0, 0)), DisplayableCube(self.prog, 0.5, 0.5, 0.5))
+                      for i in range(10)]
+        for c in self.cubes:
+            self.top.addChild(c)
+        self.top.initialize()
+        self.top.update(np.identity(4))
+        self.bvh = BVH()
+        self.bvh.update(self.top)
+        self.walks = 0
+        collect = self.bvh.collect
+
+        def countingCollect(root):
+            self.walks += 1
+            return collect(root)
+
+        self.bvh.collect = countingCollect
+
+    def tearDown(self):
+        self.top.clear()
+
+    def test_unchangedSceneIsNotWalked(self):
+        self.top.update(np.identity(4))
+        self.bvh.update(self.top)
+        self.assertEqual(self.walks, 0)
+
+    def test_addedChildIsFound(self):
+        from Component import Component
+        from DisplayableCube import DisplayableCube
+        from Point import Point
+
+        cube = Component(Point((20, 0, 0)), DisplayableCube(self.prog, 0.5, 0.5, 0.5))
+        self.top.addChild(cube)
+        cube.initialize()
+        self.top.update(np.identity(4))
+        self.bvh.update(self.top)
+        self.assertEqual(self.walks, 1)
+        self.assertIn(cube, self.bvh.components)
+
+    def test_rebuildAfterRefitKeepsDrawingOrder(self):
+        from Point import Point
+
+        builds = self.bvh.builds
+        # scatter the cubes far apart, the refitted tree degrades and is rebuilt from its own Components
+        for i, c in enumerate(self.cubes):
+            c.setCurrentPosition(Point((i * 37 % 10 * 10.0, i * 100.0 * (i % 2), 0)))
+        self.top.update(np.identity(4))
+        self.bvh.update(self.top)
+        self.assertEqual(self.walks, 0)
+        self.assertGreater(self.bvh.builds, builds)
+        self.assertEqual(self.bvh._inDrawOrder(range(len(self.cubes))), self.cubes)
+
+
+if __name__ == "__main__":
+    unittest.main()
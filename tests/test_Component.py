@@ -0,0 +1,29 @@
+import unittest
+
+import HeadlessContext  # noqa: F401, puts the repository on the path
+
+import numpy as np
+
+
+class NormalMatrixTest(unittest.TestCase):
+    def setUp(self):
+        from Component import Component
+        from Point import Point
+
+        self.component = Component(Point((0, 0, 0)))
+
+    def test_zeroScaleKeepsPreviousNormalMatrix(self):
+        self.component.setCurrentScale([2, 2, 2])
+        self.component.update()
+        self.component.setCurrentScale([0, 0, 0])
+        self.component.update()
+        np.testing.assert_allclose(self.component.normalMat, np.identity(3) / 2)
+
+    def test_zeroScaleOnFirstUpdate(self):
+        self.component.setCurrentScale([0, 0, 0])
+        self.component.update()
+        self.assertTrue(np.all(np.isfinite(self.component.normalMat)))
+
+
+if __name__ == "__main__":
+    unittest.main()
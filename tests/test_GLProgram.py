@@ -0,0 +1,50 @@
+import unittest
+
+from HeadlessContext import createContext
+
+import OpenGL.GL as gl
+
+VERTEX_SOURCE = """
+#version 330 core
+in vec3 vertexPos;
+uniform vec2 offsets[3];
+void main() {
+    gl_Position = vec4(vertexPos.xy + offsets[0] + offsets[1] + offsets[2], vertexPos.z, 1.0);
+}
+"""
+
+FRAGMENT_SOURCE = """
+#version 330 core
+uniform float weights[4];
+uniform vec4 tint;
+out vec4 FragColor;
+void main() {
+    FragColor = tint * (weights[0] + weights[1] + weights[2] + weights[3]);
+}
+"""
+
+
+def setUpModule():
+    if createContext() is None:
+        raise unittest.SkipTest("no OpenGL context available through EGL")
+
+
+class LocationTableTest(unittest.TestCase):
+    def test_arrayElementsAreLookedUpByName(self):
+        from GLProgram import GLProgram
+
+        GLProgram.binaryCacheOn = False
+        try:
+            prog = GLProgram()
+            prog.compile(VERTEX_SOURCE, FRAGMENT_SOURCE)
+        finally:
+            GLProgram.binaryCacheOn = True
+        for base, size in (("offsets", 3), ("weights", 4)):
+            for k in range(size):
+                name = f"{base}[{k}]"
+                self.assertEqual(prog.uniformLocations[name], gl.glGetUniformLocation(prog.program, name))
+            self.assertEqual(prog.uniformLocations[base], prog.uniformLocations[f"{base}[0]"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from HeadlessContext import createContext
+
+import numpy as np
+import OpenGL.GL as gl
+
+
+def setUpModule():
+    if createContext() is None:
+        raise unittest.SkipTest("no OpenGL context available through EGL")
+
+
+class OcclusionCullerTest(unittest.TestCase):
+    def setUp(self):
+        from Component import Component
+        from DisplayableCube import DisplayableCube
+        from GLProgram import GLProgram
+        from GLUtility import GLUtility
+        from OcclusionCuller import OcclusionCuller
+        from Point import Point
+
+        self.prog = GLProgram()
+        self.prog.compile()
+        self.top = Component(Point((0, 0, 0)))
+        # a wall between the camera and a small cube
+        self.wall = Component(Point((0, 0, 2)), DisplayableCube(self.prog, 4, 4, 0.1))
+        self.cube = Component(Point((0, 0, -2)), DisplayableCube(self.prog, 0.5, 0.5, 0.5))
+        self.top.addChild(self.wall)
+        self.top.addChild(self.cube)
+        self.top.initialize()
+        self.top.update(np.identity(4))
+        self.culler = OcclusionCuller(self.prog)
+        utility = GLUtility()
+        self.viewMat = utility.view([0, 0, 6], [0, 0, 0], [0, 1, 0])
+        self.perspMat = utility.perspective(45, 800, 600, 0.01, 100)
+        gl.glEnable(gl.GL_DEPTH_TEST)
+
+    def frame(self, components):
+        from FrameConstants import frameConstants
+        from RenderContext import RenderContext
+
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        frameConstants.update(self.viewMat, self.perspMat, [0, 0, 6], 0.0)
+        context = RenderContext()
+        context.beginFrame(self.viewMat, self.perspMat, (800, 600))
+        visible, hidden = self.culler.split(components, context)
+        for c in visible:
+            c.drawSelf(self.prog, context)
+        self.culler.finish(components, hidden, self.prog, context)
+        gl.glFinish()
+        return visible, hidden, context
+
+    def test_hiddenCubeIsSkipped(self):
+        components = self.top.collectVisible(self.frame([])[2])
+        self.assertEqual(len(components), 2)
+        visible, hidden, _ = self.frame(components)
+        self.assertEqual(len(visible), 2)
+        # the cube's query of the first frame found it behind the wall
+        visible, hidden, context = self.frame(components)
+        self.assertEqual(hidden, [self.cube])
+        # its conditional draw is counted when that query comes back
+        visible, hidden, context = self.frame(components)
+        self.assertEqual(hidden, [self.cube])
+        self.assertEqual(context.stats.get("occluded", 0), 1)
+
+    def test_statesOfLeftComponentsAreDropped(self):
+        components = [self.wall, self.cube]
+        self.frame(components)
+        self.assertEqual(len(self.culler.states), 2)
+        self.frame([self.wall])
+        self.assertEqual(set(self.culler.states), {id(self.wall)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from HeadlessContext import createContext
+
+
+def setUpModule():
+    if createContext() is None:
+        raise unittest.SkipTest("no OpenGL context available through EGL")
+
+
+class ProgramBinaryCacheTest(unittest.TestCase):
+    def setUp(self):
+        from ProgramBinaryCache import programBinaryCache
+
+        if not programBinaryCache.checkSupport():
+            self.skipTest("the driver has no program binary format")
+        self.cache = programBinaryCache
+        self.directory = self.cache.directory
+        self.cache.directory = tempfile.mkdtemp()
+        self.hits, self.misses = self.cache.hits, self.cache.misses
+
+    def tearDown(self):
+        shutil.rmtree(self.cache.directory, ignore_errors=True)
+        self.cache.directory = self.directory
+
+    def compile(self):
+        from GLProgram import GLProgram
+
+        program = GLProgram()
+        program.compile()
+        return program
+
+    def binaries(self):
+        return [name for name in os.listdir(self.cache.directory) if name.endswith(".bin")]
+
+    def test_coldThenWarm(self):
+        cold = self.compile()
+        self.assertFalse(cold.fromBinaryCache)
+        self.assertEqual(self.cache.misses - self.misses, 1)
+        self.assertEqual(len(self.binaries()), 1)
+
+        warm = self.compile()
+        self.assertTrue(warm.fromBinaryCache)
+        self.assertTrue(warm.ready)
+        self.assertEqual(self.cache.hits - self.hits, 1)
+        self.assertEqual(warm.attribLocations, cold.attribLocations)
+        self.assertEqual(set(warm.uniformLocations), set(cold.uniformLocations))
+
+    def test_corruptFileFallsBackToSource(self):
+        from GLProgram import GLProgram
+
+        self.compile()
+        name, = self.binaries()
+        path = os.path.join(self.cache.directory, name)
+        with open(path, "r+b") as f:
+            content = f.read()
+            f.seek(0)
+            # keep the binary format, garble the rest
+            f.write(content[0:4] + bytes(b ^ 0x5A for b in content[4:]))
+
+        program = GLProgram()
+        key = self.cache.key(program.vertexShaderSource, program.fragmentShaderSource, program.attribBindings)
+        self.assertEqual(key + ".bin", name)
+        self.assertFalse(self.cache.load(program.program, key))
+        self.assertFalse(os.path.exists(path))
+
+        with open(path, "wb") as f:
+            f.write(content[0:4] + bytes(b ^ 0x5A for b in content[4:]))
+        program.compile()
+        self.assertFalse(program.fromBinaryCache)
+        self.assertTrue(program.ready)
+        # the source compile stored a good binary in place of the corrupt one
+        self.assertTrue(self.compile().fromBinaryCache)
+
+
+if __name__ == "__main__":
+    unittest.main()
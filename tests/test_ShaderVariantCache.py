@@ -0,0 +1,65 @@
+import unittest
+
+from HeadlessContext import createContext
+
+import numpy as np
+import OpenGL.GL as gl
+
+
+def setUpModule():
+    if createContext() is None:
+        raise unittest.SkipTest("no OpenGL context available through EGL")
+
+
+class ShaderVariantCacheTest(unittest.TestCase):
+    def setUp(self):
+        from GLProgram import GLProgram
+        from ShaderVariantCache import ShaderVariantCache
+
+        # compile every program from source, a cached binary would make the variants ready at once
+        GLProgram.binaryCacheOn = False
+        self.base = GLProgram()
+        self.base.compile()
+        self.variants = ShaderVariantCache(self.base)
+
+    def tearDown(self):
+        from GLProgram import GLProgram
+        GLProgram.binaryCacheOn = True
+
+    def pollUntilDone(self):
+        for _ in range(100):
+            self.variants.poll()
+            if not self.variants.pending:
+                return
+        self.fail("variants still pending")
+
+    def test_asyncVariantsLink(self):
+        for routing in ("lighting", "vertex", "normal"):
+            # the base program draws until the variant is linked
+            self.assertIs(self.variants.get(routing, False), self.base)
+        self.pollUntilDone()
+        self.assertEqual(self.variants.stats()["failed"], 0)
+        self.assertEqual(self.variants.stats()["variants"], 3)
+        variant = self.variants.get("vertex", False)
+        self.assertIsNot(variant, self.base)
+        self.assertTrue(variant.ready)
+
+    def test_sharedBoolsReachLateVariants(self):
+        self.variants.setBool("ambientOn", False)
+        self.variants.get("lighting", False)
+        self.pollUntilDone()
+        variant = self.variants.get("lighting", False)
+        self.assertIsNot(variant, self.base)
+        location = variant.getUniformLocation("ambientOn")
+        value = np.ones(1, dtype=np.int32)
+        gl.glGetUniformiv(variant.program, location, value)
+        self.assertEqual(value[0], 0)
+
+    def test_synchronousVariants(self):
+        from ShaderVariantCache import ShaderVariantCache
+        variants = ShaderVariantCache(self.base, asyncOn=False)
+        self.assertIsNot(variants.get("lighting_texture", True), self.base)
+
+
+if __name__ == "__main__":
+    unittest.main()
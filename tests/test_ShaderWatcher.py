@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+from HeadlessContext import createContext
+
+import numpy as np
+import OpenGL.GL as gl
+
+
+def setUpModule():
+    if createContext() is None:
+        raise unittest.SkipTest("no OpenGL context available through EGL")
+
+
+class ShaderWatcherTest(unittest.TestCase):
+    def setUp(self):
+        from GLProgram import GLProgram, FRAGMENT_TEMPLATE
+        from ShaderWatcher import ShaderWatcher
+
+        GLProgram.binaryCacheOn = False
+        self.base = GLProgram()
+        self.base.compile()
+        self.directory = tempfile.mkdtemp()
+        self.watcher = ShaderWatcher(self.directory)
+        # no polling thread, the tests tell the watcher when the templates changed
+        self.base.exportTemplates(self.directory)
+        GLProgram.templateDir = self.directory
+        self.fragmentPath = os.path.join(self.directory, FRAGMENT_TEMPLATE)
+        with open(self.fragmentPath) as f:
+            self.fragmentTemplate = f.read()
+
+    def tearDown(self):
+        from GLProgram import GLProgram
+        GLProgram.templateDir = None
+        GLProgram.binaryCacheOn = True
+
+    def writeFragment(self, template: str):
+        with open(self.fragmentPath, "w") as f:
+            f.write(template)
+        self.watcher.changed.set()
+
+    def test_templatesMatchBuiltInSources(self):
+        self.assertEqual(self.base.genSources(), (self.base.vertexShaderSource, self.base.fragmentShaderSource))
+        self.assertEqual(self.watcher.reload([self.base]), 0)
+
+    def test_brokenTemplateFallsBackToBase(self):
+        from ShaderVariantCache import ShaderVariantCache
+
+        self.writeFragment(self.fragmentTemplate.replace("void main()", "${oops}\nvoid main()"))
+        variants = ShaderVariantCache(self.base)
+        self.assertIs(variants.get("vertex", False), self.base)
+        self.assertEqual(variants.stats()["failed"], 1)
+
+        program = self.base.program
+        self.assertEqual(self.watcher.reload([self.base]), 0)
+        self.assertEqual(self.watcher.failures, 1)
+        self.assertEqual(self.base.program, program)
+
+        self.writeFragment(self.fragmentTemplate)
+        variants.retryFailed()
+        self.assertIs(variants.get("vertex", False), self.base)
+        self.assertEqual(variants.stats()["failed"], 0)
+
+    def test_pendingVariantRestartsFromNewTemplate(self):
+        from ShaderVariantCache import ShaderVariantCache
+
+        variants = ShaderVariantCache(self.base)
+        self.assertIs(variants.get("vertex", False), self.base)
+        self.assertEqual(len(variants.pending), 1)
+
+        self.writeFragment(self.fragmentTemplate.replace("FragColor = outputResult;",
+                                                         "FragColor = outputResult * 0.5;"))
+        variants.restartPending()
+        self.assertIs(variants.get("vertex", False), self.base)
+        program, = variants.pending.values()
+        self.assertIn("outputResult * 0.5", program.fragmentShaderSource)
+        while variants.pending:
+            variants.poll()
+        self.assertEqual(variants.stats()["variants"], 1)
+
+    def test_reloadKeepsUniforms(self):
+        self.base.setBool("ambientOn", True)
+        self.base.setFloat("highlight", 7.5)
+        program = self.base.program
+        self.writeFragment(self.fragmentTemplate.replace("FragColor = outputResult;",
+                                                         "FragColor = outputResult * 0.5;"))
+        self.assertEqual(self.watcher.reload([self.base]), 1)
+        self.assertNotEqual(self.base.program, program)
+        value = np.zeros(1, dtype=np.float32)
+        gl.glGetUniformfv(self.base.program, self.base.getUniformLocation("highlight"), value)
+        self.assertEqual(value[0], 7.5)
+        flag = np.zeros(1, dtype=np.int32)
+        gl.glGetUniformiv(self.base.program, self.base.getUniformLocation("ambientOn"), flag)
+        self.assertEqual(flag[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
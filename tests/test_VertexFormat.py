@@ -0,0 +1,26 @@
+import unittest
+
+import HeadlessContext  # noqa: F401, puts the repository on the path
+
+import numpy as np
+
+
+class PackNormalsTest(unittest.TestCase):
+    def test_nonUnitNormalsKeepTheirDirection(self):
+        from VertexFormat import packNormals, unpackNormals
+
+        # the normals of an ellipsoid with radii (1, 0.4, 1), see DisplayableEllipsoid
+        normals = np.array([[0.3, 0.5 / 0.4, 0.2], [0.0, 2.5, 0.0], [0.1, 0.2, 0.3]])
+        unpacked = unpackNormals(packNormals(normals))
+        expected = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+        cosines = np.sum(unpacked * expected, axis=1) / np.linalg.norm(unpacked, axis=1)
+        self.assertTrue(np.all(np.degrees(np.arccos(np.minimum(cosines, 1.0))) < 0.5))
+
+    def test_zeroNormalStaysZero(self):
+        from VertexFormat import packNormals, unpackNormals
+
+        np.testing.assert_array_equal(unpackNormals(packNormals(np.zeros((1, 3)))), np.zeros((1, 3)))
+
+
+if __name__ == "__main__":
+    unittest.main()